@@ -0,0 +1,184 @@
+"""
+app_logging.py
+Журналирование системы ресторана: очередь, фоновая запись, JSON
+
+Модули пишут в журналы "restaurant.*" через logging как обычно. После
+setup_logging() запись уходит в очередь (QueueHandler), а в терминал или
+файл ее выводит фоновый поток (QueueListener): вызывающий поток на
+выводе не блокируется.
+
+Настройка переменными окружения:
+    LOG_LEVEL  - DEBUG, INFO, WARNING, ERROR (по умолчанию INFO)
+    LOG_FORMAT - text или json (по умолчанию text)
+    LOG_FILE   - файл журнала; без него - stderr
+
+Поля контекста (номер заказа, метод хранилища) добавляются к записям
+через log_context() или параметр extra и выводятся отдельными полями.
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterator
+
+ROOT_LOGGER = "restaurant"
+
+# Поля контекста текущего потока или задачи asyncio
+_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("log_context", default={})
+
+# Атрибуты LogRecord, которые не являются полями контекста
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "taskName"
+}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Журнал модуля: restaurant.<name>"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+@contextmanager
+def log_context(**fields: Any) -> Iterator[None]:
+    """Добавляет поля ко всем записям внутри блока (вложенные блоки дополняют внешние)"""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def _fields(record: logging.LogRecord) -> Dict[str, Any]:
+    """Поля контекста записи: из log_context() и из extra"""
+    return {key: value for key, value in vars(record).items()
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_")}
+
+
+class ContextFilter(logging.Filter):
+    """Переносит поля log_context() в запись в потоке, который ее создал"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - один объект JSON в строке"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        entry.update(_fields(record))
+        # После очереди трассировка уже текстом в exc_text (RecordQueueHandler)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Текст исключений для RecordQueueHandler
+_exception_formatter = logging.Formatter()
+
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, сохраняющий трассировку отдельно от сообщения
+
+    Стандартный prepare() дописывает трассировку в текст сообщения и
+    обнуляет exc_info, и форматтер в потоке записи уже не может вывести ее
+    отдельным полем. Здесь в очередь уходит копия записи с подставленными
+    аргументами, а трассировка - текстом в exc_text: объект исключения с
+    кадрами стека в другой поток не передается.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """Строка для чтения глазами; поля контекста - в квадратных скобках"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = _fields(record)
+        if fields:
+            context = " ".join(f"{key}={value}" for key, value in fields.items())
+            first_line, newline, rest = text.partition("\n")
+            text = f"{first_line} [{context}]{newline}{rest}"
+        return text
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None,
+                  log_file: Optional[str] = None, default_level: str = "INFO") -> None:
+    """Направляет журналы restaurant.* через очередь в фоновый поток записи
+
+    Параметры по умолчанию берутся из LOG_LEVEL, LOG_FORMAT и LOG_FILE;
+    default_level - уровень, если не задан ни параметр, ни LOG_LEVEL.
+    Повторный вызов перенастраивает журналирование.
+    """
+    global _listener
+
+    level = (level or os.getenv("LOG_LEVEL") or default_level).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "text")).lower()
+    log_file = log_file or os.getenv("LOG_FILE")
+
+    output = logging.FileHandler(log_file, encoding="utf-8") if log_file \
+        else logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = RecordQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+
+    shutdown_logging()
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers = [handler]
+    root.setLevel(level)
+    # Записи не дублируются корневым журналом Python
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Дописывает очередь и останавливает поток записи"""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,509 @@
+"""
+async_database.py
+Асинхронный доступ к PostgreSQL базе данных ресторана на asyncpg
+
+Публичные методы повторяют PostgreSQLDatabase, но являются корутинами,
+поэтому тысячи одновременных запросов обслуживаются одним циклом событий:
+
+    db = await AsyncPostgreSQLDatabase.create()
+    order = await db.get_order_by_number("ORD-20240101-ABC123")
+    await db.close()
+
+transaction() и кэша меню здесь нет: каждый вызов выполняется на
+соединении из пула и фиксируется сам.
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple, Union
+
+import asyncpg
+import psycopg2
+
+import migrations
+from app_logging import get_logger
+from database import _connect_kwargs_from_env
+from storage import (
+    ORDER_STATUSES,
+    OrderNumberGenerator,
+    _decode_page_cursor,
+    _encode_page_cursor,
+    _menu_item_from_row,
+    _order_details_from_row,
+)
+
+logger = get_logger("async_database")
+
+MENU_ITEM_COLUMNS = """
+    m.id, m.name, m.description, m.price, m.category_id,
+    m.is_available, m.unavailability_reason, m.calories, m.cooking_time_minutes,
+    c.name as category_name
+"""
+
+
+def _as_timestamp(value: Union[str, datetime]) -> datetime:
+    """asyncpg не приводит строки к timestamp сам, поэтому разбираем дату здесь"""
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    """Настраивает новое соединение пула: json и jsonb приходят как объекты Python"""
+    for type_name in ("json", "jsonb"):
+        await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads,
+                                  schema="pg_catalog")
+
+
+class AsyncPostgreSQLDatabase:
+    """Асинхронный класс для работы с PostgreSQL"""
+
+    def __init__(self):
+        self.pool: Optional[asyncpg.Pool] = None
+        self._order_numbers = OrderNumberGenerator()
+        # Блоки номеров резервирует одна задача за раз
+        self._reserve_lock = asyncio.Lock()
+
+    @classmethod
+    async def create(cls) -> "AsyncPostgreSQLDatabase":
+        """Создает пул соединений и приводит схему к последней версии"""
+        db = cls()
+        await db._migrate()
+        await db._connect()
+        return db
+
+    async def _connect(self) -> None:
+        """Создает асинхронный пул соединений с PostgreSQL"""
+        settings = _connect_kwargs_from_env()
+        try:
+            self.pool = await asyncpg.create_pool(
+                database=settings['dbname'],
+                user=settings['user'],
+                password=settings['password'],
+                host=settings['host'],
+                port=int(settings['port']),
+                min_size=int(os.getenv("DB_POOL_MIN", "2")),
+                max_size=int(os.getenv("DB_POOL_MAX", "10")),
+                init=_init_connection
+            )
+            logger.info("Асинхронное подключение к PostgreSQL установлено (пул %s-%s)",
+                        self.pool.get_min_size(), self.pool.get_max_size())
+        except Exception as e:
+            logger.error("Ошибка подключения к PostgreSQL: %s", e)
+            raise
+
+    async def _migrate(self) -> None:
+        """Применяет миграции общим синхронным кодом в отдельном потоке"""
+        def migrate() -> List[int]:
+            conn = psycopg2.connect(**_connect_kwargs_from_env())
+            try:
+                return migrations.migrate(conn)
+            finally:
+                conn.close()
+
+        try:
+            applied = await asyncio.get_running_loop().run_in_executor(None, migrate)
+            if applied:
+                logger.info("Применены миграции схемы: %s", ', '.join(map(str, applied)))
+        except Exception as e:
+            logger.error("Ошибка при миграции схемы: %s", e)
+            raise
+
+    async def get_all_categories(self) -> List[Any]:
+        """Получает все категории"""
+        from models import Category
+
+        try:
+            rows = await self.pool.fetch("SELECT id, name, description FROM categories ORDER BY name")
+            return [Category(id=row[0], name=row[1], description=row[2]) for row in rows]
+        except Exception as e:
+            logger.error("Ошибка при получении категорий: %s", e)
+            return []
+
+    async def get_menu_items(self, category_id: Optional[int] = None,
+                             available_only: bool = False) -> List[Any]:
+        """Получает блюда из меню (по умолчанию ВСЕ блюда)"""
+        conditions = []
+        params: List[Any] = []
+
+        if available_only:
+            conditions.append("m.is_available = TRUE")
+
+        if category_id:
+            params.append(category_id)
+            conditions.append(f"m.category_id = ${len(params)}")
+
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+        try:
+            rows = await self.pool.fetch(f"""
+                SELECT {MENU_ITEM_COLUMNS}
+                FROM menu_items m
+                JOIN categories c ON m.category_id = c.id
+                {where}
+                ORDER BY c.name, m.name
+            """, *params)
+            return [_menu_item_from_row(row) for row in rows]
+        except Exception as e:
+            logger.error("Ошибка при получении блюд: %s", e)
+            return []
+
+    async def get_menu_grouped(self, available_only: bool = False) -> List[Tuple[Any, List[Any]]]:
+        """Получает меню, сгруппированное по категориям, одним запросом"""
+        from models import Category
+
+        try:
+            rows = await self.pool.fetch(f"""
+                SELECT c.id, c.name, c.description,
+                       m.id, m.name, m.description, m.price, m.category_id,
+                       m.is_available, m.unavailability_reason, m.calories, m.cooking_time_minutes
+                FROM categories c
+                LEFT JOIN menu_items m ON m.category_id = c.id
+                    {"AND m.is_available = TRUE" if available_only else ""}
+                ORDER BY c.name, m.name
+            """)
+
+            grouped = []
+            for row in rows:
+                if not grouped or grouped[-1][0].id != row[0]:
+                    grouped.append((Category(id=row[0], name=row[1], description=row[2]), []))
+                if row[3] is not None:
+                    grouped[-1][1].append(_menu_item_from_row(tuple(row)[3:] + (row[1],)))
+            return grouped
+        except Exception as e:
+            logger.error("Ошибка при получении меню: %s", e)
+            return []
+
+    async def get_menu_item_by_id(self, item_id: int) -> Optional[Any]:
+        """Получает блюдо по ID"""
+        try:
+            row = await self.pool.fetchrow(f"""
+                SELECT {MENU_ITEM_COLUMNS}
+                FROM menu_items m
+                JOIN categories c ON m.category_id = c.id
+                WHERE m.id = $1
+            """, item_id)
+            return _menu_item_from_row(row) if row else None
+        except Exception as e:
+            logger.error("Ошибка при получении блюда по ID: %s", e)
+            return None
+
+    async def find_or_create_customer(self, name: str, phone: str,
+                                      email: str = "", address: str = "") -> Any:
+        """Находит клиента по телефону или создает нового одним запросом"""
+        from models import Customer
+
+        try:
+            row = await self.pool.fetchrow("""
+                INSERT INTO customers (name, phone, email, address)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (phone) DO UPDATE SET phone = EXCLUDED.phone
+                RETURNING id, name, phone, email, address
+            """, name, phone, email, address)
+            return Customer(id=row[0], name=row[1], phone=row[2], email=row[3], address=row[4])
+        except Exception as e:
+            logger.error("Ошибка при поиске/создании клиента: %s", e)
+            raise
+
+    async def create_order(self, customer_id: int, items: List[Any],
+                           delivery_address: str = "", notes: str = "",
+                           payment_method: str = "cash") -> Tuple[int, str]:
+        """Создает новый заказ в базе данных одним запросом"""
+        order_number = await self.next_order_number()
+        total_amount = sum(item.subtotal for item in items)
+
+        try:
+            order_id = await self.pool.fetchval("""
+                WITH new_order AS (
+                    INSERT INTO orders
+                    (order_number, customer_id, total_amount, delivery_address, notes, payment_method)
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                    RETURNING id
+                ), new_items AS (
+                    INSERT INTO order_items
+                    (order_id, menu_item_id, quantity, price_at_order)
+                    SELECT new_order.id, line.menu_item_id, line.quantity, line.price_at_order
+                    FROM new_order,
+                         unnest($7::INTEGER[], $8::INTEGER[], $9::DECIMAL[]) WITH ORDINALITY
+                             AS line(menu_item_id, quantity, price_at_order, line_no)
+                    ORDER BY line.line_no
+                )
+                SELECT id FROM new_order
+            """, order_number, customer_id, total_amount, delivery_address, notes, payment_method,
+                [item.menu_item_id for item in items],
+                [item.quantity for item in items],
+                [item.price_at_order for item in items])
+
+            logger.info("Заказ создан: %s", order_number, extra={'order_number': order_number})
+            return order_id, order_number
+        except Exception as e:
+            logger.error("Ошибка при создании заказа: %s", e)
+            raise
+
+    async def next_order_number(self) -> str:
+        """Выдает номер заказа из блока, зарезервированного в order_number_seq"""
+        order_number = self._order_numbers.take()
+        while order_number is None:
+            async with self._reserve_lock:
+                # Пока ждали блокировку, блок могла зарезервировать другая задача
+                order_number = self._order_numbers.take()
+                if order_number is None:
+                    # Шаг - у той же последовательности, что и у nextval
+                    row = await self.pool.fetchrow("""
+                        SELECT nextval('order_number_seq'), seqincrement
+                        FROM pg_sequence WHERE seqrelid = 'order_number_seq'::regclass
+                    """)
+                    self._order_numbers.add_block(row[0], row[1])
+                    order_number = self._order_numbers.take()
+        return order_number
+
+    async def place_order(self, name: str, phone: str, items: List[Any],
+                          email: str = "", address: str = "", notes: str = "",
+                          payment_method: str = "cash",
+                          order_number: Optional[str] = None) -> Tuple[int, str, float]:
+        """Оформляет заказ целиком на сервере за один запрос
+
+        Возвращает (order_id, order_number, total_amount); отказ функции
+        place_order (пустой заказ, недоступные блюда) - ValueError.
+        """
+        lines = [{'menu_item_id': item.menu_item_id, 'quantity': item.quantity}
+                 for item in items]
+
+        try:
+            row = await self.pool.fetchrow(
+                "SELECT * FROM place_order($1, $2, $3, $4, $5, $6::jsonb, $7, $8, $9)",
+                name, phone, email, address, order_number or await self.next_order_number(), lines,
+                address, notes, payment_method
+            )
+            logger.info("Заказ создан: %s", row[1], extra={'order_number': row[1]})
+            return row[0], row[1], float(row[2])
+        except asyncpg.exceptions.RaiseError as e:
+            logger.warning("Заказ отклонен: %s", e.message, extra={'order_number': order_number})
+            raise ValueError(e.message) from e
+        except Exception as e:
+            logger.error("Ошибка при оформлении заказа: %s", e)
+            raise
+
+    async def get_order_by_number(self, order_number: str) -> Optional[Dict[str, Any]]:
+        """Получает детали заказа по номеру одним запросом"""
+        try:
+            orders = await self._fetch_order_details("o.order_number = $1", order_number)
+            return orders[0] if orders else None
+        except Exception as e:
+            logger.error("Ошибка при получении заказа: %s", e)
+            return None
+
+    async def get_orders_by_numbers(self, order_numbers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Получает детали нескольких заказов одним запросом"""
+        if not order_numbers:
+            return {}
+
+        try:
+            orders = await self._fetch_order_details("o.order_number = ANY($1)",
+                                                     list(order_numbers))
+            return {order['order_number']: order for order in orders}
+        except Exception as e:
+            logger.error("Ошибка при получении заказов: %s", e)
+            return {}
+
+    async def _fetch_order_details(self, condition: str, *params) -> List[Dict[str, Any]]:
+        """Читает заказы вместе с позициями: позиции собираются в JSON на сервере"""
+        rows = await self.pool.fetch(f"""
+            SELECT o.id, o.order_number, o.total_amount, o.status, o.created_at,
+                   c.name as customer_name, c.phone, c.email,
+                   o.delivery_address, o.notes, o.payment_method,
+                   COALESCE(lines.items, '[]'::json) as items
+            FROM orders o
+            JOIN customers c ON o.customer_id = c.id
+            LEFT JOIN LATERAL (
+                SELECT json_agg(json_build_object(
+                           'item_id', oi.menu_item_id,
+                           'item_name', m.name,
+                           'quantity', oi.quantity,
+                           'price', oi.price_at_order,
+                           'subtotal', oi.subtotal
+                       ) ORDER BY oi.id) as items
+                FROM order_items oi
+                JOIN menu_items m ON oi.menu_item_id = m.id
+                WHERE oi.order_id = o.id
+            ) lines ON TRUE
+            WHERE {condition}
+        """, *params)
+        return [_order_details_from_row(row) for row in rows]
+
+    async def get_all_orders(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Получает последние заказы"""
+        orders, _ = await self.get_orders_page(limit=limit)
+        return orders
+
+    async def get_orders_page(self, limit: int = 50, cursor: Optional[str] = None,
+                              status: Optional[str] = None,
+                              start_date: Optional[str] = None,
+                              end_date: Optional[str] = None,
+                              customer_id: Optional[int] = None
+                              ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Получает страницу заказов от новых к старым (пагинация по ключу)"""
+        try:
+            conditions = []
+            params: List[Any] = []
+
+            def param(value: Any) -> str:
+                params.append(value)
+                return f"${len(params)}"
+
+            if cursor:
+                created_at, order_id = _decode_page_cursor(cursor)
+                conditions.append(f"(o.created_at, o.id) < ({param(created_at)}, {param(order_id)})")
+
+            if status:
+                conditions.append(f"o.status = {param(status)}")
+
+            if start_date:
+                conditions.append(f"o.created_at >= {param(_as_timestamp(start_date))}")
+
+            if end_date:
+                conditions.append(f"o.created_at <= {param(_as_timestamp(end_date))}")
+
+            if customer_id:
+                conditions.append(f"o.customer_id = {param(customer_id)}")
+
+            where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+            # Одна лишняя строка показывает, есть ли следующая страница
+            rows = await self.pool.fetch(f"""
+                SELECT o.id, o.order_number, o.created_at, o.total_amount, o.status,
+                       c.name as customer_name
+                FROM orders o
+                JOIN customers c ON o.customer_id = c.id
+                {where}
+                ORDER BY o.created_at DESC, o.id DESC
+                LIMIT {param(limit + 1)}
+            """, *params)
+
+            orders = [{
+                'order_id': row[0],
+                'order_number': row[1],
+                'created_at': row[2],
+                'total_amount': float(row[3]),
+                'status': row[4],
+                'customer_name': row[5]
+            } for row in rows[:limit]]
+
+            next_cursor = None
+            if len(rows) > limit:
+                last = rows[limit - 1]
+                next_cursor = _encode_page_cursor(last[2], last[0])
+
+            return orders, next_cursor
+        except Exception as e:
+            logger.error("Ошибка при получении заказов: %s", e)
+            return [], None
+
+    async def update_order_status(self, order_id: int, status: str) -> bool:
+        """Обновляет статус заказа"""
+        if status not in ORDER_STATUSES:
+            logger.warning("Неверный статус. Допустимые: %s", ', '.join(ORDER_STATUSES))
+            return False
+
+        try:
+            result = await self.pool.execute(
+                "UPDATE orders SET status = $1 WHERE id = $2", status, order_id
+            )
+            return result != "UPDATE 0"
+        except Exception as e:
+            logger.error("Ошибка при обновлении статуса: %s", e)
+            return False
+
+    async def add_menu_item(self, name: str, description: str, price: float,
+                            category_id: int, calories: Optional[int] = None,
+                            cooking_time: Optional[int] = None) -> bool:
+        """Добавляет новое блюдо в меню"""
+        try:
+            await self.pool.execute("""
+                INSERT INTO menu_items
+                (name, description, price, category_id, calories, cooking_time_minutes)
+                VALUES ($1, $2, $3, $4, $5, $6)
+            """, name, description, price, category_id, calories, cooking_time)
+            return True
+        except Exception as e:
+            logger.error("Ошибка при добавлении блюда: %s", e)
+            return False
+
+    async def update_menu_item_availability(self, item_id: int, is_available: bool,
+                                            unavailability_reason: Optional[str] = None) -> bool:
+        """Обновляет доступность блюда с указанием причины"""
+        try:
+            # У доступного блюда причина очищается
+            result = await self.pool.execute("""
+                UPDATE menu_items
+                SET is_available = $1, unavailability_reason = $2
+                WHERE id = $3
+            """, is_available, None if is_available else unavailability_reason, item_id)
+            return result != "UPDATE 0"
+        except Exception as e:
+            logger.error("Ошибка при обновлении блюда: %s", e)
+            return False
+
+    async def get_order_statistics(self, start_date: Optional[str] = None,
+                                   end_date: Optional[str] = None) -> Dict[str, Any]:
+        """Получает статистику по заказам"""
+        try:
+            period = ""
+            params: List[Any] = []
+
+            if start_date:
+                params.append(_as_timestamp(start_date))
+                period += f" AND o.created_at >= ${len(params)}"
+
+            if end_date:
+                params.append(_as_timestamp(end_date))
+                period += f" AND o.created_at <= ${len(params)}"
+
+            async with self.pool.acquire() as conn:
+                row = await conn.fetchrow("""
+                    SELECT
+                        COUNT(*) as total_orders,
+                        SUM(o.total_amount) as total_revenue,
+                        AVG(o.total_amount) as avg_order_value,
+                        COUNT(DISTINCT o.customer_id) as unique_customers
+                    FROM orders o
+                    WHERE o.status != 'cancelled'
+                """ + period, *params)
+
+                popular = await conn.fetch("""
+                    SELECT m.name, SUM(oi.quantity) as total_quantity
+                    FROM order_items oi
+                    JOIN menu_items m ON oi.menu_item_id = m.id
+                    JOIN orders o ON oi.order_id = o.id
+                    WHERE o.status != 'cancelled'
+                """ + period + """
+                    GROUP BY m.name
+                    ORDER BY total_quantity DESC
+                    LIMIT 10
+                """, *params)
+
+            return {
+                'total_orders': row[0] or 0,
+                'total_revenue': float(row[1] or 0),
+                'avg_order_value': float(row[2] or 0),
+                'unique_customers': row[3] or 0,
+                'popular_items': [(item[0], item[1]) for item in popular]
+            }
+        except Exception as e:
+            logger.error("Ошибка при получении статистики: %s", e)
+            return {
+                'total_orders': 0,
+                'total_revenue': 0.0,
+                'avg_order_value': 0.0,
+                'unique_customers': 0,
+                'popular_items': []
+            }
+
+    async def close(self) -> None:
+        """Закрывает все соединения с базой данных"""
+        if self.pool:
+            try:
+                await self.pool.close()
+                logger.info("Асинхронные соединения с PostgreSQL закрыты")
+            except Exception as e:
+                logger.warning("Ошибка при закрытии соединений: %s", e)
@@ -0,0 +1,224 @@
+"""
+benchmark.py
+Замеры производительности операций с базой данных ресторана
+
+Запуск:
+    python benchmark.py create_order --runs 30
+    python benchmark.py write_behind --threads 16 --orders 200
+    python benchmark.py prepared --runs 500
+    python benchmark.py --stats create_order    # плюс статистика методов хранилища
+"""
+
+import argparse
+import statistics
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from app_logging import setup_logging
+from database import PostgreSQLDatabase
+from metrics import format_query_stats
+from models import OrderItem
+from write_behind import WriteBehindQueue
+
+BENCHMARK_NOTE = "benchmark"
+BENCHMARK_CUSTOMER = "Benchmark"
+
+
+def measure(func, runs: int) -> float:
+    """Возвращает медианное время выполнения функции в миллисекундах"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def legacy_create_order(db: PostgreSQLDatabase, customer_id: int, items) -> int:
+    """Прежняя реализация create_order: отдельный INSERT на каждую позицию"""
+    order_number = f"ORD-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:6].upper()}"
+    total_amount = sum(item.subtotal for item in items)
+
+    with db._connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO orders
+            (order_number, customer_id, total_amount, delivery_address, notes, payment_method)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """, (order_number, customer_id, total_amount, "", BENCHMARK_NOTE, "cash"))
+        order_id = cursor.fetchone()[0]
+
+        for item in items:
+            cursor.execute("""
+                INSERT INTO order_items
+                (order_id, menu_item_id, quantity, price_at_order)
+                VALUES (%s, %s, %s, %s)
+            """, (order_id, item.menu_item_id, item.quantity, item.price_at_order))
+
+        conn.commit()
+        return order_id
+
+
+def cleanup(db: PostgreSQLDatabase) -> None:
+    """Удаляет заказы и клиентов +7000000NNNN, созданных во время замеров"""
+    with db._connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM orders WHERE notes = %s", (BENCHMARK_NOTE,))
+        cursor.execute("""
+            DELETE FROM customers c
+            WHERE c.name = %s AND c.phone LIKE '+7000000%%'
+              AND NOT EXISTS (SELECT 1 FROM orders o WHERE o.customer_id = c.id)
+        """, (BENCHMARK_CUSTOMER,))
+        conn.commit()
+
+
+def bench_create_order(db: PostgreSQLDatabase, args) -> None:
+    """Задержка create_order в зависимости от числа позиций: до и после"""
+    menu = db.get_menu_items()
+    customer = db.find_or_create_customer(BENCHMARK_CUSTOMER, "+70000000000")
+
+    print(f"{'Позиций':>8} {'Построчно, мс':>15} {'Одним запросом, мс':>20} {'Ускорение':>10}")
+    try:
+        for line_count in args.lines:
+            items = [OrderItem(menu_item_id=menu[i % len(menu)].id, quantity=1,
+                               price_at_order=menu[i % len(menu)].price)
+                     for i in range(line_count)]
+
+            legacy = measure(lambda: legacy_create_order(db, customer.id, items), args.runs)
+            batched = measure(lambda: db.create_order(customer.id, items, notes=BENCHMARK_NOTE),
+                              args.runs)
+            print(f"{line_count:>8} {legacy:>15.2f} {batched:>20.2f} {legacy / batched:>9.1f}x")
+    finally:
+        cleanup(db)
+
+
+def run_concurrent_orders(db: PostgreSQLDatabase, threads: int, orders: int, items) -> tuple:
+    """Оформляет orders заказов в каждом из threads потоков
+
+    Возвращает (заказов в секунду, медиана задержки мс, 99-й перцентиль мс).
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(worker_id: int) -> None:
+        timings = []
+        for _ in range(orders):
+            started = time.perf_counter()
+            db.place_order(BENCHMARK_CUSTOMER, f"+7000000{worker_id:04d}", items, notes=BENCHMARK_NOTE)
+            timings.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(timings)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return (len(latencies) / elapsed, statistics.median(latencies),
+            latencies[int(len(latencies) * 0.99) - 1])
+
+
+def bench_write_behind(db: PostgreSQLDatabase, args) -> None:
+    """Пропускная способность place_order: отдельные фиксации и групповая фиксация"""
+    menu = db.get_menu_items(available_only=True)
+    items = [OrderItem(menu_item_id=item.id, quantity=1, price_at_order=item.price)
+             for item in menu[:3]]
+
+    print(f"{'Режим':<28} {'Заказов/с':>10} {'p50, мс':>9} {'p99, мс':>9}")
+    try:
+        direct = run_concurrent_orders(db, args.threads, args.orders, items)
+        print(f"{'Фиксация каждого заказа':<28} {direct[0]:>10.0f} {direct[1]:>9.2f} {direct[2]:>9.2f}")
+
+        db._write_behind = WriteBehindQueue(db, max_batch=args.batch, max_delay_ms=args.delay_ms)
+        db._write_behind.start()
+        try:
+            grouped = run_concurrent_orders(db, args.threads, args.orders, items)
+        finally:
+            queue, db._write_behind = db._write_behind, None
+            queue.close()
+        print(f"{'Групповая фиксация':<28} {grouped[0]:>10.0f} {grouped[1]:>9.2f} {grouped[2]:>9.2f}")
+        print(f"\nСредний размер пачки: {queue.orders / max(queue.batches, 1):.1f}, "
+              f"ускорение: {grouped[0] / direct[0]:.1f}x")
+    finally:
+        cleanup(db)
+
+
+def bench_prepared(db: PostgreSQLDatabase, args) -> None:
+    """Задержка частых запросов: разбор при каждом вызове и подготовленный запрос"""
+    menu = db.get_menu_items(available_only=True)
+    items = [OrderItem(menu_item_id=item.id, quantity=1, price_at_order=item.price)
+             for item in menu[:3]]
+    _, order_number, _ = db.place_order(BENCHMARK_CUSTOMER, "+70000000000", items, notes=BENCHMARK_NOTE)
+    numbers = [order_number, "ORD-00000000-MISSING"]
+
+    # Меню читаем из базы при каждом вызове, а не из кэша
+    menu_cache, db.menu_cache = db.menu_cache, None
+    cases = [
+        ("menu_load", db.get_menu_items),
+        ("order_by_number", lambda: db.get_order_by_number(order_number)),
+        ("orders_by_numbers", lambda: db.get_orders_by_numbers(numbers)),
+    ]
+
+    print(f"{'Запрос':<20} {'Без подготовки, мс':>19} {'Подготовлен, мс':>16} {'Экономия, мс':>13}")
+    try:
+        # Одно соединение на все вызовы: подготовка делается один раз
+        with db.transaction():
+            for name, func in cases:
+                db.statements.enabled = False
+                plain = measure(func, args.runs)
+                db.statements.enabled = True
+                func()
+                prepared = measure(func, args.runs)
+                print(f"{name:<20} {plain:>19.3f} {prepared:>16.3f} {plain - prepared:>13.3f}")
+    finally:
+        db.menu_cache = menu_cache
+        cleanup(db)
+
+    print("\nРеестр подготовленных запросов:")
+    for statement in db.get_statement_metrics():
+        print(f"  {statement['name']:<20} выполнений: {statement['executions']:>6}, "
+              f"подготовлен на соединениях: {statement['prepared_on']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности базы данных ресторана")
+    parser.add_argument("--stats", action="store_true",
+                        help="вывести статистику методов хранилища после замера")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    create_order = subparsers.add_parser("create_order", help="создание заказа с N позициями")
+    create_order.add_argument("--runs", type=int, default=20)
+    create_order.add_argument("--lines", type=int, nargs="+", default=[1, 5, 10, 20, 50])
+    create_order.set_defaults(func=bench_create_order)
+
+    write_behind = subparsers.add_parser("write_behind", help="групповая фиксация заказов")
+    write_behind.add_argument("--threads", type=int, default=16)
+    write_behind.add_argument("--orders", type=int, default=200, help="заказов на поток")
+    write_behind.add_argument("--batch", type=int, default=64)
+    write_behind.add_argument("--delay-ms", type=float, default=1.0)
+    write_behind.set_defaults(func=bench_write_behind)
+
+    prepared = subparsers.add_parser("prepared", help="подготовленные частые запросы")
+    prepared.add_argument("--runs", type=int, default=500)
+    prepared.set_defaults(func=bench_prepared)
+
+    args = parser.parse_args()
+    setup_logging(default_level="WARNING")
+
+    db = PostgreSQLDatabase()
+    try:
+        args.func(db, args)
+        if args.stats:
+            print("\nСтатистика методов хранилища:")
+            print("\n".join(format_query_stats(db.get_query_stats())))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
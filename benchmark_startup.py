@@ -0,0 +1,108 @@
+"""
+benchmark_startup.py
+Замер холодного запуска GUI: время до первой отрисовки окна и до готовности к работе
+
+Каждый запуск - новый процесс Python: в замер входят запуск интерпретатора,
+импорт модулей, подключение к базе и загрузка меню. Отсчет ведется от
+момента создания процесса.
+
+Этапы:
+    first_paint - окно показано на экране, каркас интерфейса нарисован
+    connected   - хранилище подключено
+    interactive - меню загружено и показано
+
+Запуск (нужен дисплей):
+    python benchmark_startup.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+STAGES = ("first_paint", "connected", "interactive")
+
+
+def probe(spawned_at: float, timeout: float) -> None:
+    """Запускает GUI в этом процессе и печатает моменты этапов в JSON"""
+    import tkinter as tk
+
+    from restaurant_gui import RestaurantGUI
+
+    class ProbeGUI(RestaurantGUI):
+        """GUI без диалогов: ошибка подключения завершает замер"""
+
+        error = None
+
+        def on_database_error(self, error):
+            self.error = str(error)
+
+    root = tk.Tk()
+    app = ProbeGUI(root)
+    deadline = time.time() + timeout
+
+    def check():
+        if "interactive" in app.startup_times or app.error or time.time() > deadline:
+            result = {stage: (app.startup_times[stage] - spawned_at) * 1000
+                      for stage in STAGES if stage in app.startup_times}
+            if app.error:
+                result['error'] = app.error
+            print(json.dumps(result))
+            app.close()
+        else:
+            root.after(5, check)
+
+    root.after(5, check)
+    root.mainloop()
+
+
+def run_once(timeout: float) -> dict:
+    """Один холодный запуск в новом процессе"""
+    spawned_at = time.time()
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--probe", str(spawned_at),
+         "--timeout", str(timeout)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер холодного запуска GUI ресторана")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0,
+                        help="предельное время одного запуска, с")
+    parser.add_argument("--probe", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe is not None:
+        probe(args.probe, args.timeout)
+        return
+
+    results = []
+    for run in range(1, args.runs + 1):
+        try:
+            result = run_once(args.timeout)
+        except subprocess.CalledProcessError as e:
+            print(f"✗ Запуск {run} завершился с ошибкой:\n{e.stderr.strip()}")
+            return
+        if 'error' in result:
+            print(f"✗ Запуск {run}: нет подключения к базе данных: {result['error']}")
+            return
+        results.append(result)
+        print(f"Запуск {run}: " + ", ".join(f"{stage} {result[stage]:.0f} мс"
+                                           for stage in STAGES if stage in result))
+
+    print(f"\n{'Этап':<14} {'Медиана, мс':>12} {'Мин, мс':>9} {'Макс, мс':>9}")
+    for stage in STAGES:
+        timings = [result[stage] for result in results if stage in result]
+        if timings:
+            print(f"{stage:<14} {statistics.median(timings):>12.0f} "
+                  f"{min(timings):>9.0f} {max(timings):>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+check_database.py
+Проверки базы данных ресторана на локальном сервере
+
+Запуск:
+    python check_database.py explain --orders 200000
+    python check_database.py parity
+
+explain - наполняет базу тестовыми заказами внутри транзакции, вызывает
+методы PostgreSQLDatabase, перехватывает их запросы и проверяет через
+EXPLAIN, что на больших таблицах нет последовательного сканирования.
+Транзакция откатывается, данные в базе не меняются. Код возврата 1 -
+есть запросы без индекса.
+
+parity - выполняет одни и те же вызовы на PostgreSQLDatabase и
+AsyncPostgreSQLDatabase и сравнивает результаты. Созданные проверкой
+заказы и клиент удаляются. Код возврата 1 - результаты расходятся.
+"""
+
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timedelta
+
+from psycopg2.extensions import cursor as PgCursor
+
+from app_logging import setup_logging
+from async_database import AsyncPostgreSQLDatabase
+from database import PostgreSQLDatabase
+from models import OrderItem
+from storage import _encode_page_cursor
+
+# Таблицы, которые растут вместе с заказами; справочники меню малы,
+# и последовательное чтение для них нормально
+LARGE_TABLES = {"orders", "order_items", "customers"}
+
+
+class RecordingCursor(PgCursor):
+    """Курсор, запоминающий тексты выполненных запросов
+
+    PREPARE не запоминается: план подготовленного запроса проверяется
+    через EXPLAIN EXECUTE.
+    """
+
+    queries = []
+
+    def execute(self, query, vars=None):
+        text = self.mogrify(query, vars).decode()
+        if not text.lstrip().upper().startswith("PREPARE "):
+            RecordingCursor.queries.append(text)
+        return super().execute(query, vars)
+
+
+class _Rollback(Exception):
+    """Откатывает транзакцию проверки"""
+
+
+def seed_orders(cursor, order_count: int) -> str:
+    """Наполняет базу заказами за два года и возвращает номер одного из них"""
+    customer_count = max(order_count // 10, 1)
+    cursor.execute("""
+        INSERT INTO customers (name, phone)
+        SELECT 'Клиент ' || n, '+7check' || n
+        FROM generate_series(1, %s) AS n
+    """, (customer_count,))
+    cursor.execute("""
+        INSERT INTO orders (order_number, customer_id, total_amount, status, created_at)
+        SELECT 'CHECK-' || n,
+               (SELECT MIN(id) FROM customers WHERE phone LIKE '+7check%%') + n %% %s,
+               500,
+               (ARRAY['pending', 'confirmed', 'delivered', 'cancelled'])[1 + n %% 4],
+               now() - (n || ' minutes')::interval * 5
+        FROM generate_series(1, %s) AS n
+    """, (customer_count, order_count))
+    cursor.execute("ANALYZE customers")
+    cursor.execute("ANALYZE orders")
+    cursor.execute("""
+        INSERT INTO order_items (order_id, menu_item_id, quantity, price_at_order)
+        SELECT o.id, m.id, 1, m.price
+        FROM orders o
+        CROSS JOIN LATERAL (
+            SELECT id, price FROM menu_items ORDER BY id LIMIT 3
+        ) AS m
+        WHERE o.order_number LIKE 'CHECK-%%'
+    """)
+    cursor.execute("ANALYZE order_items")
+    return f"CHECK-{order_count // 2}"
+
+
+def seq_scans(plan: dict) -> list:
+    """Находит в плане последовательные сканирования больших таблиц"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in LARGE_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def check_explain(db: PostgreSQLDatabase, args) -> int:
+    """Проверяет планы запросов горячих методов на наполненной базе"""
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    # Курсор глубоко в истории: страница на полгода назад
+    deep_cursor = _encode_page_cursor(datetime.now() - timedelta(days=180), 0)
+    failures = 0
+    RecordingCursor.queries = []
+
+    try:
+        with db.transaction() as conn:
+            with conn.cursor() as cursor:
+                order_number = seed_orders(cursor, args.orders)
+
+            # Методы в этом потоке работают на соединении транзакции
+            cursor_factory, conn.cursor_factory = conn.cursor_factory, RecordingCursor
+            try:
+                calls = {
+                    "get_all_orders": lambda: db.get_all_orders(limit=50),
+                    "get_orders_page": lambda: db.get_orders_page(limit=50, cursor=deep_cursor),
+                    "get_orders_page(status)": lambda: db.get_orders_page(
+                        limit=50, cursor=deep_cursor, status="delivered"
+                    ),
+                    "get_order_by_number": lambda: db.get_order_by_number(order_number),
+                    "get_orders_by_numbers": lambda: db.get_orders_by_numbers(
+                        [order_number, "CHECK-1", "CHECK-2"]
+                    ),
+                    "get_order_statistics": lambda: db.get_order_statistics(start_date=yesterday),
+                }
+                planned = []
+                for name, call in calls.items():
+                    RecordingCursor.queries = []
+                    call()
+                    planned.extend((name, query) for query in RecordingCursor.queries)
+            finally:
+                conn.cursor_factory = cursor_factory
+
+            with conn.cursor() as cursor:
+                for name, query in planned:
+                    cursor.execute("EXPLAIN (FORMAT JSON) " + query)
+                    plan = cursor.fetchone()[0][0]["Plan"]
+                    scans = seq_scans(plan)
+                    status = "✗ Seq Scan: " + ", ".join(scans) if scans else "✓"
+                    print(f"{status:<30} {name}: {' '.join(query.split())[:80]}")
+                    failures += bool(scans)
+
+            raise _Rollback()
+    except _Rollback:
+        pass
+
+    print(f"\nЗапросов без индекса: {failures}")
+    return 1 if failures else 0
+
+
+PARITY_PHONE = "+7parity"
+PARITY_NOTE = "parity-check"
+
+
+def check_parity(db: PostgreSQLDatabase, args) -> int:
+    """Сравнивает результаты синхронного и асинхронного классов"""
+    return asyncio.run(_check_parity(db))
+
+
+async def _check_parity(db: PostgreSQLDatabase) -> int:
+    adb = await AsyncPostgreSQLDatabase.create()
+    failures = 0
+
+    def compare(name: str, expected, actual) -> None:
+        nonlocal failures
+        ok = expected == actual
+        failures += not ok
+        print(f"{'✓' if ok else '✗'} {name}")
+        if not ok:
+            print(f"    sync:  {expected!r}\n    async: {actual!r}")
+
+    try:
+        menu = db.get_menu_items(available_only=True)
+        items = [OrderItem(menu_item_id=item.id, quantity=i + 1, price_at_order=item.price)
+                 for i, item in enumerate(menu[:3])]
+
+        # Заказы создаются обоими классами и читаются перекрестно
+        _, sync_number, sync_total = db.place_order(
+            "Проверка", PARITY_PHONE, items, notes=PARITY_NOTE)
+        _, async_number, async_total = await adb.place_order(
+            "Проверка", PARITY_PHONE, items, notes=PARITY_NOTE)
+        compare("place_order: итог", sync_total, async_total)
+
+        category_id = menu[0].category_id
+        today = datetime.now().strftime("%Y-%m-%d")
+        calls = {
+            "get_all_categories": lambda d: d.get_all_categories(),
+            "get_menu_items": lambda d: d.get_menu_items(),
+            "get_menu_items(категория, доступные)": lambda d: d.get_menu_items(
+                category_id=category_id, available_only=True),
+            "get_menu_grouped": lambda d: d.get_menu_grouped(available_only=True),
+            "get_menu_item_by_id": lambda d: d.get_menu_item_by_id(menu[0].id),
+            "get_order_by_number(sync)": lambda d: d.get_order_by_number(sync_number),
+            "get_order_by_number(async)": lambda d: d.get_order_by_number(async_number),
+            "get_orders_by_numbers": lambda d: d.get_orders_by_numbers(
+                [sync_number, async_number, "ORD-NONE"]),
+            "get_orders_page": lambda d: d.get_orders_page(limit=5, start_date=today),
+            "get_all_orders": lambda d: d.get_all_orders(limit=20),
+            "get_order_statistics": lambda d: d.get_order_statistics(start_date=today),
+        }
+        for name, call in calls.items():
+            compare(name, call(db), await call(adb))
+
+        order_id = db.get_order_by_number(async_number)['order_id']
+        compare("update_order_status",
+                db.update_order_status(order_id, "confirmed"),
+                await adb.update_order_status(order_id, "delivered"))
+        compare("update_order_status(неверный статус)",
+                db.update_order_status(order_id, "lost"),
+                await adb.update_order_status(order_id, "lost"))
+    finally:
+        with db._connection() as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM orders WHERE notes = %s", (PARITY_NOTE,))
+            cursor.execute("DELETE FROM customers WHERE phone = %s", (PARITY_PHONE,))
+            conn.commit()
+        await adb.close()
+
+    print(f"\nРасхождений: {failures}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверки базы данных ресторана")
+    subparsers = parser.add_subparsers(dest="check", required=True)
+
+    explain = subparsers.add_parser("explain", help="планы запросов на больших данных")
+    explain.add_argument("--orders", type=int, default=200000)
+    explain.set_defaults(func=check_explain)
+
+    parity = subparsers.add_parser("parity", help="сравнение синхронного и асинхронного классов")
+    parity.set_defaults(func=check_parity)
+
+    args = parser.parse_args()
+    setup_logging(default_level="WARNING")
+
+    db = PostgreSQLDatabase()
+    try:
+        sys.exit(args.func(db, args))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,287 +4,726 @@ database.py
 """
 
 import psycopg2
-from psycopg2.extensions import connection as PgConnection
-from typing import List, Optional, Dict, Any, Tuple
-from datetime import datetime
+from psycopg2 import errorcodes
+from psycopg2.extensions import (
+    connection as PgConnection, cursor as PgCursor, TRANSACTION_STATUS_IDLE
+)
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
+from typing import List, Optional, Dict, Any, Tuple, Iterator, Callable, TypeVar, Union
+import functools
+import json
 import os
+import random
+import re
+import select
+import threading
+import time
 from dotenv import load_dotenv
-import uuid
+
+import migrations
+from app_logging import get_logger
+from metrics import QueryStats, instrument_methods, log_slow_query, record_rows
+from storage import (
+    RestaurantDatabase,
+    DatabaseUnavailableError,
+    OrderNumberGenerator,
+    ORDER_STATUSES,
+    _decode_page_cursor,
+    _encode_page_cursor,
+    _menu_item_from_row,
+    _order_details_from_row,
+)
 
 # Загружаем переменные окружения
 load_dotenv()
 
-class PostgreSQLDatabase:
-    """Класс для работы с PostgreSQL"""
+logger = get_logger("database")
+
+# Канал NOTIFY, в который триггеры menu_items и categories сообщают об изменениях
+MENU_CHANNEL = "menu_changed"
+
+
+# Ошибки, после которых соединение считается оборванным
+DISCONNECT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+T = TypeVar("T")
+
+
+def _is_disconnect(error: Exception) -> bool:
+    """Обрыв связи, а не ошибка запроса: у первого нет SQLSTATE или он класса 08/57P"""
+    if isinstance(error, psycopg2.InterfaceError):
+        return True
+    pgcode = getattr(error, 'pgcode', None)
+    return pgcode is None or pgcode.startswith(("08", "57P"))
+
+
+def _connect_kwargs_from_env() -> Dict[str, Any]:
+    """Параметры подключения к PostgreSQL из переменных окружения
+
+    TCP keepalive обнаруживает молча пропавший сервер за
+    keepalives_idle + keepalives_interval * keepalives_count секунд,
+    а не за системные два часа.
+    """
+    return {
+        'dbname': os.getenv("DB_NAME", "restaurant_db"),
+        'user': os.getenv("DB_USER", "postgres"),
+        'password': os.getenv("DB_PASSWORD", "rewty76"),
+        'host': os.getenv("DB_HOST", "localhost"),
+        'port': os.getenv("DB_PORT", "5432"),
+        'connect_timeout': int(os.getenv("DB_CONNECT_TIMEOUT", "3")),
+        'keepalives': 1,
+        'keepalives_idle': int(os.getenv("DB_KEEPALIVES_IDLE", "10")),
+        'keepalives_interval': int(os.getenv("DB_KEEPALIVES_INTERVAL", "3")),
+        'keepalives_count': int(os.getenv("DB_KEEPALIVES_COUNT", "3"))
+    }
+
+
+class RetryPolicy:
+    """Повторы при обрыве соединения с экспоненциальной задержкой и разбросом
+
+    Задержка перед повтором n - случайная в [0, min(max_delay, base_delay * 2^n)]:
+    кассы, потерявшие связь одновременно, не переподключаются разом.
+    """
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.05, max_delay: float = 1.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        return cls(attempts=int(os.getenv("DB_RETRY_ATTEMPTS", "3")),
+                   base_delay=float(os.getenv("DB_RETRY_BASE_DELAY_MS", "50")) / 1000,
+                   max_delay=float(os.getenv("DB_RETRY_MAX_DELAY_MS", "1000")) / 1000)
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def run(self, func: Callable[[], T]) -> T:
+        """Вызывает func, повторяя его при обрыве соединения"""
+        for attempt in range(self.attempts):
+            try:
+                return func()
+            except DISCONNECT_ERRORS as e:
+                # Отмена по statement_timeout и взаимоблокировки повтором не лечатся
+                if attempt + 1 >= self.attempts or not _is_disconnect(e):
+                    raise
+                logger.warning("Соединение с базой потеряно, повтор %s из %s: %s",
+                               attempt + 1, self.attempts - 1, e)
+                time.sleep(self.delay(attempt))
+        raise AssertionError("unreachable")
+
+
+def retry_on_disconnect(method: Callable[..., T]) -> Callable[..., T]:
+    """Повторяет идемпотентный метод PostgreSQLDatabase при обрыве соединения
+
+    Внутри transaction() повтора нет: транзакция на оборванном
+    соединении потеряна, и повторить ее может только вызывающий.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._in_transaction():
+            return method(self, *args, **kwargs)
+        return self.retry_policy.run(lambda: method(self, *args, **kwargs))
+
+    return wrapper
+
+
+class PoolTimeoutError(DatabaseUnavailableError):
+    """Не удалось получить соединение из пула за отведенное время"""
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений с проверкой здоровья и метриками"""
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float = 10.0,
+                 health_check_interval: float = 30.0, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+        # ThreadedConnectionPool при исчерпании бросает ошибку, а не ждет,
+        # поэтому очередь ожидания организуем семафором
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        # Время возврата соединения в пул; новые соединения в словаре отсутствуют
+        now = time.monotonic()
+        self._last_used: Dict[int, float] = {id(conn): now for conn in self._pool._pool}
+
+        # Метрики
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        # Соединения, возвращенные до этого момента, проверяются при выдаче
+        self._suspect_before = 0.0
+
+    def getconn(self) -> PgConnection:
+        """Берет соединение из пула, при необходимости ожидая освобождения"""
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeoutError(
+                f"Нет свободных соединений в пуле (максимум {self.maxconn}) "
+                f"за {self.timeout} с"
+            )
+
+        try:
+            conn = self._checkout_healthy()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def putconn(self, conn: PgConnection, close: bool = False) -> None:
+        """Возвращает соединение в пул, откатывая незавершенную транзакцию"""
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+        close = close or bool(conn.closed)
+
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            with self._lock:
+                # Сверх minconn простаивающие соединения пул закрывает сам
+                if conn.closed:
+                    self._last_used.pop(id(conn), None)
+                else:
+                    self._last_used[id(conn)] = time.monotonic()
+                if close:
+                    self._discarded += 1
+                self._in_use -= 1
+            self._slots.release()
+
+    def _checkout_healthy(self) -> PgConnection:
+        """Выдает живое соединение, отбрасывая разорванные"""
+        # После перезапуска сервера все простаивающие соединения могут быть
+        # мертвыми, поэтому перебираем их, пока не найдем рабочее
+        for _ in range(self.maxconn + 1):
+            conn = self._pool.getconn()
+            if self._is_healthy(conn):
+                return conn
+            with self._lock:
+                self._last_used.pop(id(conn), None)
+                self._discarded += 1
+            self._pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError("Не удалось получить рабочее соединение из пула")
+
+    def mark_suspect(self) -> None:
+        """Требует проверки всех простаивающих соединений перед выдачей
+
+        Вызывается при обнаружении оборванного соединения: после
+        перезапуска сервера мертвы обычно все соединения пула сразу.
+        """
+        with self._lock:
+            self._suspect_before = time.monotonic()
+
+    def _is_healthy(self, conn: PgConnection) -> bool:
+        """Проверяет соединение; долго простаивавшие и подозрительные проверяются запросом"""
+        if conn.closed:
+            return False
+
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or (last_used > self._suspect_before and
+                                 time.monotonic() - last_used < self.health_check_interval):
+            return True
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def metrics(self) -> Dict[str, Any]:
+        """Возвращает метрики пула: размер, ожидание и насыщенность"""
+        with self._lock:
+            size = len(self._pool._pool) + len(self._pool._used)
+            return {
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'size': size,
+                'in_use': self._in_use,
+                'idle': max(size - self._in_use, 0),
+                'saturation': self._in_use / self.maxconn,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'wait_avg_ms': (self._wait_total / self._checkouts * 1000) if self._checkouts else 0.0,
+                'wait_max_ms': self._wait_max * 1000
+            }
+
+    def closeall(self) -> None:
+        """Закрывает все соединения пула"""
+        self._pool.closeall()
+
+
+class TimedCursor(PgCursor):
+    """Курсор, считающий строки для статистики методов и замечающий медленные запросы"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            record_rows(self.rowcount)
+            if isinstance(query, str) and query.startswith("EXECUTE "):
+                # В журнал - текст подготовленного запроса, а не только его имя
+                name = query.split()[1]
+                query = f"{query} -- {self.connection.prepared.get(name, '')}"
+            log_slow_query(query, vars, elapsed)
+
+
+class PreparedConnection(PgConnection):
+    """Соединение, помнящее подготовленные на нем запросы: имя -> текст
+
+    Подготовленные запросы живут до закрытия соединения и не исчезают при
+    откате транзакции, поэтому набор имен хранится вместе с соединением.
+    Курсоры соединения по умолчанию - TimedCursor.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: Dict[str, str] = {}
+        self.cursor_factory = TimedCursor
+
+
+class StatementRegistry:
+    """Именованные частые запросы: PREPARE один раз на соединение, затем EXECUTE
+
+    Сервер разбирает и планирует запрос при подготовке, а не при каждом
+    вызове. Запрос передается в execute() вместе с именем в обычном виде
+    (параметры %s); на соединениях не из пула он выполняется как есть.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._statements: Dict[str, str] = {}
+        self._executions: Dict[str, int] = {}
+        self._prepares: Dict[str, int] = {}
+
+    def execute(self, cursor, name: str, sql: str, params: Tuple = ()) -> None:
+        """Выполняет запрос sql под именем name на соединении курсора"""
+        conn = cursor.connection
+        with self._lock:
+            self._statements.setdefault(name, sql)
+            self._executions[name] = self._executions.get(name, 0) + 1
+
+        if not self.enabled or not isinstance(conn, PreparedConnection):
+            cursor.execute(sql, params)
+            return
+
+        if name not in conn.prepared:
+            # Параметры %s нумеруются по порядку: $1, $2, ...
+            numbers = iter(range(1, len(params) + 1))
+            cursor.execute(f"PREPARE {name} AS " + re.sub(r"%s", lambda _: f"${next(numbers)}", sql))
+            conn.prepared[name] = sql
+            with self._lock:
+                self._prepares[name] = self._prepares.get(name, 0) + 1
+
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        """Запросы реестра: имя, число выполнений и число соединений, где он подготовлен"""
+        with self._lock:
+            return [{
+                'name': name,
+                'executions': self._executions.get(name, 0),
+                'prepared_on': self._prepares.get(name, 0)
+            } for name in sorted(self._statements)]
+
+
+class MenuCache:
+    """Кэш меню процесса: категории с блюдами, индекс блюд по id и версия
+
+    Версия растет при каждом сбросе кэша. Данные хранятся, только пока
+    слушатель уведомлений подключен: без него изменения, сделанные в
+    других терминалах, остались бы незамеченными.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._grouped: Optional[List[Tuple[Any, List[Any]]]] = None
+        self._by_id: Dict[int, Any] = {}
+        self._active = False
+        self.version = 0
+
+        # Метрики: обращения из кэша, обращения с загрузкой из базы
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, loader: Callable[[], List[Tuple[Any, List[Any]]]]
+            ) -> Tuple[List[Tuple[Any, List[Any]]], Dict[int, Any]]:
+        """Возвращает меню и индекс по id, загружая меню через loader при промахе"""
+        with self._lock:
+            if self._grouped is not None:
+                self.hits += 1
+                return self._grouped, self._by_id
+            self.misses += 1
+            version, active = self.version, self._active
+
+        grouped = loader()
+        by_id = {item.id: item for _, items in grouped for item in items}
+
+        with self._lock:
+            # Если меню сбросили во время загрузки, результат мог устареть
+            if active and self.version == version:
+                self._grouped, self._by_id = grouped, by_id
+        return grouped, by_id
+
+    def invalidate(self) -> None:
+        """Сбрасывает кэш; следующее чтение загрузит меню из базы"""
+        with self._lock:
+            self._grouped = None
+            self._by_id = {}
+            self.version += 1
+
+    @property
+    def active(self) -> bool:
+        """Подключен ли слушатель: только тогда версия отражает все изменения"""
+        return self._active
+
+    def set_active(self, active: bool) -> None:
+        """Включает хранение данных (слушатель подключен) или выключает его"""
+        with self._lock:
+            self._active = active
+        self.invalidate()
+
+
+class MenuChangeListener:
+    """Сбрасывает кэш меню по NOTIFY на отдельном соединении вне пула"""
+
+    def __init__(self, cache: MenuCache, reconnect_delay: float = 5.0, **connect_kwargs):
+        self.cache = cache
+        self.reconnect_delay = reconnect_delay
+        # Первые попытки переподключения - быстро, затем реже, до reconnect_delay
+        self._backoff = RetryPolicy(base_delay=0.1, max_delay=reconnect_delay)
+        self._connect_kwargs = connect_kwargs
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="menu-listener", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Останавливает поток слушателя и закрывает его соединение"""
+        self._stop.set()
+        self._thread.join(timeout=self.reconnect_delay)
+
+    def _run(self) -> None:
+        failures = 0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self._connect_kwargs)
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {MENU_CHANNEL}")
+                self.cache.set_active(True)
+                failures = 0
+
+                while not self._stop.is_set():
+                    # Короткий таймаут, чтобы вовремя заметить остановку
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        if conn.notifies:
+                            conn.notifies.clear()
+                            self.cache.invalidate()
+            except psycopg2.Error as e:
+                logger.warning("Слушатель изменений меню отключен: %s", e)
+            finally:
+                # Пока уведомления не приходят, меню читается из базы
+                self.cache.set_active(False)
+                if conn is not None:
+                    conn.close()
+            self._stop.wait(self._backoff.delay(failures))
+            failures += 1
+
+
+@instrument_methods(exclude=("transaction", "close", "get_menu_version", "get_pool_metrics",
+                             "get_statement_metrics", "get_query_stats"))
+class PostgreSQLDatabase(RestaurantDatabase):
+    """Класс для работы с PostgreSQL
+
+    Публичные методы замеряются (metrics.py), статистика - get_query_stats().
+    """
 
     def __init__(self):
-        self.connection: Optional[PgConnection] = None
+        self.query_stats = QueryStats()
+        self.pool: Optional[ConnectionPool] = None
+        # Соединение транзакции, открытой через transaction() в текущем потоке
+        self._local = threading.local()
+        self._connect_kwargs: Dict[str, Any] = {}
+        self.menu_cache: Optional[MenuCache] = None
+        self._menu_listener: Optional[MenuChangeListener] = None
+        self._write_behind = None
+        self._order_numbers = OrderNumberGenerator()
+        self.statements = StatementRegistry(enabled=os.getenv("DB_PREPARED_STATEMENTS", "1") != "0")
+        self.retry_policy = RetryPolicy.from_env()
         self._connect()
-        self._initialize_tables()
-        self._seed_initial_data()
+        self._migrate()
+        self._start_menu_cache()
+        self._start_write_behind()
 
     def _connect(self) -> None:
-        """Устанавливает соединение с PostgreSQL"""
+        """Создает пул соединений с PostgreSQL"""
+        self._connect_kwargs = _connect_kwargs_from_env()
         try:
-            self.connection = psycopg2.connect(
-                dbname=os.getenv("DB_NAME", "restaurant_db"),
-                user=os.getenv("DB_USER", "postgres"),
-                password=os.getenv("DB_PASSWORD", "rewty76"),
-                host=os.getenv("DB_HOST", "localhost"),
-                port=os.getenv("DB_PORT", "5432")
+            self.pool = ConnectionPool(
+                minconn=int(os.getenv("DB_POOL_MIN", "2")),
+                maxconn=int(os.getenv("DB_POOL_MAX", "10")),
+                timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+                health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30")),
+                connection_factory=PreparedConnection,
+                **self._connect_kwargs
             )
-            self.connection.autocommit = False
-            print("✓ Подключение к PostgreSQL установлено")
-        except Exception as e:
-            print(f"✗ Ошибка подключения к PostgreSQL: {e}")
+            logger.info("Подключение к PostgreSQL установлено (пул %s-%s)",
+                        self.pool.minconn, self.pool.maxconn)
+        except psycopg2.OperationalError as e:
+            logger.error("Ошибка подключения к PostgreSQL: %s", e)
+            raise DatabaseUnavailableError(str(e)) from e
+
+    @contextmanager
+    def _connection(self) -> Iterator[PgConnection]:
+        """Выдает соединение из пула на время одного вызова
+
+        Внутри transaction() возвращает соединение текущей транзакции.
+        """
+        pinned = getattr(self._local, 'connection', None)
+        if pinned is not None:
+            yield pinned
+            return
+
+        conn = self.pool.getconn()
+        broken = False
+        try:
+            yield conn
+        except DISCONNECT_ERRORS:
+            # Разорванное соединение не возвращаем в пул, остальные проверяем
+            broken = True
+            self.pool.mark_suspect()
             raise
-
-    def _initialize_tables(self) -> None:
-        """Инициализирует таблицы если их нет"""
+        finally:
+            self.pool.putconn(conn, close=broken)
+
+    def _in_transaction(self) -> bool:
+        """Идет ли в этом потоке блок transaction()"""
+        return getattr(self._local, 'connection', None) is not None
+
+    @contextmanager
+    def transaction(self) -> Iterator[PgConnection]:
+        """Объединяет несколько вызовов в одну транзакцию
+
+        Все методы, вызванные в этом потоке внутри блока, работают на одном
+        соединении и не фиксируют изменения сами. Фиксация - при выходе из
+        блока, откат - при исключении.
+        """
+        if getattr(self._local, 'connection', None) is not None:
+            # Вложенный блок присоединяется к внешней транзакции
+            yield self._local.connection
+            return
+
+        with self._connection() as conn:
+            self._local.connection = conn
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self._local.connection = None
+
+    def _commit(self, conn: PgConnection) -> None:
+        """Фиксирует транзакцию, если вызов не входит в transaction()"""
+        if getattr(self._local, 'connection', None) is not conn:
+            conn.commit()
+
+    def get_pool_metrics(self) -> Dict[str, Any]:
+        """Возвращает метрики пула соединений"""
+        return self.pool.metrics()
+
+    def get_query_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Возвращает статистику методов: вызовы, ошибки, строки и задержки"""
+        return self.query_stats.snapshot()
+
+    def get_statement_metrics(self) -> List[Dict[str, Any]]:
+        """Возвращает подготовленные запросы и число их выполнений"""
+        return self.statements.metrics()
+
+    def _migrate(self) -> None:
+        """Приводит схему к последней версии; обычно это одна проверка версии"""
         try:
-            with self.connection.cursor() as cursor:
-                # Таблица категорий
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS categories (
-                        id SERIAL PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL UNIQUE,
-                        description TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                # Таблица меню - ДОБАВЛЕНО ПОЛЕ ДЛЯ ПРИЧИНЫ
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS menu_items (
-                        id SERIAL PRIMARY KEY,
-                        name VARCHAR(200) NOT NULL,
-                        description TEXT,
-                        price DECIMAL(10, 2) NOT NULL,
-                        category_id INTEGER REFERENCES categories(id),
-                        is_available BOOLEAN DEFAULT TRUE,
-                        unavailability_reason TEXT,
-                        calories INTEGER,
-                        cooking_time_minutes INTEGER,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                # Таблица клиентов
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS customers (
-                        id SERIAL PRIMARY KEY,
-                        name VARCHAR(200) NOT NULL,
-                        phone VARCHAR(20) UNIQUE,
-                        email VARCHAR(200),
-                        address TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                # Таблица заказов
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS orders (
-                        id SERIAL PRIMARY KEY,
-                        order_number VARCHAR(50) UNIQUE NOT NULL,
-                        customer_id INTEGER REFERENCES customers(id),
-                        total_amount DECIMAL(10, 2) NOT NULL,
-                        status VARCHAR(50) DEFAULT 'pending',
-                        payment_method VARCHAR(50),
-                        delivery_address TEXT,
-                        notes TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                # Таблица позиций заказа
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS order_items (
-                        id SERIAL PRIMARY KEY,
-                        order_id INTEGER REFERENCES orders(id) ON DELETE CASCADE,
-                        menu_item_id INTEGER REFERENCES menu_items(id),
-                        quantity INTEGER NOT NULL CHECK (quantity > 0),
-                        price_at_order DECIMAL(10, 2) NOT NULL,
-                        subtotal DECIMAL(10, 2) GENERATED ALWAYS AS (quantity * price_at_order) STORED,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-
-                self.connection.commit()
-                print("✓ Таблицы инициализированы")
+            with self._connection() as conn:
+                applied = migrations.migrate(conn)
+            if applied:
+                logger.info("Применены миграции схемы: %s", ', '.join(map(str, applied)))
         except Exception as e:
-            self.connection.rollback()
-            print(f"✗ Ошибка при инициализации таблиц: {e}")
+            logger.error("Ошибка при миграции схемы: %s", e)
             raise
 
-    def _seed_initial_data(self) -> None:
-        """Заполняет начальными данными если таблицы пустые"""
-        try:
-            with self.connection.cursor() as cursor:
-                # Проверяем, есть ли категории
-                cursor.execute("SELECT COUNT(*) FROM categories")
-                count = cursor.fetchone()[0]
-
-                if count == 0:
-                    print("✓ Добавляем начальные данные...")
-
-                    # Добавляем категории
-                    categories = [
-                        ("Пицца", "Итальянская пицца на тонком тесте"),
-                        ("Суши и роллы", "Японская кухня"),
-                        ("Напитки", "Холодные и горячие напитки"),
-                        ("Десерты", "Сладкие угощения")
-                    ]
-
-                    for name, description in categories:
-                        cursor.execute(
-                            "INSERT INTO categories (name, description) VALUES (%s, %s)",
-                            (name, description)
-                        )
-
-                    # Добавляем меню
-                    menu_items = [
-                        ("Маргарита", "Томатный соус, моцарелла, базилик", 450, 1, 800, 15),
-                        ("Пепперони", "Томатный соус, пепперони, моцарелла", 550, 1, 950, 20),
-                        ("Филадельфия", "Лосось, сливочный сыр, огурец", 320, 2, 420, 10),
-                        ("Калифорния", "Краб-микс, авокадо, огурец, икра", 280, 2, 380, 10),
-                        ("Кола", "Coca-Cola 0.5л", 120, 3, 210, 2),
-                        ("Апельсиновый сок", "Свежевыжатый сок 0.3л", 150, 3, 120, 3),
-                        ("Чизкейк", "Классический Нью-Йорк чизкейк", 200, 4, 350, 5),
-                        ("Тирамису", "Итальянский десерт", 250, 4, 280, 5)
-                    ]
-
-                    for name, description, price, category_id, calories, cooking_time in menu_items:
-                        cursor.execute(
-                            """INSERT INTO menu_items 
-                            (name, description, price, category_id, calories, cooking_time_minutes) 
-                            VALUES (%s, %s, %s, %s, %s, %s)""",
-                            (name, description, price, category_id, calories, cooking_time)
-                        )
-
-                    self.connection.commit()
-                    print("✓ Начальные данные добавлены")
-        except Exception as e:
-            self.connection.rollback()
-            print(f"⚠ Ошибка при добавлении начальных данных: {e}")
+    def _start_menu_cache(self) -> None:
+        """Включает кэш меню, если он не отключен через MENU_CACHE=0"""
+        if os.getenv("MENU_CACHE", "1") == "0":
+            return
+        self.menu_cache = MenuCache()
+        self._menu_listener = MenuChangeListener(self.menu_cache, **self._connect_kwargs)
+        self._menu_listener.start()
+
+    def _start_write_behind(self) -> None:
+        """Включает групповую фиксацию заказов при ORDER_WRITE_BEHIND=1"""
+        if os.getenv("ORDER_WRITE_BEHIND", "0") != "1":
+            return
+        from write_behind import WriteBehindQueue
+
+        self._write_behind = WriteBehindQueue(
+            self,
+            max_batch=int(os.getenv("ORDER_WRITE_BEHIND_BATCH", "64")),
+            max_delay_ms=float(os.getenv("ORDER_WRITE_BEHIND_DELAY_MS", "1")),
+            result_timeout=float(os.getenv("ORDER_WRITE_BEHIND_TIMEOUT", "30"))
+        )
+        self._write_behind.start()
+
+    def _menu(self) -> Tuple[List[Tuple[Any, List[Any]]], Dict[int, Any]]:
+        """Возвращает все меню и индекс блюд по id - из кэша или из базы
+
+        Объекты блюд и категорий общие для всех вызывающих, их нельзя изменять.
+        """
+        if self.menu_cache is not None:
+            return self.menu_cache.get(self._load_menu)
+        grouped = self._load_menu()
+        return grouped, {item.id: item for _, items in grouped for item in items}
+
+    @retry_on_disconnect
+    def _load_menu(self) -> List[Tuple[Any, List[Any]]]:
+        """Загружает все категории с блюдами одним запросом"""
+        from models import Category
+
+        with self._connection() as conn, conn.cursor() as cursor:
+            self.statements.execute(cursor, "menu_load", """
+                SELECT c.id, c.name, c.description,
+                       m.id, m.name, m.description, m.price, m.category_id,
+                       m.is_available, m.unavailability_reason, m.calories, m.cooking_time_minutes
+                FROM categories c
+                LEFT JOIN menu_items m ON m.category_id = c.id
+                ORDER BY c.name, m.name
+            """)
+
+            grouped = []
+            for row in cursor.fetchall():
+                if not grouped or grouped[-1][0].id != row[0]:
+                    grouped.append((Category(id=row[0], name=row[1], description=row[2]), []))
+                if row[3] is not None:
+                    grouped[-1][1].append(_menu_item_from_row(row[3:] + (row[1],)))
+            return grouped
+
+    def get_menu_version(self) -> Optional[int]:
+        """Возвращает версию меню или None, пока изменения не отслеживаются
+
+        Версия отражает чужие изменения, только когда кэш включен и слушатель
+        уведомлений подключен.
+        """
+        cache = self.menu_cache
+        if cache is None or not cache.active:
+            return None
+        return cache.version
 
     def get_all_categories(self) -> List[Any]:
         """Получает все категории"""
-        from models import Category
-
         try:
-            with self.connection.cursor() as cursor:
-                cursor.execute("SELECT id, name, description FROM categories ORDER BY name")
-                return [Category(id=row[0], name=row[1], description=row[2])
-                        for row in cursor.fetchall()]
+            return [category for category, _ in self._menu()[0]]
         except Exception as e:
-            print(f"✗ Ошибка при получении категорий: {e}")
+            logger.error("Ошибка при получении категорий: %s", e)
             return []
 
     def get_menu_items(self, category_id: Optional[int] = None,
                       available_only: bool = False) -> List[Any]:
         """Получает блюда из меню (по умолчанию ВСЕ блюда)"""
-        from models import MenuItem
-
         try:
-            query = """
-                SELECT m.id, m.name, m.description, m.price, m.category_id, 
-                       m.is_available, m.unavailability_reason, m.calories, m.cooking_time_minutes,
-                       c.name as category_name
-                FROM menu_items m
-                JOIN categories c ON m.category_id = c.id
-            """
-            params = []
+            return [item for _, items in self._menu()[0] for item in items
+                    if (not available_only or item.is_available)
+                    and (not category_id or item.category_id == category_id)]
+        except Exception as e:
+            logger.error("Ошибка при получении блюд: %s", e)
+            return []
 
-            if available_only:  # Только если явно запрошено
-                query += " WHERE m.is_available = TRUE"
+    def get_menu_grouped(self, available_only: bool = False) -> List[Tuple[Any, List[Any]]]:
+        """Получает меню, сгруппированное по категориям
 
-            if category_id:
-                if available_only:
-                    query += " AND m.category_id = %s"
-                else:
-                    if "WHERE" in query:
-                        query += " AND m.category_id = %s"
-                    else:
-                        query += " WHERE m.category_id = %s"
-                params.append(category_id)
-
-            query += " ORDER BY c.name, m.name"
-
-            with self.connection.cursor() as cursor:
-                cursor.execute(query, params)
-                return [MenuItem(
-                    id=row[0], name=row[1], description=row[2], price=float(row[3]),
-                    category_id=row[4], category_name=row[8], is_available=row[5],
-                    unavailability_reason=row[6], calories=row[7], cooking_time=row[8]
-                ) for row in cursor.fetchall()]
+        Возвращает список (категория, блюда) в порядке названий; категории
+        без блюд тоже входят в список - с пустым списком блюд.
+        """
+        try:
+            return [(category, [item for item in items
+                                if not available_only or item.is_available])
+                    for category, items in self._menu()[0]]
         except Exception as e:
-            print(f"✗ Ошибка при получении блюд: {e}")
+            logger.error("Ошибка при получении меню: %s", e)
             return []
 
     def get_menu_item_by_id(self, item_id: int) -> Optional[Any]:
         """Получает блюдо по ID"""
-        from models import MenuItem
-
         try:
-            with self.connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT m.id, m.name, m.description, m.price, m.category_id,
-                           m.is_available, m.unavailability_reason, m.calories, m.cooking_time_minutes,
-                           c.name as category_name
-                    FROM menu_items m
-                    JOIN categories c ON m.category_id = c.id
-                    WHERE m.id = %s
-                """, (item_id,))
-                row = cursor.fetchone()
-
-                if row:
-                    return MenuItem(
-                        id=row[0], name=row[1], description=row[2], price=float(row[3]),
-                        category_id=row[4], category_name=row[8], is_available=row[5],
-                        unavailability_reason=row[6], calories=row[7], cooking_time=row[8]
-                    )
-                return None
+            return self._menu()[1].get(item_id)
         except Exception as e:
-            print(f"✗ Ошибка при получении блюда по ID: {e}")
+            logger.error("Ошибка при получении блюда по ID: %s", e)
             return None
 
+    @retry_on_disconnect
     def find_or_create_customer(self, name: str, phone: str,
-                               email: str = "", address: str = "") -> Any:
-        """Находит существующего клиента или создает нового"""
+                               email: str = "", address: str = "",
+                               commit: bool = True) -> Any:
+        """Находит клиента по телефону или создает нового одним запросом
+
+        При commit=False транзакция не фиксируется - так вызов внутри
+        transaction() сохраняет клиента вместе с заказом.
+        """
         from models import Customer
 
         try:
-            with self.connection.cursor() as cursor:
-                # Пытаемся найти по телефону
-                cursor.execute(
-                    "SELECT id, name, phone, email, address FROM customers WHERE phone = %s",
-                    (phone,)
-                )
-                row = cursor.fetchone()
-
-                if row:
-                    return Customer(
-                        id=row[0], name=row[1], phone=row[2], email=row[3], address=row[4]
-                    )
-
-                # Создаем нового клиента
+            with self._connection() as conn, conn.cursor() as cursor:
+                # Вставка с ON CONFLICT атомарна: параллельные кассы с одним
+                # телефоном не упадут на UNIQUE, а получат ту же запись.
+                # Пустой DO UPDATE нужен, чтобы RETURNING вернул существующую строку
                 cursor.execute("""
                     INSERT INTO customers (name, phone, email, address)
                     VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (phone) DO UPDATE SET phone = EXCLUDED.phone
                     RETURNING id, name, phone, email, address
                 """, (name, phone, email, address))
 
                 row = cursor.fetchone()
-                self.connection.commit()
+                if commit:
+                    self._commit(conn)
 
                 return Customer(
                     id=row[0], name=row[1], phone=row[2], email=row[3], address=row[4]
                 )
         except Exception as e:
-            self.connection.rollback()
-            print(f"✗ Ошибка при поиске/создании клиента: {e}")
+            logger.error("Ошибка при поиске/создании клиента: %s", e)
             raise
 
     def create_order(self, customer_id: int, items: List[Any],
@@ -292,155 +731,349 @@ class PostgreSQLDatabase:
                     payment_method: str = "cash") -> Tuple[int, str]:
         """Создает новый заказ в базе данных"""
         try:
-            with self.connection.cursor() as cursor:
-                # Генерируем номер заказа
-                order_number = f"ORD-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:6].upper()}"
+            # Номер берем до соединения: резервирование блока занимает
+            # свое соединение из пула, и держать при этом второе нельзя
+            order_number = self.next_order_number()
 
+            with self._connection() as conn, conn.cursor() as cursor:
                 # Рассчитываем общую сумму
                 total_amount = sum(item.subtotal for item in items)
 
-                # Создаем заказ
-                cursor.execute("""
-                    INSERT INTO orders 
-                    (order_number, customer_id, total_amount, delivery_address, notes, payment_method)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    RETURNING id
-                """, (order_number, customer_id, total_amount, delivery_address, notes, payment_method))
+                # Заказ и все его позиции записываем одним запросом:
+                # позиции передаются массивами и разворачиваются через unnest
+                self.statements.execute(cursor, "create_order", """
+                    WITH new_order AS (
+                        INSERT INTO orders
+                        (order_number, customer_id, total_amount, delivery_address, notes, payment_method)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        RETURNING id
+                    ), new_items AS (
+                        INSERT INTO order_items
+                        (order_id, menu_item_id, quantity, price_at_order)
+                        SELECT new_order.id, line.menu_item_id, line.quantity, line.price_at_order
+                        FROM new_order,
+                             unnest(%s::INTEGER[], %s::INTEGER[], %s::DECIMAL[]) WITH ORDINALITY
+                                 AS line(menu_item_id, quantity, price_at_order, line_no)
+                        ORDER BY line.line_no
+                    )
+                    SELECT id FROM new_order
+                """, (order_number, customer_id, total_amount, delivery_address, notes, payment_method,
+                      [item.menu_item_id for item in items],
+                      [item.quantity for item in items],
+                      [item.price_at_order for item in items]))
 
                 order_id = cursor.fetchone()[0]
 
-                # Добавляем позиции заказа
-                for item in items:
-                    cursor.execute("""
-                        INSERT INTO order_items 
-                        (order_id, menu_item_id, quantity, price_at_order)
-                        VALUES (%s, %s, %s, %s)
-                    """, (order_id, item.menu_item_id, item.quantity, item.price_at_order))
-
-                self.connection.commit()
-                print(f"✓ Заказ создан: {order_number}")
+                self._commit(conn)
+                logger.info("Заказ создан: %s", order_number, extra={'order_number': order_number})
                 return order_id, order_number
 
         except Exception as e:
-            self.connection.rollback()
-            print(f"✗ Ошибка при создании заказа: {e}")
+            logger.error("Ошибка при создании заказа: %s", e)
             raise
 
-    def get_order_by_number(self, order_number: str) -> Optional[Dict[str, Any]]:
-        """Получает детали заказа по номеру"""
+    def next_order_number(self) -> str:
+        """Выдает номер заказа из блока, зарезервированного в order_number_seq"""
+        return self._order_numbers.next(self._reserve_order_numbers)
+
+    def _reserve_order_numbers(self) -> Tuple[int, int]:
+        """Резервирует блок номеров: (первый номер, размер блока)"""
         try:
-            with self.connection.cursor() as cursor:
-                # Получаем основную информацию о заказе
-                cursor.execute("""
-                    SELECT o.id, o.order_number, o.total_amount, o.status, o.created_at,
-                           c.name as customer_name, c.phone, c.email,
-                           o.delivery_address, o.notes, o.payment_method
-                    FROM orders o
-                    JOIN customers c ON o.customer_id = c.id
-                    WHERE o.order_number = %s
-                """, (order_number,))
-
-                order_row = cursor.fetchone()
-                if not order_row:
-                    return None
-
-                # Получаем позиции заказа
+            # Повтор безопасен: блок, выданный оборванному вызову, просто пропадет
+            return self.retry_policy.run(self._reserve_order_block)
+        except DISCONNECT_ERRORS as e:
+            raise DatabaseUnavailableError(str(e)) from e
+
+    def _reserve_order_block(self) -> Tuple[int, int]:
+        # Отдельное соединение из пула: nextval не откатывается, и
+        # резервирование не должно зависеть от транзакции вызывающего
+        conn = self.pool.getconn()
+        broken = False
+        try:
+            with conn.cursor() as cursor:
+                # Шаг - у той же последовательности, что и у nextval (по
+                # search_path): одноименная в другой схеме не подмешается
                 cursor.execute("""
-                    SELECT oi.menu_item_id, oi.quantity, oi.price_at_order, oi.subtotal,
-                           m.name as item_name
-                    FROM order_items oi
-                    JOIN menu_items m ON oi.menu_item_id = m.id
-                    WHERE oi.order_id = %s
-                    ORDER BY oi.id
-                """, (order_row[0],))
-
-                items = []
-                for row in cursor.fetchall():
-                    items.append({
-                        'item_id': row[0],
-                        'item_name': row[4],
-                        'quantity': row[1],
-                        'price': float(row[2]),
-                        'subtotal': float(row[3])
-                    })
-
-                return {
-                    'order_id': order_row[0],
-                    'order_number': order_row[1],
-                    'total_amount': float(order_row[2]),
-                    'status': order_row[3],
-                    'created_at': order_row[4],
-                    'customer_name': order_row[5],
-                    'customer_phone': order_row[6],
-                    'customer_email': order_row[7],
-                    'delivery_address': order_row[8],
-                    'notes': order_row[9],
-                    'payment_method': order_row[10],
-                    'items': items
-                }
-        except Exception as e:
-            print(f"✗ Ошибка при получении заказа: {e}")
-            return None
+                    SELECT nextval('order_number_seq'), seqincrement
+                    FROM pg_sequence WHERE seqrelid = 'order_number_seq'::regclass
+                """)
+                start, size = cursor.fetchone()
+            conn.commit()
+            return start, size
+        except DISCONNECT_ERRORS:
+            broken = True
+            self.pool.mark_suspect()
+            raise
+        finally:
+            self.pool.putconn(conn, close=broken)
+
+    def place_order(self, name: str, phone: str, items: List[Any],
+                    email: str = "", address: str = "", notes: str = "",
+                    payment_method: str = "cash",
+                    order_number: Optional[str] = None) -> Tuple[int, str, float]:
+        """Оформляет заказ целиком на сервере за один запрос
+
+        Клиент находится или создается по телефону, позиции переоцениваются
+        по текущему меню, недоступные блюда отклоняются. Повторный вызов с
+        тем же order_number возвращает уже созданный заказ. Возвращает
+        (order_id, order_number, total_amount).
+
+        При ORDER_WRITE_BEHIND=1 заказ фиксируется вместе с другими заказами
+        пачкой (write_behind.py); вызов ждет фиксации своей пачки.
+        """
+        if self._write_behind is not None and getattr(self._local, 'connection', None) is None:
+            return self._write_behind.place_order(name, phone, items, email, address, notes,
+                                                  payment_method, order_number=order_number)
+        return self._place_order(name, phone, items, email, address, notes,
+                                 payment_method, order_number)
+
+    def _place_order(self, name: str, phone: str, items: List[Any],
+                     email: str = "", address: str = "", notes: str = "",
+                     payment_method: str = "cash",
+                     order_number: Optional[str] = None) -> Tuple[int, str, float]:
+        order_number = order_number or self.next_order_number()
+        lines = json.dumps([{'menu_item_id': item.menu_item_id, 'quantity': item.quantity}
+                            for item in items])
 
-    def get_all_orders(self, limit: int = 50) -> List[Dict[str, Any]]:
-        """Получает все заказы"""
         try:
-            with self.connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT o.order_number, o.created_at, o.total_amount, o.status,
-                           c.name as customer_name
-                    FROM orders o
-                    JOIN customers c ON o.customer_id = c.id
-                    ORDER BY o.created_at DESC
-                    LIMIT %s
-                """, (limit,))
-
-                orders = []
-                for row in cursor.fetchall():
-                    orders.append({
-                        'order_number': row[0],
-                        'created_at': row[1],
-                        'total_amount': float(row[2]),
-                        'status': row[3],
-                        'customer_name': row[4]
-                    })
-
-                return orders
+            order_id, order_number, total_amount = self._call_place_order(
+                name, phone, email, address, order_number, lines, notes, payment_method)
+            logger.info("Заказ создан: %s", order_number, extra={'order_number': order_number})
+            return order_id, order_number, float(total_amount)
+
+        except psycopg2.errors.RaiseException as e:
+            # Отказ, сформированный самой функцией (пустой заказ, недоступные блюда)
+            logger.warning("Заказ отклонен: %s", e.diag.message_primary,
+                           extra={'order_number': order_number})
+            raise ValueError(e.diag.message_primary) from e
+        except DISCONNECT_ERRORS as e:
+            logger.error("База недоступна при оформлении заказа: %s", e,
+                         extra={'order_number': order_number})
+            raise DatabaseUnavailableError(str(e)) from e
         except Exception as e:
-            print(f"✗ Ошибка при получении всех заказов: {e}")
-            # Пытаемся восстановить соединение
-            self._reconnect()
+            logger.error("Ошибка при оформлении заказа: %s", e)
+            raise
+
+    @retry_on_disconnect
+    def _call_place_order(self, name: str, phone: str, email: str, address: str,
+                          order_number: str, lines: str, notes: str,
+                          payment_method: str) -> Tuple[int, str, Any]:
+        """Вызывает функцию place_order; повтор безопасен, номер заказа тот же"""
+        with self._connection() as conn, conn.cursor() as cursor:
+            self.statements.execute(
+                cursor, "place_order",
+                "SELECT * FROM place_order(%s, %s, %s, %s, %s, %s::jsonb, %s, %s, %s)",
+                (name, phone, email, address, order_number, lines,
+                 address, notes, payment_method)
+            )
+            row = cursor.fetchone()
+            self._commit(conn)
+            return row
+
+    def place_orders(self, orders: List[Dict[str, Any]]
+                     ) -> List[Union[Tuple[int, str, float], Exception]]:
+        """Оформляет пачку заказов функцией place_orders за один запрос
+
+        Пачка - одна транзакция и один обмен с сервером; каждый заказ
+        выполняется в своем блоке исключений, и отказ по одному не отменяет
+        остальные. Возвращает по элементу на заказ: (order_id, order_number,
+        total_amount), ValueError для отказа или DatabaseError для ошибки
+        этого заказа.
+        """
+        if not orders:
             return []
 
-    def _reconnect(self):
-        """Переподключается к базе данных в случае ошибки"""
+        payload = json.dumps([{
+            'name': order['name'],
+            'phone': order['phone'],
+            'email': order.get('email', ""),
+            'address': order.get('address', ""),
+            'notes': order.get('notes', ""),
+            'payment_method': order.get('payment_method', "cash"),
+            'order_number': order.get('order_number') or self.next_order_number(),
+            'items': [{'menu_item_id': item.menu_item_id, 'quantity': item.quantity}
+                      for item in order['items']]
+        } for order in orders])
+
+        try:
+            rows = self._call_place_orders(payload)
+        except DISCONNECT_ERRORS as e:
+            logger.error("База недоступна при оформлении пачки заказов: %s", e)
+            raise DatabaseUnavailableError(str(e)) from e
+
+        results: List[Any] = [None] * len(orders)
+        for index, order_id, order_number, total_amount, error_code, error in rows:
+            if error_code == errorcodes.RAISE_EXCEPTION:
+                # Отказ, сформированный самой функцией (пустой заказ, недоступные блюда)
+                results[index] = ValueError(error)
+            elif error_code is not None:
+                results[index] = psycopg2.DatabaseError(f"{error_code}: {error}")
+            else:
+                results[index] = (order_id, order_number, float(total_amount))
+        return results
+
+    @retry_on_disconnect
+    def _call_place_orders(self, payload: str) -> List[Tuple]:
+        """Вызывает функцию place_orders; повтор безопасен, номера заказов те же"""
+        with self._connection() as conn, conn.cursor() as cursor:
+            self.statements.execute(cursor, "place_orders",
+                                    "SELECT * FROM place_orders(%s::jsonb)", (payload,))
+            rows = cursor.fetchall()
+            self._commit(conn)
+            return rows
+
+    def get_order_by_number(self, order_number: str) -> Optional[Dict[str, Any]]:
+        """Получает детали заказа по номеру одним запросом"""
         try:
-            if self.connection:
-                self.connection.close()
-            self._connect()
-            print("✓ Соединение с PostgreSQL восстановлено")
+            orders = self._fetch_order_details("order_by_number", "o.order_number = %s",
+                                               (order_number,))
+            return orders[0] if orders else None
         except Exception as e:
-            print(f"✗ Не удалось восстановить соединение: {e}")
+            logger.error("Ошибка при получении заказа: %s", e)
+            return None
+
+    def get_orders_by_numbers(self, order_numbers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Получает детали нескольких заказов одним запросом
+
+        Возвращает словарь номер заказа -> детали; ненайденных номеров в нем нет.
+        """
+        if not order_numbers:
+            return {}
+
+        try:
+            orders = self._fetch_order_details("orders_by_numbers", "o.order_number = ANY(%s::TEXT[])",
+                                               (list(order_numbers),))
+            return {order['order_number']: order for order in orders}
+        except Exception as e:
+            logger.error("Ошибка при получении заказов: %s", e)
+            return {}
+
+    @retry_on_disconnect
+    def _fetch_order_details(self, name: str, condition: str,
+                             params: Tuple) -> List[Dict[str, Any]]:
+        """Читает заказы вместе с позициями: позиции собираются в JSON на сервере
+
+        name - имя подготовленного запроса; у каждого condition оно свое.
+        """
+        with self._connection() as conn, conn.cursor() as cursor:
+            self.statements.execute(cursor, name, f"""
+                SELECT o.id, o.order_number, o.total_amount, o.status, o.created_at,
+                       c.name as customer_name, c.phone, c.email,
+                       o.delivery_address, o.notes, o.payment_method,
+                       COALESCE(lines.items, '[]'::json) as items
+                FROM orders o
+                JOIN customers c ON o.customer_id = c.id
+                LEFT JOIN LATERAL (
+                    SELECT json_agg(json_build_object(
+                               'item_id', oi.menu_item_id,
+                               'item_name', m.name,
+                               'quantity', oi.quantity,
+                               'price', oi.price_at_order,
+                               'subtotal', oi.subtotal
+                           ) ORDER BY oi.id) as items
+                    FROM order_items oi
+                    JOIN menu_items m ON oi.menu_item_id = m.id
+                    WHERE oi.order_id = o.id
+                ) lines ON TRUE
+                WHERE {condition}
+            """, params)
+
+            return [_order_details_from_row(row) for row in cursor.fetchall()]
+
+    def get_orders_page(self, limit: int = 50, cursor: Optional[str] = None,
+                        status: Optional[str] = None,
+                        start_date: Optional[str] = None,
+                        end_date: Optional[str] = None,
+                        customer_id: Optional[int] = None
+                        ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Получает страницу заказов от новых к старым
+
+        Пагинация по ключу (created_at, id): следующая страница читается от
+        места остановки по индексу, поэтому глубокие страницы не дороже
+        первой. Возвращает (заказы, курсор следующей страницы или None).
+        """
+        try:
+            conditions = []
+            params: List[Any] = []
+
+            if cursor:
+                created_at, order_id = _decode_page_cursor(cursor)
+                conditions.append("(o.created_at, o.id) < (%s, %s)")
+                params.extend([created_at, order_id])
+
+            if status:
+                conditions.append("o.status = %s")
+                params.append(status)
+
+            if start_date:
+                conditions.append("o.created_at >= %s")
+                params.append(start_date)
+
+            if end_date:
+                conditions.append("o.created_at <= %s")
+                params.append(end_date)
+
+            if customer_id:
+                conditions.append("o.customer_id = %s")
+                params.append(customer_id)
+
+            where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+            # Одна лишняя строка показывает, есть ли следующая страница
+            params.append(limit + 1)
+
+            rows = self._fetch_orders_page(where, params)
+
+            orders = []
+            for row in rows[:limit]:
+                orders.append({
+                    'order_id': row[0],
+                    'order_number': row[1],
+                    'created_at': row[2],
+                    'total_amount': float(row[3]),
+                    'status': row[4],
+                    'customer_name': row[5]
+                })
+
+            next_cursor = None
+            if len(rows) > limit:
+                last = rows[limit - 1]
+                next_cursor = _encode_page_cursor(last[2], last[0])
+
+            return orders, next_cursor
+        except Exception as e:
+            logger.error("Ошибка при получении заказов: %s", e)
+            return [], None
+
+    @retry_on_disconnect
+    def _fetch_orders_page(self, where: str, params: List[Any]) -> List[Tuple]:
+        with self._connection() as conn, conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT o.id, o.order_number, o.created_at, o.total_amount, o.status,
+                       c.name as customer_name
+                FROM orders o
+                JOIN customers c ON o.customer_id = c.id
+                {where}
+                ORDER BY o.created_at DESC, o.id DESC
+                LIMIT %s
+            """, params)
+            return cursor.fetchall()
 
     def update_order_status(self, order_id: int, status: str) -> bool:
         """Обновляет статус заказа"""
-        allowed_statuses = ['pending', 'confirmed', 'preparing', 'delivering', 'delivered', 'cancelled']
-
-        if status not in allowed_statuses:
-            print(f"✗ Неверный статус. Допустимые: {', '.join(allowed_statuses)}")
+        if status not in ORDER_STATUSES:
+            logger.warning("Неверный статус. Допустимые: %s", ', '.join(ORDER_STATUSES))
             return False
 
         try:
-            with self.connection.cursor() as cursor:
+            with self._connection() as conn, conn.cursor() as cursor:
                 cursor.execute(
                     "UPDATE orders SET status = %s WHERE id = %s",
                     (status, order_id)
                 )
-                self.connection.commit()
+                self._commit(conn)
                 return cursor.rowcount > 0
         except Exception as e:
-            self.connection.rollback()
-            print(f"✗ Ошибка при обновлении статуса: {e}")
+            logger.error("Ошибка при обновлении статуса: %s", e)
             return False
 
     def add_menu_item(self, name: str, description: str, price: float,
@@ -448,25 +1081,25 @@ class PostgreSQLDatabase:
                      cooking_time: Optional[int] = None) -> bool:
         """Добавляет новое блюдо в меню"""
         try:
-            with self.connection.cursor() as cursor:
+            with self._connection() as conn, conn.cursor() as cursor:
                 cursor.execute("""
                     INSERT INTO menu_items 
                     (name, description, price, category_id, calories, cooking_time_minutes)
                     VALUES (%s, %s, %s, %s, %s, %s)
                 """, (name, description, price, category_id, calories, cooking_time))
 
-                self.connection.commit()
+                self._commit(conn)
+                self._invalidate_menu()
                 return True
         except Exception as e:
-            self.connection.rollback()
-            print(f"✗ Ошибка при добавлении блюда: {e}")
+            logger.error("Ошибка при добавлении блюда: %s", e)
             return False
 
     def update_menu_item_availability(self, item_id: int, is_available: bool,
                                     unavailability_reason: Optional[str] = None) -> bool:
         """Обновляет доступность блюда с указанием причины"""
         try:
-            with self.connection.cursor() as cursor:
+            with self._connection() as conn, conn.cursor() as cursor:
                 if is_available:
                     # Если блюдо становится доступным, очищаем причину
                     cursor.execute(
@@ -480,62 +1113,45 @@ class PostgreSQLDatabase:
                         (unavailability_reason, item_id)
                     )
 
-                self.connection.commit()
+                self._commit(conn)
+                self._invalidate_menu()
                 return cursor.rowcount > 0
         except Exception as e:
-            self.connection.rollback()
-            print(f"✗ Ошибка при обновлении блюда: {e}")
+            logger.error("Ошибка при обновлении блюда: %s", e)
             return False
 
+    def _invalidate_menu(self) -> None:
+        """Сбрасывает кэш меню сразу, не дожидаясь уведомления"""
+        if self.menu_cache is not None:
+            self.menu_cache.invalidate()
+
     def get_order_statistics(self, start_date: Optional[str] = None,
                            end_date: Optional[str] = None) -> Dict[str, Any]:
         """Получает статистику по заказам"""
         try:
-            query = """
-                SELECT 
-                    COUNT(*) as total_orders,
-                    SUM(total_amount) as total_revenue,
-                    AVG(total_amount) as avg_order_value,
-                    COUNT(DISTINCT customer_id) as unique_customers
-                FROM orders
-                WHERE status != 'cancelled'
-            """
+            # Период применяется и к итогам, и к популярным блюдам
+            period = ""
             params = []
 
             if start_date:
-                query += " AND created_at >= %s"
+                period += " AND o.created_at >= %s"
                 params.append(start_date)
 
             if end_date:
-                query += " AND created_at <= %s"
+                period += " AND o.created_at <= %s"
                 params.append(end_date)
 
-            with self.connection.cursor() as cursor:
-                cursor.execute(query, params)
-                row = cursor.fetchone()
+            row, popular_items = self._fetch_order_statistics(period, params)
 
-                # Популярные блюда
-                cursor.execute("""
-                    SELECT m.name, SUM(oi.quantity) as total_quantity
-                    FROM order_items oi
-                    JOIN menu_items m ON oi.menu_item_id = m.id
-                    JOIN orders o ON oi.order_id = o.id
-                    WHERE o.status != 'cancelled'
-                    GROUP BY m.name
-                    ORDER BY total_quantity DESC
-                    LIMIT 10
-                """)
-                popular_items = [(row[0], row[1]) for row in cursor.fetchall()]
-
-                return {
-                    'total_orders': row[0] or 0,
-                    'total_revenue': float(row[1] or 0),
-                    'avg_order_value': float(row[2] or 0),
-                    'unique_customers': row[3] or 0,
-                    'popular_items': popular_items
-                }
+            return {
+                'total_orders': row[0] or 0,
+                'total_revenue': float(row[1] or 0),
+                'avg_order_value': float(row[2] or 0),
+                'unique_customers': row[3] or 0,
+                'popular_items': popular_items
+            }
         except Exception as e:
-            print(f"✗ Ошибка при получении статистики: {e}")
+            logger.error("Ошибка при получении статистики: %s", e)
             return {
                 'total_orders': 0,
                 'total_revenue': 0.0,
@@ -544,12 +1160,44 @@ class PostgreSQLDatabase:
                 'popular_items': []
             }
 
+    @retry_on_disconnect
+    def _fetch_order_statistics(self, period: str,
+                                params: List[Any]) -> Tuple[Tuple, List[Tuple[str, int]]]:
+        with self._connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT 
+                    COUNT(*) as total_orders,
+                    SUM(o.total_amount) as total_revenue,
+                    AVG(o.total_amount) as avg_order_value,
+                    COUNT(DISTINCT o.customer_id) as unique_customers
+                FROM orders o
+                WHERE o.status != 'cancelled'
+            """ + period, params)
+            totals = cursor.fetchone()
+
+            # Популярные блюда
+            cursor.execute("""
+                SELECT m.name, SUM(oi.quantity) as total_quantity
+                FROM order_items oi
+                JOIN menu_items m ON oi.menu_item_id = m.id
+                JOIN orders o ON oi.order_id = o.id
+                WHERE o.status != 'cancelled'
+            """ + period + """
+                GROUP BY m.name
+                ORDER BY total_quantity DESC
+                LIMIT 10
+            """, params)
+            return totals, [(row[0], row[1]) for row in cursor.fetchall()]
+
     def close(self):
-        """Закрывает соединение с базой данных"""
-        if self.connection:
+        """Закрывает все соединения с базой данных"""
+        if self._write_behind:
+            self._write_behind.close()
+        if self._menu_listener:
+            self._menu_listener.stop()
+        if self.pool:
             try:
-                self.connection.rollback()  # Откатываем любые незавершенные транзакции
-                self.connection.close()
-                print("✓ Соединение с PostgreSQL закрыто")
+                self.pool.closeall()
+                logger.info("Соединения с PostgreSQL закрыты")
             except Exception as e:
-                print(f"⚠ Ошибка при закрытии соединения: {e}")
+                logger.warning("Ошибка при закрытии соединений: %s", e)
@@ -0,0 +1,292 @@
+"""
+gui_tables.py
+Инкрементальное обновление таблиц ttk.Treeview
+
+TreeSync сверяет строки таблицы с новым списком по ключу строки (iid) и
+меняет в Tk только то, что изменилось: удаляет исчезнувшие строки, вставляет
+новые, переставляет сдвинувшиеся и обновляет значения измененных. Число
+вызовов Tk пропорционально числу изменений, а не размеру таблицы; выбор и
+позиция прокрутки сохраняются.
+
+VirtualTreeview держит в Tk только строки около видимой области большого
+списка: прокрутка сдвигает окно строк через TreeSync, а при подходе к
+концу загруженных данных запрашивается следующая страница.
+"""
+
+from bisect import bisect_left
+from tkinter import font, ttk
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+
+def _longest_increasing(sequence: Sequence[int]) -> Set[int]:
+    """Позиции элементов наибольшей возрастающей подпоследовательности"""
+    tails: List[int] = []      # последний элемент подпоследовательности длины k + 1
+    tail_positions: List[int] = []
+    previous: List[int] = [-1] * len(sequence)
+
+    for position, value in enumerate(sequence):
+        k = bisect_left(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tail_positions.append(position)
+        else:
+            tails[k] = value
+            tail_positions[k] = position
+        previous[position] = tail_positions[k - 1] if k else -1
+
+    result = set()
+    position = tail_positions[-1] if tail_positions else -1
+    while position != -1:
+        result.add(position)
+        position = previous[position]
+    return result
+
+
+class TreeSync:
+    """Строки ttk.Treeview верхнего уровня, синхронизируемые со списком по ключу
+
+    Таблицу меняет только TreeSync: значения строк он помнит сам и не
+    читает их из Tk.
+    """
+
+    def __init__(self, tree: Any, keep_scroll: bool = True):
+        self.tree = tree
+        self.keep_scroll = keep_scroll
+        self._values: Dict[str, Tuple] = {}
+
+        # Метрики: число изменений последней и всех сверок
+        self.last_changes = 0
+        self.total_changes = 0
+
+    def sync(self, rows: Iterable[Tuple[str, Tuple]]) -> int:
+        """Приводит таблицу к строкам rows: [(iid, values), ...]; возвращает число изменений"""
+        rows = list(rows)
+        position = {iid: index for index, (iid, _) in enumerate(rows)}
+        current = self.tree.get_children()
+        selection = self.tree.selection()
+        top = self._top_row(current) if self.keep_scroll else None
+
+        removed = [iid for iid in current if iid not in position]
+        if removed:
+            self.tree.delete(*removed)
+            for iid in removed:
+                self._values.pop(iid, None)
+
+        # Строки наибольшей подпоследовательности, уже стоящей в нужном порядке,
+        # остаются на месте; остальные отцепляются и вставляются заново
+        kept = [iid for iid in current if iid in position]
+        staying = {kept[k] for k in _longest_increasing([position[iid] for iid in kept])}
+        moved = [iid for iid in kept if iid not in staying]
+        if moved:
+            self.tree.detach(*moved)
+
+        changes = len(removed)
+        for index, (iid, values) in enumerate(rows):
+            if iid not in self._values:
+                self.tree.insert("", index, iid=iid, values=values)
+                self._values[iid] = values
+                changes += 1
+                continue
+            # Перед index стоят ровно строки rows[:index]: отцепленная строка
+            # возвращается точно на свое место
+            if iid not in staying:
+                self.tree.move(iid, "", index)
+                changes += 1
+            if self._values[iid] != values:
+                self.tree.item(iid, values=values)
+                self._values[iid] = values
+                changes += 1
+
+        if moved:
+            # Отцепленные строки выпадают из выбора: восстанавливаем его
+            kept_selection = [iid for iid in selection if iid in position]
+            if set(self.tree.selection()) != set(kept_selection):
+                self.tree.selection_set(kept_selection)
+
+        if changes and top is not None and top in position:
+            # Верхняя видимая строка остается наверху
+            self.tree.yview_moveto(position[top] / len(rows))
+
+        self.last_changes = changes
+        self.total_changes += changes
+        return changes
+
+    def _top_row(self, current: Sequence[str]) -> Optional[str]:
+        """Ключ верхней видимой строки по положению прокрутки"""
+        if not current:
+            return None
+        first, _ = self.tree.yview()
+        return current[min(round(float(first) * len(current)), len(current) - 1)]
+
+    def clear(self) -> None:
+        """Удаляет все строки таблицы"""
+        self.sync([])
+
+
+class VirtualTreeview:
+    """Виртуальный список строк в ttk.Treeview: в Tk - только видимое окно
+
+    Все строки [(iid, values), ...] хранятся в Python, а в таблице - лишь
+    visible + OVERSCAN строк начиная с first. Полосу прокрутки, колесо мыши
+    и стрелки обрабатывает VirtualTreeview, сдвигая окно; выбор строк,
+    ушедших из окна, он помнит сам. fetch_more() вызывается, когда окно
+    подходит к концу загруженных строк, а источник сообщил, что есть еще;
+    ответ передается в append_rows() или loading_failed().
+    """
+
+    # Строки ниже видимой области: частично видимая последняя строка
+    OVERSCAN = 2
+    # За сколько строк до конца загруженного запрашивать следующую страницу
+    PREFETCH = 50
+    # Строк на один шаг колеса мыши
+    WHEEL_ROWS = 3
+
+    def __init__(self, tree: Any, scrollbar: Any,
+                 fetch_more: Optional[Callable[[], None]] = None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.fetch_more = fetch_more
+        self.rows: List[Tuple[str, Tuple]] = []
+        self.first = 0
+        self.visible = int(tree.cget("height"))
+        self.has_more = False
+        self._index: Dict[str, int] = {}
+        self._selected: List[str] = []
+        self._fetching = False
+        self._window = TreeSync(tree, keep_scroll=False)
+
+        # Прокруткой управляет окно строк, а не сама таблица
+        tree.configure(yscrollcommand="")
+        scrollbar.configure(command=self.yview)
+        tree.bind("<MouseWheel>", self._on_wheel)
+        tree.bind("<Button-4>", lambda e: self._scroll(-self.WHEEL_ROWS))
+        tree.bind("<Button-5>", lambda e: self._scroll(self.WHEEL_ROWS))
+        tree.bind("<Up>", lambda e: self._step(-1))
+        tree.bind("<Down>", lambda e: self._step(1))
+        tree.bind("<Prior>", lambda e: self._step(-self.visible))
+        tree.bind("<Next>", lambda e: self._step(self.visible))
+        tree.bind("<Configure>", self._on_resize, add="+")
+
+    def set_rows(self, rows: Iterable[Tuple[str, Tuple]], has_more: bool = False,
+                 keep_position: bool = True) -> None:
+        """Заменяет строки; при keep_position верхняя строка окна остается наверху"""
+        top = self.rows[self.first][0] if keep_position and self.first < len(self.rows) else None
+        self.rows = list(rows)
+        self._index = {iid: index for index, (iid, _) in enumerate(self.rows)}
+        self.has_more = has_more
+        self._fetching = False
+        self.first = self._index.get(top, self.first) if keep_position else 0
+        self._render()
+
+    def append_rows(self, rows: Iterable[Tuple[str, Tuple]], has_more: bool) -> None:
+        """Добавляет следующую страницу строк в конец списка"""
+        for row in rows:
+            self._index[row[0]] = len(self.rows)
+            self.rows.append(row)
+        self.has_more = has_more
+        self._fetching = False
+        self._render()
+
+    def loading_failed(self) -> None:
+        """Страница не загрузилась: следующая прокрутка к концу запросит ее снова"""
+        self._fetching = False
+
+    def selection(self) -> Tuple[str, ...]:
+        """Выбранные строки, включая ушедшие из окна"""
+        return tuple(self._merged_selection())
+
+    def values(self, iid: str) -> Optional[Tuple]:
+        """Значения строки по ключу, даже если ее нет в окне"""
+        index = self._index.get(iid)
+        return self.rows[index][1] if index is not None else None
+
+    def see(self, iid: str) -> None:
+        """Прокручивает окно так, чтобы строка iid была видна"""
+        index = self._index.get(iid)
+        if index is None:
+            return
+        if index < self.first:
+            self._move_to(index)
+        elif index >= self.first + self.visible:
+            self._move_to(index - self.visible + 1)
+
+    def yview(self, *args: Any) -> None:
+        """Команда полосы прокрутки: moveto доля | scroll n units|pages"""
+        if args[0] == "moveto":
+            self._move_to(int(float(args[1]) * len(self.rows)))
+        elif args[0] == "scroll":
+            step = int(args[1]) * (self.visible if args[2] == "pages" else 1)
+            self._scroll(step)
+
+    def _merged_selection(self) -> List[str]:
+        """Выбор в таблице, а если он пуст - запомненный выбор строк вне окна"""
+        selection = self.tree.selection()
+        if selection:
+            return list(selection)
+        window = set(self.tree.get_children())
+        return [iid for iid in self._selected if iid not in window and iid in self._index]
+
+    def _scroll(self, step: int) -> str:
+        self._move_to(self.first + step)
+        return "break"
+
+    def _move_to(self, first: int) -> None:
+        first = max(0, min(first, len(self.rows) - self.visible))
+        if first != self.first:
+            self.first = first
+            self._render()
+
+    def _render(self) -> None:
+        """Показывает в таблице окно строк и обновляет полосу прокрутки"""
+        self._selected = self._merged_selection()
+        self.first = max(0, min(self.first, len(self.rows) - self.visible))
+        window = self.rows[self.first:self.first + self.visible + self.OVERSCAN]
+        self._window.sync(window)
+
+        # Выбор строк, вернувшихся в окно, восстанавливается
+        in_window = {iid for iid, _ in window}
+        selected = [iid for iid in self._selected if iid in in_window]
+        if set(self.tree.selection()) != set(selected):
+            self.tree.selection_set(selected)
+        self.tree.yview_moveto(0)
+
+        total = max(len(self.rows), 1)
+        self.scrollbar.set(self.first / total, min(self.first + self.visible, total) / total)
+
+        if (self.has_more and not self._fetching and self.fetch_more is not None
+                and self.first + self.visible + self.PREFETCH >= len(self.rows)):
+            self._fetching = True
+            self.fetch_more()
+
+    def _step(self, step: int) -> str:
+        """Стрелки и Page Up/Down: перемещают выбор по всему списку"""
+        focus = self.tree.focus()
+        index = self._index.get(focus, self.first - 1 if step > 0 else self.first)
+        target = max(0, min(index + step, len(self.rows) - 1))
+        if not self.rows:
+            return "break"
+        iid = self.rows[target][0]
+        self.see(iid)
+        self._selected = [iid]
+        self.tree.selection_set(iid)
+        self.tree.focus(iid)
+        return "break"
+
+    def _on_wheel(self, event: Any) -> str:
+        # Windows присылает delta кратно 120, macOS - единицы
+        notches = event.delta // 120 if abs(event.delta) >= 120 else (1 if event.delta > 0 else -1)
+        return self._scroll(-notches * self.WHEEL_ROWS)
+
+    def _row_height(self) -> int:
+        """Высота строки таблицы: из стиля, иначе по шрифту"""
+        row_height = ttk.Style(self.tree).lookup(self.tree.winfo_class(), "rowheight")
+        if row_height:
+            return int(row_height)
+        return font.nametofont("TkDefaultFont").metrics("linespace") + 4
+
+    def _on_resize(self, event: Any) -> None:
+        """Пересчитывает число видимых строк по высоте таблицы (без строки заголовков)"""
+        visible = max(1, event.height // self._row_height() - 1)
+        if visible != self.visible:
+            self.visible = visible
+            self._render()
@@ -0,0 +1,177 @@
+"""
+gui_tasks.py
+Фоновое выполнение запросов к хранилищу для GUI на Tkinter
+
+Обработчики Tk вызывают TaskExecutor.submit() вместо прямого обращения к
+базе: запрос выполняется в ограниченном пуле потоков, а результат
+передается обратно в главный поток через root.after. Виджеты Tk меняются
+только в главном потоке, цикл событий не ждет сети.
+
+Задачи с одинаковым ключом заменяют друг друга: новая задача отменяет еще
+не начатую предыдущую, а результат уже выполняющейся отбрасывается (выбор
+другой строки делает устаревшими детали прежней). Результат отбрасывается
+и тогда, когда окно, для которого он запрошен, уже закрыто.
+
+Настройка переменными окружения:
+    GUI_DB_WORKERS    - число потоков пула (по умолчанию 4)
+    GUI_DB_LATENCY_MS - искусственная задержка каждой задачи, мс; для
+                        проверки отзывчивости при медленной базе
+"""
+
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app_logging import get_logger
+
+logger = get_logger("gui_tasks")
+
+# Интервал опроса готовых результатов: кадр при 60 кадрах в секунду
+POLL_INTERVAL_MS = 16
+
+
+class TaskExecutor:
+    """Пул потоков для запросов GUI с доставкой результатов в главный поток Tk"""
+
+    def __init__(self, root: Any, max_workers: Optional[int] = None,
+                 latency_ms: Optional[float] = None):
+        self.root = root
+        max_workers = max_workers or int(os.getenv("GUI_DB_WORKERS", "4"))
+        if latency_ms is None:
+            latency_ms = float(os.getenv("GUI_DB_LATENCY_MS", "0"))
+        self.latency = latency_ms / 1000
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gui-db")
+        # Готовые результаты: (номер задачи, future); читает только главный поток
+        self._done: "queue.SimpleQueue[Tuple[int, Future]]" = queue.SimpleQueue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # Номер задачи -> (ключ, on_success, on_error, виджет)
+        self._callbacks: Dict[int, Tuple[Optional[str], Optional[Callable], Optional[Callable], Any]] = {}
+        # Ключ -> (номер последней задачи, ее future)
+        self._latest: Dict[str, Tuple[int, Future]] = {}
+        self._polling = False
+        self._closed = False
+
+        # Метрики
+        self.completed = 0
+        self.dropped = 0
+
+    def submit(self, func: Callable, *args: Any,
+               on_success: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[Exception], None]] = None,
+               key: Optional[str] = None, widget: Any = None, **kwargs: Any) -> Optional[Future]:
+        """Выполняет func(*args, **kwargs) в пуле; вызывать из главного потока
+
+        on_success(result) и on_error(exception) вызываются в главном потоке.
+        key - ключ замены: прежняя задача с тем же ключом отменяется или ее
+        результат отбрасывается. widget - окно или виджет, для которого
+        запрошен результат: если он уже уничтожен, результат отбрасывается.
+        Без on_error исключение записывается в журнал.
+        """
+        if self._closed:
+            return None
+
+        task_id = next(self._ids)
+        future = self._pool.submit(self._run, func, args, kwargs)
+
+        with self._lock:
+            self._callbacks[task_id] = (key, on_success, on_error, widget)
+            if key is not None:
+                previous = self._latest.get(key)
+                self._latest[key] = (task_id, future)
+                if previous is not None and previous[1].cancel():
+                    # Не начатая задача уже не выполнится: забываем ее обработчики
+                    self._callbacks.pop(previous[0], None)
+                    self.dropped += 1
+
+        future.add_done_callback(lambda f: self._done.put((task_id, f)))
+        self._schedule_poll()
+        return future
+
+    def cancel(self, key: str) -> None:
+        """Отменяет последнюю задачу с ключом key; ее результат не будет доставлен"""
+        with self._lock:
+            latest = self._latest.pop(key, None)
+            if latest is not None:
+                latest[1].cancel()
+                self._callbacks.pop(latest[0], None)
+                self.dropped += 1
+
+    def is_pending(self, key: str) -> bool:
+        """Есть ли невыполненная задача с ключом key"""
+        with self._lock:
+            latest = self._latest.get(key)
+        return latest is not None and not latest[1].done()
+
+    def _run(self, func: Callable, args: Tuple, kwargs: Dict[str, Any]) -> Any:
+        if self.latency:
+            time.sleep(self.latency)
+        return func(*args, **kwargs)
+
+    def _schedule_poll(self) -> None:
+        """Запускает опрос готовых результатов, пока есть невыполненные задачи"""
+        if not self._polling and not self._closed:
+            self._polling = True
+            self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def _poll(self) -> None:
+        self._polling = False
+        if self._closed:
+            return
+
+        while True:
+            try:
+                task_id, future = self._done.get_nowait()
+            except queue.Empty:
+                break
+            self._deliver(task_id, future)
+
+        with self._lock:
+            waiting = bool(self._callbacks)
+        if waiting:
+            self._schedule_poll()
+
+    def _deliver(self, task_id: int, future: Future) -> None:
+        """Вызывает обработчик результата, если задача не устарела"""
+        with self._lock:
+            callbacks = self._callbacks.pop(task_id, None)
+            if callbacks is None:
+                return
+            key, on_success, on_error, widget = callbacks
+            if key is not None:
+                latest = self._latest.get(key)
+                if latest is None or latest[0] != task_id:
+                    self.dropped += 1
+                    return
+                del self._latest[key]
+
+        if future.cancelled() or (widget is not None and not widget.winfo_exists()):
+            self.dropped += 1
+            return
+
+        self.completed += 1
+        error = future.exception()
+        try:
+            if error is None:
+                if on_success is not None:
+                    on_success(future.result())
+            elif on_error is not None:
+                on_error(error)
+            else:
+                logger.error("Ошибка фоновой задачи: %s", error, exc_info=error)
+        except Exception:
+            # Ошибка обработчика не должна останавливать доставку остальных результатов
+            logger.exception("Ошибка обработчика результата фоновой задачи")
+
+    def shutdown(self) -> None:
+        """Отменяет не начатые задачи; результаты выполняющихся больше не доставляются"""
+        self._closed = True
+        with self._lock:
+            self._callbacks.clear()
+            self._latest.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,114 @@
+"""
+menu_index.py
+Поисковый индекс меню: строится один раз на версию меню
+
+Поиск ищет запрос как подстроку названия или описания блюда без учета
+регистра и различия "ё"/"е". Индекс хранит нормализованные поля, блюда по
+ID и по категориям и списки блюд по n-граммам (1-3 символа) каждого поля:
+запрос до трех символов отвечается одним списком, более длинный -
+пересечением списков его триграмм с проверкой подстроки. Стоимость запроса
+порядка размера найденного множества, а не всего меню.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Длина самых длинных n-грамм в индексе
+MAX_GRAM = 3
+
+
+def normalize(text: Optional[str]) -> str:
+    """Приводит текст к виду для поиска: нижний регистр, "ё" -> "е" """
+    return (text or "").lower().replace("ё", "е")
+
+
+def _grams(text: str) -> Set[str]:
+    """Все подстроки длины 1..MAX_GRAM"""
+    return {text[start:start + size]
+            for size in range(1, MAX_GRAM + 1)
+            for start in range(len(text) - size + 1)}
+
+
+class MenuIndex:
+    """Индекс блюд меню для поиска и фильтра по категории"""
+
+    def __init__(self, items: Iterable[Any], version: Optional[int] = None):
+        self.version = version
+        # Порядок блюд в меню: результаты поиска возвращаются в нем же
+        self.items: List[Any] = list(items)
+        self.by_id: Dict[int, Any] = {item.id: item for item in self.items}
+        self.by_category: Dict[str, List[int]] = {}
+        self._fields: List[Tuple[str, str]] = []
+        self._postings: Dict[str, Set[int]] = {}
+
+        for position, item in enumerate(self.items):
+            self.by_category.setdefault(item.category_name, []).append(position)
+            name, description = normalize(item.name), normalize(item.description)
+            self._fields.append((name, description))
+            for gram in _grams(name) | _grams(description):
+                self._postings.setdefault(gram, set()).add(position)
+
+    def search(self, query: str = "", category: Optional[str] = None,
+               within: Optional[Iterable[int]] = None) -> List[int]:
+        """Позиции блюд категории category (None - все), содержащих query
+
+        within - позиции, среди которых искать: результат прежнего запроса,
+        который новый запрос уточняет.
+        """
+        query = normalize(query)
+
+        if within is not None:
+            candidates: Iterable[int] = within
+        elif query:
+            candidates = self._candidates(query)
+        elif category is None:
+            return list(range(len(self.items)))
+        else:
+            return list(self.by_category.get(category, []))
+
+        if category is not None:
+            candidates = [position for position in candidates
+                          if self.items[position].category_name == category]
+        if query:
+            candidates = [position for position in candidates
+                          if query in self._fields[position][0] or query in self._fields[position][1]]
+        return sorted(candidates)
+
+    def _candidates(self, query: str) -> Set[int]:
+        """Блюда, в полях которых есть все n-граммы запроса"""
+        if len(query) <= MAX_GRAM:
+            return self._postings.get(query, set())
+
+        postings = sorted((self._postings.get(query[start:start + MAX_GRAM], set())
+                           for start in range(len(query) - MAX_GRAM + 1)), key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            if not result:
+                break
+            result &= posting
+        return result
+
+    def select(self, positions: Iterable[int]) -> List[Any]:
+        """Блюда по позициям результата поиска"""
+        return [self.items[position] for position in positions]
+
+
+class MenuSearch:
+    """Последовательный поиск при наборе: уточнение переиспользует прежний результат"""
+
+    def __init__(self, index: MenuIndex):
+        self.index = index
+        self._query: Optional[str] = None
+        self._category: Optional[str] = None
+        self._result: List[int] = []
+
+    def search(self, query: str, category: Optional[str] = None) -> List[Any]:
+        """Блюда категории category (None - все), содержащие query"""
+        query = normalize(query)
+        # Новый запрос продолжает прежний: ищем только среди прежних результатов
+        narrowing = (self._query is not None and category == self._category
+                     and self._query in query)
+        within = self._result if narrowing else None
+
+        self._result = self.index.search(query, category, within=within)
+        self._query, self._category = query, category
+        return self.index.select(self._result)
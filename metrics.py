@@ -0,0 +1,389 @@
+"""
+metrics.py
+Замеры методов хранилища: число вызовов, гистограмма задержек, строки, ошибки
+
+Класс хранилища оборачивается декоратором instrument_methods: каждый
+публичный метод пишет свой вызов в QueryStats экземпляра (атрибут
+query_stats). Строки считает курсор базы данных через record_rows:
+учитываются только строки, действительно прочитанные или измененные
+на сервере, ответ из кэша меню дает ноль строк.
+
+Медленные запросы (дольше DB_SLOW_QUERY_MS миллисекунд, по умолчанию
+200, 0 - выключено) пишутся в журнал restaurant.slow_query вместе с
+текстом, параметрами и длительностью.
+
+При заданном METRICS_PORT консоль и GUI поднимают HTTP-сервер метрик
+в текстовом формате Prometheus (http://127.0.0.1:PORT/metrics, адрес -
+METRICS_HOST). Метрики собираются только при запросе к серверу, путь
+заказа лишь увеличивает счетчики.
+"""
+
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Dict, Any, Callable, Iterable, Tuple
+
+from app_logging import get_logger, log_context
+
+# Верхние границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+logger = get_logger("metrics")
+slow_query_log = get_logger("slow_query")
+
+# Строки, обработанные запросами текущего вызова метода в этом потоке
+_rows = threading.local()
+
+
+def slow_query_threshold_ms() -> float:
+    """Порог медленного запроса из DB_SLOW_QUERY_MS; 0 - журнал выключен"""
+    return float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными корзинами"""
+
+    def __init__(self, buckets_ms: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        # Последняя корзина - все, что больше верхней границы
+        self.counts = [0] * (len(buckets_ms) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> float:
+        """Оценка перцентиля q (0-100) по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets_ms, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum_ms': self.sum_ms,
+            'avg_ms': self.sum_ms / self.count if self.count else 0.0,
+            'max_ms': self.max_ms,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'buckets': list(zip(self.buckets_ms + (float("inf"),), self.counts))
+        }
+
+
+class MethodStats:
+    """Статистика одного метода"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.latency = LatencyHistogram()
+
+
+class QueryStats:
+    """Статистика методов хранилища по именам, потокобезопасная"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods: Dict[str, MethodStats] = {}
+
+    def record(self, name: str, seconds: float, rows: int = 0, error: bool = False) -> None:
+        with self._lock:
+            stats = self._methods.get(name)
+            if stats is None:
+                stats = self._methods[name] = MethodStats()
+            stats.calls += 1
+            stats.errors += error
+            stats.rows += rows
+            stats.latency.observe(seconds * 1000)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Статистика всех вызывавшихся методов: имя -> calls, errors, rows, latency"""
+        with self._lock:
+            return {name: {
+                'calls': stats.calls,
+                'errors': stats.errors,
+                'rows': stats.rows,
+                'latency': stats.latency.snapshot()
+            } for name, stats in sorted(self._methods.items())}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._methods.clear()
+
+
+def record_rows(count: int) -> None:
+    """Добавляет строки запроса к текущему замеряемому вызову потока"""
+    if getattr(_rows, 'count', None) is not None and count > 0:
+        _rows.count += count
+
+
+def log_slow_query(query: Any, params: Any, seconds: float) -> None:
+    """Пишет запрос в журнал медленных, если он дольше порога"""
+    threshold = slow_query_threshold_ms()
+    ms = seconds * 1000
+    if threshold > 0 and ms >= threshold:
+        if isinstance(query, bytes):
+            query = query.decode(errors="replace")
+        slow_query_log.warning("Медленный запрос %.1f мс: %s; параметры: %r",
+                               ms, " ".join(str(query).split()), params)
+
+
+def instrumented(method: Callable) -> Callable:
+    """Замеряет вызовы метода в self.query_stats"""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        outer_rows = getattr(_rows, 'count', None)
+        _rows.count = 0
+        started = time.perf_counter()
+        error = False
+        try:
+            with log_context(method=name):
+                return method(self, *args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            rows = _rows.count
+            # Строки вложенного вызова входят и во внешний
+            _rows.count = None if outer_rows is None else outer_rows + rows
+            self.query_stats.record(name, elapsed, rows, error)
+
+    return wrapper
+
+
+def instrument_methods(exclude: Iterable[str] = ()) -> Callable[[type], type]:
+    """Декоратор класса: оборачивает instrumented все публичные методы, кроме exclude
+
+    Унаследованные методы тоже оборачиваются, чтобы ни один вызов
+    интерфейса хранилища не прошел мимо статистики.
+    """
+    excluded = set(exclude)
+
+    def decorate(cls: type) -> type:
+        for name, member in inspect.getmembers(cls, inspect.isfunction):
+            if name.startswith("_") or name in excluded:
+                continue
+            setattr(cls, name, instrumented(member))
+        return cls
+
+    return decorate
+
+
+def format_query_stats(snapshot: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Строки таблицы статистики методов для вывода в консоль"""
+    lines = [f"{'Метод':<30} {'Вызовы':>8} {'Ошибки':>7} {'Строки':>8} "
+             f"{'p50, мс':>8} {'p99, мс':>8} {'max, мс':>8}"]
+    for name, stats in snapshot.items():
+        latency = stats['latency']
+        lines.append(f"{name:<30} {stats['calls']:>8} {stats['errors']:>7} {stats['rows']:>8} "
+                     f"{latency['p50_ms']:>8.2f} {latency['p99_ms']:>8.2f} {latency['max_ms']:>8.2f}")
+    return lines
+
+
+class PrometheusText:
+    """Собирает метрики в текстовом формате Prometheus 0.0.4"""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    @staticmethod
+    def _labels(labels: Optional[Dict[str, Any]]) -> str:
+        if not labels:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                   for value in labels.values())
+        return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+    @staticmethod
+    def _value(value: float) -> str:
+        return "+Inf" if value == float("inf") else repr(float(value))
+
+    def metric(self, name: str, kind: str, help_text: str,
+               samples: Iterable[Tuple[Optional[Dict[str, Any]], float]]) -> None:
+        """Метрика с заголовками HELP и TYPE; samples - пары (метки, значение)"""
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self.lines.append(f"{name}{self._labels(labels)} {self._value(value)}")
+
+    def histogram(self, name: str, help_text: str,
+                  series: Iterable[Tuple[Optional[Dict[str, Any]], Dict[str, Any]]]) -> None:
+        """Гистограмма в секундах из снимков LatencyHistogram.snapshot()"""
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} histogram")
+        for labels, snapshot in series:
+            cumulative = 0
+            for bound_ms, count in snapshot['buckets']:
+                cumulative += count
+                bucket_labels = dict(labels or {}, le=self._value(bound_ms / 1000))
+                self.lines.append(f"{name}_bucket{self._labels(bucket_labels)} {cumulative}")
+            self.lines.append(f"{name}_sum{self._labels(labels)} {self._value(snapshot['sum_ms'] / 1000)}")
+            self.lines.append(f"{name}_count{self._labels(labels)} {snapshot['count']}")
+
+    def summary(self, name: str, help_text: str,
+                series: Iterable[Tuple[Optional[Dict[str, Any]], Dict[str, Any]]],
+                quantiles: Tuple[int, ...] = (50, 95, 99)) -> None:
+        """Сводка в секундах из снимков LatencyHistogram.snapshot(): перцентили, сумма, число"""
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} summary")
+        for labels, snapshot in series:
+            for percent in quantiles:
+                quantile_labels = dict(labels or {}, quantile=repr(percent / 100))
+                self.lines.append(f"{name}{self._labels(quantile_labels)} "
+                                  f"{self._value(snapshot[f'p{percent}_ms'] / 1000)}")
+            self.lines.append(f"{name}_sum{self._labels(labels)} {self._value(snapshot['sum_ms'] / 1000)}")
+            self.lines.append(f"{name}_count{self._labels(labels)} {snapshot['count']}")
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def collect_metrics(db: Any, outbox: Any = None) -> str:
+    """Текст метрик хранилища и журнала заказов; недоступные части пропускаются"""
+    text = PrometheusText()
+
+    if outbox is not None:
+        stats = outbox.stats()
+        text.metric("restaurant_orders_total", "counter",
+                    "Оформленные заказы по исходу: placed, journaled, rejected, failed",
+                    [({'result': result}, count) for result, count in stats['orders'].items()])
+        text.metric("restaurant_orders_per_second", "gauge",
+                    "Принятые заказы в секунду за последнюю минуту",
+                    [(None, stats['orders_per_second'])])
+        latency = stats['latency']
+        text.histogram("restaurant_checkout_duration_seconds",
+                       "Полная задержка оформления заказа", [(None, latency)])
+        text.summary("restaurant_checkout_latency_seconds",
+                     "Перцентили задержки оформления заказа с запуска", [(None, latency)])
+        text.metric("restaurant_outbox_pending", "gauge",
+                    "Заказы в локальном журнале, ожидающие переноса в базу",
+                    [(None, stats['entries']['pending'])])
+        text.metric("restaurant_outbox_entries", "gauge",
+                    "Записи локального журнала по статусу; rejected и failed не перенесены "
+                    "и требуют разбора",
+                    [({'status': status}, count) for status, count in stats['entries'].items()])
+        text.metric("restaurant_outbox_replayed_total", "counter",
+                    "Заказы, перенесенные из журнала в базу", [(None, stats['replayed'])])
+
+    if hasattr(db, 'get_pool_metrics'):
+        pool = db.get_pool_metrics()
+        text.metric("restaurant_db_pool_connections", "gauge",
+                    "Соединения пула по состоянию",
+                    [({'state': 'in_use'}, pool['in_use']), ({'state': 'idle'}, pool['idle'])])
+        text.metric("restaurant_db_pool_max_connections", "gauge",
+                    "Максимальный размер пула", [(None, pool['max_size'])])
+        text.metric("restaurant_db_pool_saturation", "gauge",
+                    "Доля занятых соединений от максимума", [(None, pool['saturation'])])
+        text.metric("restaurant_db_pool_checkouts_total", "counter",
+                    "Выдачи соединений из пула", [(None, pool['checkouts'])])
+        text.metric("restaurant_db_pool_timeouts_total", "counter",
+                    "Отказы в соединении по таймауту ожидания", [(None, pool['timeouts'])])
+        text.metric("restaurant_db_pool_wait_max_seconds", "gauge",
+                    "Наибольшее ожидание соединения", [(None, pool['wait_max_ms'] / 1000)])
+
+    menu_cache = getattr(db, 'menu_cache', None)
+    if menu_cache is not None:
+        hits, misses = menu_cache.hits, menu_cache.misses
+        text.metric("restaurant_menu_cache_requests_total", "counter",
+                    "Обращения к кэшу меню по результату",
+                    [({'result': 'hit'}, hits), ({'result': 'miss'}, misses)])
+        text.metric("restaurant_menu_cache_hit_ratio", "gauge",
+                    "Доля обращений к меню без загрузки из базы",
+                    [(None, hits / (hits + misses) if hits + misses else 0.0)])
+        text.metric("restaurant_menu_reloads_total", "counter",
+                    "Загрузки меню из базы", [(None, misses)])
+        text.metric("restaurant_menu_invalidations_total", "counter",
+                    "Сбросы кэша меню по изменениям", [(None, menu_cache.version)])
+
+    query_stats = getattr(db, 'query_stats', None)
+    if query_stats is not None:
+        methods = query_stats.snapshot()
+        text.metric("restaurant_db_method_calls_total", "counter", "Вызовы методов хранилища",
+                    [({'method': name}, stats['calls']) for name, stats in methods.items()])
+        text.metric("restaurant_db_method_errors_total", "counter",
+                    "Вызовы методов хранилища, завершившиеся исключением",
+                    [({'method': name}, stats['errors']) for name, stats in methods.items()])
+        text.metric("restaurant_db_method_rows_total", "counter",
+                    "Строки, обработанные запросами методов",
+                    [({'method': name}, stats['rows']) for name, stats in methods.items()])
+        text.histogram("restaurant_db_method_duration_seconds", "Задержка методов хранилища",
+                       [({'method': name}, stats['latency']) for name, stats in methods.items()])
+
+    return text.render()
+
+
+class MetricsServer:
+    """HTTP-сервер метрик на собственном фоновом потоке"""
+
+    def __init__(self, collect: Callable[[], str], port: int, host: str = "127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                try:
+                    body = collect().encode()
+                    status = 200
+                except Exception as e:
+                    body = f"# Ошибка сбора метрик: {e}\n".encode()
+                    status = 500
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Каждый опрос сервера в консоль не пишем
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.address = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http",
+                                        daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def start_metrics_server(db: Any, outbox: Any = None) -> Optional[MetricsServer]:
+    """Запускает сервер метрик, если задан METRICS_PORT; иначе возвращает None"""
+    port = os.getenv("METRICS_PORT")
+    if not port:
+        return None
+
+    try:
+        server = MetricsServer(lambda: collect_metrics(db, outbox), int(port),
+                               os.getenv("METRICS_HOST", "127.0.0.1"))
+    except (OSError, ValueError) as e:
+        logger.warning("Сервер метрик не запущен: %s", e)
+        return None
+
+    server.start()
+    logger.info("Метрики: http://%s:%s/metrics", *server.address[:2])
+    return server
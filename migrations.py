@@ -0,0 +1,401 @@
+"""
+migrations.py
+Версионные миграции схемы базы данных ресторана
+
+Каждая миграция - номер, описание и список SQL-команд. Примененные версии
+записываются в таблицу schema_version, поэтому обычный запуск стоит одного
+запроса к ней. Новые изменения схемы добавляются только новой миграцией в
+конец списка MIGRATIONS, уже выпущенные миграции не редактируются.
+"""
+
+from typing import List, Tuple
+
+import psycopg2
+from psycopg2.extensions import connection as PgConnection
+
+# Ключ advisory-блокировки: одновременно стартующие процессы
+# применяют миграции по очереди
+MIGRATION_LOCK_ID = 732_001
+
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "Базовые таблицы", [
+        '''
+        CREATE TABLE IF NOT EXISTS categories (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL UNIQUE,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS menu_items (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(200) NOT NULL,
+            description TEXT,
+            price DECIMAL(10, 2) NOT NULL,
+            category_id INTEGER REFERENCES categories(id),
+            is_available BOOLEAN DEFAULT TRUE,
+            unavailability_reason TEXT,
+            calories INTEGER,
+            cooking_time_minutes INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS customers (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(200) NOT NULL,
+            phone VARCHAR(20) UNIQUE,
+            email VARCHAR(200),
+            address TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS orders (
+            id SERIAL PRIMARY KEY,
+            order_number VARCHAR(50) UNIQUE NOT NULL,
+            customer_id INTEGER REFERENCES customers(id),
+            total_amount DECIMAL(10, 2) NOT NULL,
+            status VARCHAR(50) DEFAULT 'pending',
+            payment_method VARCHAR(50),
+            delivery_address TEXT,
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS order_items (
+            id SERIAL PRIMARY KEY,
+            order_id INTEGER REFERENCES orders(id) ON DELETE CASCADE,
+            menu_item_id INTEGER REFERENCES menu_items(id),
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            price_at_order DECIMAL(10, 2) NOT NULL,
+            subtotal DECIMAL(10, 2) GENERATED ALWAYS AS (quantity * price_at_order) STORED,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+
+    (2, "Серверная функция оформления заказа place_order", [
+        '''
+        CREATE OR REPLACE FUNCTION place_order(
+            p_customer_name TEXT,
+            p_phone TEXT,
+            p_email TEXT,
+            p_customer_address TEXT,
+            p_order_number TEXT,
+            p_items JSONB,
+            p_delivery_address TEXT,
+            p_notes TEXT,
+            p_payment_method TEXT
+        ) RETURNS TABLE (placed_order_id INTEGER,
+                         placed_order_number VARCHAR,
+                         placed_total_amount DECIMAL)
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            v_customer_id INTEGER;
+            v_order_id INTEGER;
+            v_total DECIMAL(10, 2);
+            v_unavailable TEXT;
+        BEGIN
+            IF p_items IS NULL OR jsonb_array_length(p_items) = 0 THEN
+                RAISE EXCEPTION 'Заказ не содержит позиций';
+            END IF;
+
+            -- Все блюда должны существовать и быть доступны
+            SELECT string_agg(COALESCE(m.name, '#' || line.menu_item_id), ', ')
+              INTO v_unavailable
+              FROM jsonb_to_recordset(p_items) AS line(menu_item_id INTEGER, quantity INTEGER)
+              LEFT JOIN menu_items m ON m.id = line.menu_item_id
+             WHERE m.id IS NULL OR NOT m.is_available;
+
+            IF v_unavailable IS NOT NULL THEN
+                RAISE EXCEPTION 'Блюда недоступны для заказа: %', v_unavailable;
+            END IF;
+
+            INSERT INTO customers (name, phone, email, address)
+            VALUES (p_customer_name, p_phone, p_email, p_customer_address)
+            ON CONFLICT (phone) DO UPDATE SET phone = EXCLUDED.phone
+            RETURNING id INTO v_customer_id;
+
+            -- Итог считается по текущим ценам меню, а не по ценам клиента
+            SELECT SUM(line.quantity * m.price)
+              INTO v_total
+              FROM jsonb_to_recordset(p_items) AS line(menu_item_id INTEGER, quantity INTEGER)
+              JOIN menu_items m ON m.id = line.menu_item_id;
+
+            INSERT INTO orders
+            (order_number, customer_id, total_amount, delivery_address, notes, payment_method)
+            VALUES (p_order_number, v_customer_id, v_total,
+                    p_delivery_address, p_notes, p_payment_method)
+            RETURNING id INTO v_order_id;
+
+            INSERT INTO order_items (order_id, menu_item_id, quantity, price_at_order)
+            SELECT v_order_id, line.menu_item_id, line.quantity, m.price
+              FROM ROWS FROM (jsonb_to_recordset(p_items)
+                              AS (menu_item_id INTEGER, quantity INTEGER))
+                   WITH ORDINALITY AS line(menu_item_id, quantity, line_no)
+              JOIN menu_items m ON m.id = line.menu_item_id
+             ORDER BY line.line_no;
+
+            RETURN QUERY SELECT v_order_id, p_order_number::VARCHAR, v_total;
+        END;
+        $$
+        ''',
+    ]),
+
+    (3, "Начальные данные меню", [
+        # Только для пустой базы: существующее меню не трогаем
+        '''
+        INSERT INTO categories (name, description)
+        SELECT name, description
+        FROM (VALUES
+            ('Пицца', 'Итальянская пицца на тонком тесте'),
+            ('Суши и роллы', 'Японская кухня'),
+            ('Напитки', 'Холодные и горячие напитки'),
+            ('Десерты', 'Сладкие угощения')
+        ) AS seed(name, description)
+        WHERE NOT EXISTS (SELECT 1 FROM categories)
+        ''',
+        '''
+        INSERT INTO menu_items
+        (name, description, price, category_id, calories, cooking_time_minutes)
+        SELECT seed.name, seed.description, seed.price, c.id, seed.calories, seed.cooking_time
+        FROM (VALUES
+            ('Маргарита', 'Томатный соус, моцарелла, базилик', 450, 'Пицца', 800, 15),
+            ('Пепперони', 'Томатный соус, пепперони, моцарелла', 550, 'Пицца', 950, 20),
+            ('Филадельфия', 'Лосось, сливочный сыр, огурец', 320, 'Суши и роллы', 420, 10),
+            ('Калифорния', 'Краб-микс, авокадо, огурец, икра', 280, 'Суши и роллы', 380, 10),
+            ('Кола', 'Coca-Cola 0.5л', 120, 'Напитки', 210, 2),
+            ('Апельсиновый сок', 'Свежевыжатый сок 0.3л', 150, 'Напитки', 120, 3),
+            ('Чизкейк', 'Классический Нью-Йорк чизкейк', 200, 'Десерты', 350, 5),
+            ('Тирамису', 'Итальянский десерт', 250, 'Десерты', 280, 5)
+        ) AS seed(name, description, price, category, calories, cooking_time)
+        JOIN categories c ON c.name = seed.category
+        WHERE NOT EXISTS (SELECT 1 FROM menu_items)
+        ''',
+    ]),
+
+    (4, "Индексы для заказов и отчетов", [
+        # Лента заказов: ORDER BY created_at, id (в том числе постранично)
+        "CREATE INDEX IF NOT EXISTS idx_orders_created_at_id ON orders (created_at, id)",
+        # Статистика за период считается только по неотмененным заказам
+        """
+        CREATE INDEX IF NOT EXISTS idx_orders_active_created_at
+            ON orders (created_at) WHERE status <> 'cancelled'
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_orders_status_created_at ON orders (status, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_customer_id ON orders (customer_id)",
+        # Позиции заказа и популярные блюда
+        "CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id)",
+        "CREATE INDEX IF NOT EXISTS idx_order_items_menu_item_id ON order_items (menu_item_id)",
+    ]),
+
+    (5, "Уведомления об изменениях меню", [
+        # Кэш меню в каждом терминале сбрасывается по NOTIFY menu_changed;
+        # уведомление доставляется только после фиксации транзакции
+        '''
+        CREATE OR REPLACE FUNCTION notify_menu_changed() RETURNS TRIGGER
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_notify('menu_changed', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$
+        ''',
+        "DROP TRIGGER IF EXISTS menu_items_changed ON menu_items",
+        '''
+        CREATE TRIGGER menu_items_changed
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON menu_items
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_menu_changed()
+        ''',
+        "DROP TRIGGER IF EXISTS categories_changed ON categories",
+        '''
+        CREATE TRIGGER categories_changed
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON categories
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_menu_changed()
+        ''',
+    ]),
+
+    (6, "Идемпотентный place_order по номеру заказа", [
+        '''
+        CREATE OR REPLACE FUNCTION place_order(
+            p_customer_name TEXT,
+            p_phone TEXT,
+            p_email TEXT,
+            p_customer_address TEXT,
+            p_order_number TEXT,
+            p_items JSONB,
+            p_delivery_address TEXT,
+            p_notes TEXT,
+            p_payment_method TEXT
+        ) RETURNS TABLE (placed_order_id INTEGER,
+                         placed_order_number VARCHAR,
+                         placed_total_amount DECIMAL)
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            v_customer_id INTEGER;
+            v_order_id INTEGER;
+            v_total DECIMAL(10, 2);
+            v_unavailable TEXT;
+        BEGIN
+            -- Повторная отправка того же номера (перенос из локального
+            -- журнала) возвращает уже созданный заказ
+            RETURN QUERY SELECT o.id, o.order_number, o.total_amount
+                           FROM orders o
+                          WHERE o.order_number = p_order_number;
+            IF FOUND THEN
+                RETURN;
+            END IF;
+
+            IF p_items IS NULL OR jsonb_array_length(p_items) = 0 THEN
+                RAISE EXCEPTION 'Заказ не содержит позиций';
+            END IF;
+
+            -- Все блюда должны существовать и быть доступны
+            SELECT string_agg(COALESCE(m.name, '#' || line.menu_item_id), ', ')
+              INTO v_unavailable
+              FROM jsonb_to_recordset(p_items) AS line(menu_item_id INTEGER, quantity INTEGER)
+              LEFT JOIN menu_items m ON m.id = line.menu_item_id
+             WHERE m.id IS NULL OR NOT m.is_available;
+
+            IF v_unavailable IS NOT NULL THEN
+                RAISE EXCEPTION 'Блюда недоступны для заказа: %', v_unavailable;
+            END IF;
+
+            INSERT INTO customers (name, phone, email, address)
+            VALUES (p_customer_name, p_phone, p_email, p_customer_address)
+            ON CONFLICT (phone) DO UPDATE SET phone = EXCLUDED.phone
+            RETURNING id INTO v_customer_id;
+
+            -- Итог считается по текущим ценам меню, а не по ценам клиента
+            SELECT SUM(line.quantity * m.price)
+              INTO v_total
+              FROM jsonb_to_recordset(p_items) AS line(menu_item_id INTEGER, quantity INTEGER)
+              JOIN menu_items m ON m.id = line.menu_item_id;
+
+            INSERT INTO orders
+            (order_number, customer_id, total_amount, delivery_address, notes, payment_method)
+            VALUES (p_order_number, v_customer_id, v_total,
+                    p_delivery_address, p_notes, p_payment_method)
+            RETURNING id INTO v_order_id;
+
+            INSERT INTO order_items (order_id, menu_item_id, quantity, price_at_order)
+            SELECT v_order_id, line.menu_item_id, line.quantity, m.price
+              FROM ROWS FROM (jsonb_to_recordset(p_items)
+                              AS (menu_item_id INTEGER, quantity INTEGER))
+                   WITH ORDINALITY AS line(menu_item_id, quantity, line_no)
+              JOIN menu_items m ON m.id = line.menu_item_id
+             ORDER BY line.line_no;
+
+            RETURN QUERY SELECT v_order_id, p_order_number::VARCHAR, v_total;
+        END;
+        $$
+        ''',
+    ]),
+
+    (7, "Пакетное оформление заказов place_orders", [
+        # Пачка заказов за один вызов; блок EXCEPTION работает как точка
+        # сохранения, поэтому отказ по одному заказу не отменяет остальные
+        '''
+        CREATE OR REPLACE FUNCTION place_orders(p_orders JSONB)
+        RETURNS TABLE (batch_index INTEGER,
+                       batch_order_id INTEGER,
+                       batch_order_number VARCHAR,
+                       batch_total_amount DECIMAL,
+                       batch_error_code TEXT,
+                       batch_error TEXT)
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            v_order JSONB;
+        BEGIN
+            batch_index := 0;
+            FOR v_order IN SELECT value FROM jsonb_array_elements(p_orders) LOOP
+                BEGIN
+                    SELECT p.placed_order_id, p.placed_order_number, p.placed_total_amount
+                      INTO batch_order_id, batch_order_number, batch_total_amount
+                      FROM place_order(v_order->>'name', v_order->>'phone',
+                                       v_order->>'email', v_order->>'address',
+                                       v_order->>'order_number', v_order->'items',
+                                       v_order->>'address', v_order->>'notes',
+                                       v_order->>'payment_method') AS p;
+                    batch_error_code := NULL;
+                    batch_error := NULL;
+                EXCEPTION WHEN OTHERS THEN
+                    batch_order_id := NULL;
+                    batch_order_number := v_order->>'order_number';
+                    batch_total_amount := NULL;
+                    batch_error_code := SQLSTATE;
+                    batch_error := SQLERRM;
+                END;
+                RETURN NEXT;
+                batch_index := batch_index + 1;
+            END LOOP;
+        END;
+        $$
+        ''',
+    ]),
+
+    (8, "Последовательность номеров заказов", [
+        # Каждый nextval резервирует блок из INCREMENT BY номеров:
+        # процессы выдают номера из своего блока без обращения к серверу
+        "CREATE SEQUENCE IF NOT EXISTS order_number_seq START WITH 1 INCREMENT BY 100",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: PgConnection) -> int:
+    """Возвращает текущую версию схемы (0, если миграции не применялись)"""
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            version = cursor.fetchone()[0]
+        conn.commit()
+        return version
+    except psycopg2.errors.UndefinedTable:
+        conn.rollback()
+        return 0
+
+
+def migrate(conn: PgConnection) -> List[int]:
+    """Применяет недостающие миграции и возвращает их номера"""
+    if get_schema_version(conn) >= LATEST_VERSION:
+        return []
+
+    applied = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Версию перечитываем под блокировкой: ее мог поднять другой процесс
+            cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+            current = cursor.fetchone()[0]
+
+            for version, description, statements in MIGRATIONS:
+                if version <= current:
+                    continue
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                applied.append(version)
+
+        conn.commit()
+        return applied
+    except Exception:
+        conn.rollback()
+        raise
@@ -0,0 +1,329 @@
+"""
+outbox.py
+Локальный журнал заказов на время недоступности базы данных
+
+Заказ сначала отправляется в хранилище как обычно. Если оно недоступно
+или не ответило за OUTBOX_TIMEOUT секунд, заказ записывается в журнал
+SQLite на диске (synchronous=FULL: запись переживает сбой питания), а
+кассир получает предварительный номер заказа. Фоновый поток переносит
+журнал в хранилище пачками, как только связь восстанавливается: пачка
+уходит одним вызовом place_orders (для PostgreSQL - один запрос и одна
+фиксация).
+
+Перенос идемпотентен: заказ уходит с тем же номером, а place_order для
+уже существующего номера возвращает созданный заказ. Поэтому заказ,
+который база все-таки приняла после таймаута, не задваивается.
+
+Заказ, который база отклонила при переносе (rejected) или не приняла из-за
+ошибки данных (failed), остается в журнале: у клиента уже есть его номер.
+Такие записи видны в stats(), метрике restaurant_outbox_entries и в
+админ-панели GUI, чтобы персонал связался с клиентом.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple
+
+from app_logging import get_logger
+from metrics import LatencyHistogram
+from models import OrderItem
+from storage import RestaurantDatabase, DatabaseUnavailableError, _new_order_number
+
+try:
+    from database import DISCONNECT_ERRORS
+except ImportError:
+    # Без psycopg2 обрывы связи приходят только как DatabaseUnavailableError
+    DISCONNECT_ERRORS = ()
+
+logger = get_logger("outbox")
+
+# Ошибки, после которых заказ остается в журнале до восстановления связи
+UNAVAILABLE_ERRORS = (DatabaseUnavailableError,) + DISCONNECT_ERRORS
+
+# Статусы записей журнала: ждет переноса, отклонен базой, не перенесен из-за ошибки
+ENTRY_STATUSES = ('pending', 'rejected', 'failed')
+
+
+class OrderOutbox:
+    """Оформляет заказы через хранилище, а при его недоступности - через журнал"""
+
+    def __init__(self, db: RestaurantDatabase, path: Optional[str] = None,
+                 timeout: Optional[float] = None, batch_size: int = 50,
+                 retry_interval: float = 5.0):
+        self.db = db
+        self.path = path or os.getenv("OUTBOX_PATH", "order_outbox.sqlite3")
+        self.timeout = timeout if timeout is not None else float(os.getenv("OUTBOX_TIMEOUT", "3"))
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+
+        self._lock = threading.Lock()
+        self._journal = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._journal.execute("PRAGMA journal_mode = WAL")
+        self._journal.execute("PRAGMA synchronous = FULL")
+        self._journal.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY,
+                order_number TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at TEXT NOT NULL
+            )
+        """)
+
+        # Вызовы хранилища идут в отдельных потоках, чтобы ждать их не дольше timeout
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="outbox-order")
+        # Пока журнал не пуст, новые заказы встают за ним в очередь
+        self._online = threading.Event()
+        if not self.pending_count():
+            self._online.set()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._replay_loop, name="outbox-replayer",
+                                        daemon=True)
+
+        # Метрики оформления: исходы заказов и полная задержка place_order
+        self._stats_lock = threading.Lock()
+        self._outcomes = {'placed': 0, 'journaled': 0, 'rejected': 0, 'failed': 0}
+        self._latency = LatencyHistogram()
+        # Моменты принятых заказов за последнее окно - для заказов в секунду
+        self._recent = deque(maxlen=100000)
+        self.rate_window = 60.0
+        self.replayed = 0
+
+    def start(self) -> None:
+        """Запускает фоновый перенос журнала"""
+        self._thread.start()
+
+    def place_order(self, name: str, phone: str, items: List[Any],
+                    email: str = "", address: str = "", notes: str = "",
+                    payment_method: str = "cash") -> Tuple[Optional[int], str, float]:
+        """Оформляет заказ; при недоступности хранилища - в журнал
+
+        Возвращает (order_id, order_number, total_amount). Для заказа из
+        журнала order_id равен None, а сумма посчитана по ценам корзины.
+        Отказ хранилища (недоступные блюда) - ValueError, как у place_order.
+        """
+        started = time.perf_counter()
+        outcome = 'failed'
+        try:
+            result = self._place_order(name, phone, items, email, address, notes, payment_method)
+            outcome = 'placed' if result[0] is not None else 'journaled'
+            return result
+        except ValueError:
+            outcome = 'rejected'
+            raise
+        finally:
+            finished = time.perf_counter()
+            with self._stats_lock:
+                self._outcomes[outcome] += 1
+                self._latency.observe((finished - started) * 1000)
+                if outcome in ('placed', 'journaled'):
+                    self._recent.append(finished)
+
+    def _place_order(self, name: str, phone: str, items: List[Any],
+                     email: str, address: str, notes: str,
+                     payment_method: str) -> Tuple[Optional[int], str, float]:
+        order_number = self._next_order_number()
+
+        if self._online.is_set():
+            future = self._executor.submit(
+                self.db.place_order, name, phone, items, email, address, notes,
+                payment_method, order_number=order_number
+            )
+            try:
+                return future.result(timeout=self.timeout)
+            except (DatabaseUnavailableError, FutureTimeoutError) as e:
+                logger.warning("База недоступна, заказ сохранен в журнал: %s", str(e) or "таймаут",
+                               extra={'order_number': order_number})
+                self._online.clear()
+
+        self._append(order_number, {
+            'name': name,
+            'phone': phone,
+            'email': email,
+            'address': address,
+            'notes': notes,
+            'payment_method': payment_method,
+            'items': [{
+                'menu_item_id': item.menu_item_id,
+                'quantity': item.quantity,
+                'price_at_order': item.price_at_order,
+                'menu_item_name': item.menu_item_name
+            } for item in items]
+        })
+        self._wake.set()
+        return None, order_number, float(sum(item.subtotal for item in items))
+
+    def _next_order_number(self) -> str:
+        """Номер заказа от хранилища; без связи - локальный случайный номер"""
+        if self._online.is_set():
+            future = self._executor.submit(self.db.next_order_number)
+            try:
+                return future.result(timeout=self.timeout)
+            except (DatabaseUnavailableError, FutureTimeoutError):
+                self._online.clear()
+        return _new_order_number()
+
+    def _append(self, order_number: str, payload: dict) -> None:
+        with self._lock:
+            self._journal.execute(
+                "INSERT INTO outbox (order_number, payload, created_at) VALUES (?, ?, ?)",
+                (order_number, json.dumps(payload, ensure_ascii=False),
+                 datetime.now().isoformat(sep=" "))
+            )
+            # Журнал не пуст: следующие заказы встают за ним, пока перенос не
+            # опустошит его. Под той же блокировкой, что и проверка в replay(),
+            # иначе заказ мог бы остаться в журнале при уже "восстановленной" связи
+            self._online.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики оформления: исходы заказов, задержка, заказы в секунду за окно,
+        записи журнала по статусу"""
+        entries = self.entry_counts()
+        with self._stats_lock:
+            window_start = time.perf_counter() - self.rate_window
+            while self._recent and self._recent[0] < window_start:
+                self._recent.popleft()
+            return {
+                'orders': dict(self._outcomes),
+                'orders_per_second': len(self._recent) / self.rate_window,
+                'latency': self._latency.snapshot(),
+                'replayed': self.replayed,
+                'entries': entries
+            }
+
+    def entry_counts(self) -> Dict[str, int]:
+        """Число записей журнала по статусу: pending, rejected, failed"""
+        with self._lock:
+            rows = self._journal.execute(
+                "SELECT status, COUNT(*) FROM outbox GROUP BY status"
+            ).fetchall()
+        counts = dict.fromkeys(ENTRY_STATUSES, 0)
+        counts.update(rows)
+        return counts
+
+    def pending_count(self) -> int:
+        """Число заказов, ожидающих переноса в хранилище"""
+        with self._lock:
+            return self._journal.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status = 'pending'"
+            ).fetchone()[0]
+
+    def replay(self) -> int:
+        """Переносит журнал в хранилище пачками и возвращает число перенесенных заказов
+
+        Пачка из batch_size заказов уходит одним вызовом place_orders.
+        Останавливается на первой ошибке связи. Заказы, отклоненные
+        хранилищем (rejected), и заказы с другими ошибками базы (failed)
+        остаются в журнале для разбора и перенос не останавливают.
+        """
+        replayed = 0
+        while True:
+            with self._lock:
+                batch = self._journal.execute("""
+                    SELECT id, order_number, payload FROM outbox
+                    WHERE status = 'pending' ORDER BY id LIMIT ?
+                """, (self.batch_size,)).fetchall()
+                if not batch:
+                    # Проверка и включение под одной блокировкой с _append()
+                    self._online.set()
+                    return replayed
+
+            orders = []
+            for _, order_number, payload in batch:
+                order = json.loads(payload)
+                order['items'] = [OrderItem(**item) for item in order['items']]
+                orders.append(dict(order, order_number=order_number))
+
+            unavailable = None
+            try:
+                results = self.db.place_orders(orders)
+            except UNAVAILABLE_ERRORS as e:
+                results, unavailable = [], e
+            except Exception as e:
+                # Пачка целиком не прошла не из-за связи: переносим ее заказы по
+                # одному, чтобы отложить только тот, что вызвал ошибку
+                logger.warning("Пачка из журнала не перенесена, перенос по одному: %s", e)
+                results = []
+                for order in orders:
+                    try:
+                        results.append(self.db.place_order(**order))
+                    except UNAVAILABLE_ERRORS as error:
+                        unavailable = error
+                        break
+                    except Exception as error:
+                        results.append(error)
+
+            placed = []
+            for (entry_id, order_number, _), result in zip(batch, results):
+                if not isinstance(result, Exception):
+                    placed.append(entry_id)
+                elif isinstance(result, ValueError):
+                    logger.error("Заказ из журнала отклонен: %s", result,
+                                 extra={'order_number': order_number})
+                    self._mark([entry_id], 'rejected', str(result))
+                else:
+                    # Ошибка данных заказа (DataError, IntegrityError) не исправится
+                    # повтором: откладываем заказ и переносим следующие
+                    logger.error("Заказ из журнала не перенесен: %s", result,
+                                 extra={'order_number': order_number})
+                    self._mark([entry_id], 'failed', str(result))
+
+            self._delete(placed)
+            replayed += len(placed)
+
+            if unavailable is not None:
+                # Связь пропала: неотправленные заказы ждут следующего переноса
+                self._mark([entry_id for entry_id, _, _ in batch[len(results):]],
+                           'pending', str(unavailable))
+                return replayed
+
+    def _delete(self, entry_ids: List[int]) -> None:
+        """Удаляет перенесенные заказы из журнала одной транзакцией"""
+        with self._lock:
+            self._journal.execute("BEGIN")
+            self._journal.executemany("DELETE FROM outbox WHERE id = ?",
+                                      [(entry_id,) for entry_id in entry_ids])
+            self._journal.execute("COMMIT")
+        with self._stats_lock:
+            self.replayed += len(entry_ids)
+
+    def _mark(self, entry_ids: List[int], status: str, error: str) -> None:
+        with self._lock:
+            self._journal.execute("BEGIN")
+            self._journal.executemany("""
+                UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ?
+                WHERE id = ?
+            """, [(status, error, entry_id) for entry_id in entry_ids])
+            self._journal.execute("COMMIT")
+
+    def _replay_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.retry_interval)
+            self._wake.clear()
+            if self._stop.is_set() or self._online.is_set():
+                continue
+            try:
+                replayed = self.replay()
+                if replayed:
+                    logger.info("Из журнала перенесено заказов: %s", replayed)
+            except Exception as e:
+                logger.warning("Ошибка переноса журнала заказов: %s", e)
+
+    def close(self) -> None:
+        """Останавливает перенос и закрывает журнал; неперенесенное остается на диске"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self.timeout + self.retry_interval)
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            self._journal.close()
@@ -3,12 +3,22 @@ restaurant_gui.py
 Графический интерфейс системы заказа еды на Tkinter - ПОЛНОСТЬЮ ОБНОВЛЕННЫЙ
 """
 
+import time
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 from tkinter.font import Font
-from database import PostgreSQLDatabase
+from app_logging import get_logger, setup_logging
+from gui_tasks import TaskExecutor
+from gui_tables import VirtualTreeview
+from menu_index import MenuIndex, MenuSearch
 from models import OrderItem
-import threading
+
+logger = get_logger("gui")
+
+# Пауза после последнего нажатия клавиши перед поиском, мс
+SEARCH_DELAY_MS = 150
+# Интервал перечитывания меню, когда хранилище не сообщает его версию, с
+MENU_RELOAD_INTERVAL = 30
 
 
 class RestaurantGUI:
@@ -19,11 +29,16 @@ class RestaurantGUI:
         self.root.title("🍽️ Ресторан 'Вкусно и Точка'")
         self.root.geometry("1300x750")
 
-        print("Инициализация GUI...")
+        logger.info("Инициализация GUI...")
+        # Моменты запуска (time.time()): окно показано, база подключена, меню загружено
+        self.startup_times = {'started': time.time()}
 
-        # Инициализация базы данных
-        print("Подключение к базе данных...")
-        self.db = PostgreSQLDatabase()
+        # Хранилище подключается в фоне после показа окна
+        self.db = None
+        self.outbox = None
+        self.metrics_server = None
+        # Запросы к базе выполняются в фоне, окно не ждет сети
+        self.tasks = TaskExecutor(self.root)
 
         # Текущие данные
         self.current_order_items = []
@@ -31,6 +46,12 @@ class RestaurantGUI:
         self.customer_info = {}
         self.all_menu_items = []
         self.menu_items_cache = []
+        self.menu_version = None
+        self.menu_loaded_at = 0.0
+        # Поисковый индекс строится один раз на версию меню
+        self.menu_index = MenuIndex([])
+        self.menu_search = MenuSearch(self.menu_index)
+        self.search_job = None
 
         # Словарь статусов на русском
         self.status_dict = {
@@ -56,20 +77,96 @@ class RestaurantGUI:
         self.setup_styles()
 
         # Создание интерфейса
-        print("Создание интерфейса...")
+        logger.info("Создание интерфейса...")
         self.create_widgets()
 
-        # Загрузка данных
-        print("Загрузка данных меню...")
-        self.load_menu_data()
-
         # Центрирование окна
         self.center_window()
 
         # Обработка закрытия окна
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
-        print("GUI инициализирован успешно!")
+        # Окно рисуется, как только цикл событий освободится; база и меню
+        # загружаются в фоне
+        self.root.bind("<Map>", self.on_first_map, add="+")
+        self.connect_database()
+
+        logger.info("GUI инициализирован успешно!")
+
+    def mark_startup(self, stage):
+        """Запоминает момент этапа запуска и пишет его в журнал"""
+        if stage not in self.startup_times:
+            self.startup_times[stage] = time.time()
+            logger.info("Этап запуска %s: %.0f мс", stage,
+                        (self.startup_times[stage] - self.startup_times['started']) * 1000)
+
+    def on_first_map(self, event):
+        """Отмечает первую отрисовку, когда оконный менеджер показал окно"""
+        # <Map> корня приходит и от каждого дочернего виджета
+        if event.widget is not self.root or "first_paint" in self.startup_times:
+            return
+        # Отложенные перерисовки виджетов выполняются до отметки
+        self.root.update_idletasks()
+        if self.root.winfo_ismapped():
+            self.mark_startup("first_paint")
+
+    def connect_database(self):
+        """Подключается к хранилищу в фоне, показывая индикатор загрузки"""
+        logger.info("Подключение к базе данных...")
+        self.show_loading("Подключение к базе данных...")
+        self.tasks.submit(self.open_database, key="connect",
+                          on_success=self.on_database_ready,
+                          on_error=self.on_database_error)
+
+    @staticmethod
+    def open_database():
+        """Открывает хранилище, журнал заказов и сервер метрик; выполняется в фоновом потоке"""
+        # Модули хранилища (psycopg2, dotenv, http.server) загружаются здесь,
+        # а не при запуске: окно появляется, не дожидаясь их
+        from storage import create_database
+        from outbox import OrderOutbox
+        from metrics import start_metrics_server
+
+        db = create_database()
+        # Заказы при недоступной базе сохраняются в локальный журнал
+        outbox = OrderOutbox(db)
+        outbox.start()
+        # HTTP-сервер метрик при заданном METRICS_PORT
+        return db, outbox, start_metrics_server(db, outbox)
+
+    def on_database_ready(self, result):
+        self.db, self.outbox, self.metrics_server = result
+        self.mark_startup("connected")
+        self.validate_checkout_button()
+
+        # Загрузка данных
+        logger.info("Загрузка данных меню...")
+        self.load_menu_data()
+        self.root.after(1000, self.watch_menu_changes)
+
+    def on_database_error(self, error):
+        self.hide_loading()
+        self.update_status(f"Нет подключения к базе данных: {str(error)}", error=True)
+        logger.error("Ошибка подключения к базе данных: %s", error, exc_info=error)
+        if messagebox.askretrycancel("Ошибка", f"Не удалось подключиться к базе данных:\n{str(error)}"):
+            self.connect_database()
+
+    def database_ready(self):
+        """Подключено ли хранилище; если нет - сообщает об этом в статусе"""
+        if self.db is None:
+            self.update_status("Подключение к базе данных еще не завершено")
+            return False
+        return True
+
+    def show_loading(self, message):
+        """Показывает сообщение и бегущий индикатор загрузки"""
+        self.update_status(message)
+        self.loading_bar.grid()
+        self.loading_bar.start(15)
+
+    def hide_loading(self):
+        self.loading_bar.stop()
+        self.loading_bar.grid_remove()
 
     def setup_styles(self):
         """Настраивает стили интерфейса"""
@@ -155,14 +252,23 @@ class RestaurantGUI:
         self.create_cart_section(content_frame)
 
         # Статус бар
+        status_frame = ttk.Frame(main_container)
+        status_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E))
+        status_frame.columnconfigure(0, weight=1)
+
         self.status_bar = ttk.Label(
-            main_container,
+            status_frame,
             text="Готов к работе",
             relief=tk.SUNKEN,
             anchor=tk.W,
             font=self.normal_font
         )
-        self.status_bar.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E))
+        self.status_bar.grid(row=0, column=0, sticky=(tk.W, tk.E))
+
+        # Индикатор загрузки: виден, пока подключается база и грузится меню
+        self.loading_bar = ttk.Progressbar(status_frame, mode="indeterminate", length=160)
+        self.loading_bar.grid(row=0, column=1, padx=(10, 0))
+        self.loading_bar.grid_remove()
 
     def create_menu_section(self, parent):
         """Создает секцию меню"""
@@ -237,14 +343,12 @@ class RestaurantGUI:
         self.menu_tree.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
 
         # Скроллбар для таблицы
-        scrollbar = ttk.Scrollbar(
-            menu_frame,
-            orient=tk.VERTICAL,
-            command=self.menu_tree.yview
-        )
-        self.menu_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar = ttk.Scrollbar(menu_frame, orient=tk.VERTICAL)
         scrollbar.grid(row=1, column=1, sticky=(tk.N, tk.S))
 
+        # В таблице - только видимые строки меню; они обновляются по ID блюда
+        self.menu_view = VirtualTreeview(self.menu_tree, scrollbar)
+
         # Кнопки добавления в корзину
         add_frame = ttk.Frame(menu_frame)
         add_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(12, 0))
@@ -414,51 +518,90 @@ class RestaurantGUI:
         self.cart_tree.bind("<<TreeviewSelect>>", self.validate_checkout_button)
 
     def load_menu_data(self):
-        """Загружает данные меню в таблицу - ПОКАЗЫВАЕМ ВСЕ БЛЮДА"""
-        try:
-            # Получаем ВСЕ блюда, включая недоступные
-            self.all_menu_items = self.db.get_menu_items(available_only=False)
-            self.menu_items_cache = self.all_menu_items.copy()
+        """Загружает данные меню в таблицу в фоне - ПОКАЗЫВАЕМ ВСЕ БЛЮДА"""
+        if not self.database_ready():
+            return
 
-            # Очищаем таблицу
-            for item in self.menu_tree.get_children():
-                self.menu_tree.delete(item)
-
-            # Заполняем таблицу из кэша
-            for item in self.menu_items_cache:
-                available_icon = "✓" if item.is_available else "✗"
-                reason = f" ({item.unavailability_reason})" if not item.is_available and item.unavailability_reason else ""
-
-                # Форматируем название для отображения
-                display_name = f"{item.name}{reason}"
-
-                self.menu_tree.insert("", tk.END, values=(
-                    item.id,
-                    display_name,  # ТОЛЬКО имя и причина
-                    f"{item.price:.2f} ₽",
-                    item.category_name,
-                    "Да" if item.is_available else "Нет",
-                    item.calories or "-"
-                ))
+        self.show_loading("Загрузка меню...")
+        self.tasks.submit(self.fetch_menu, key="menu",
+                          on_success=self.show_menu_data,
+                          on_error=self.on_menu_load_error)
+
+    def fetch_menu(self):
+        """Читает версию и меню и строит поисковый индекс; выполняется в фоновом потоке"""
+        # Версию и время берем до чтения, чтобы не пропустить изменение во время загрузки
+        version, loaded_at = self.db.get_menu_version(), time.monotonic()
+        # Блюда и категории одним запросом, включая недоступные блюда
+        menu = self.db.get_menu_grouped(available_only=False)
+        index = MenuIndex((item for _, items in menu for item in items), version)
+        return version, loaded_at, menu, index
+
+    def set_menu(self, result):
+        """Запоминает загруженное меню и его поисковый индекс; возвращает меню"""
+        self.menu_version, self.menu_loaded_at, menu, self.menu_index = result
+        self.all_menu_items = self.menu_index.items
+        self.menu_search = MenuSearch(self.menu_index)
+        return menu
+
+    def show_menu_data(self, result):
+        """Показывает загруженное меню и сбрасывает фильтры"""
+        menu = self.set_menu(result)
+        self.menu_items_cache = self.all_menu_items.copy()
+
+        # Приводим таблицу к кэшу: меняются только изменившиеся видимые строки
+        self.menu_view.set_rows(self.menu_row(item) for item in self.menu_items_cache)
+
+        # Обновляем список категорий
+        if menu:
+            category_names = ["Все"] + [category.name for category, _ in menu]
+            self.category_combo["values"] = category_names
+        else:
+            self.category_combo["values"] = ["Все"]
+            logger.warning("Категории не найдены")
 
-            # Обновляем список категорий
-            categories = self.db.get_all_categories()
-            if categories:
-                category_names = ["Все"] + [cat.name for cat in categories]
-                self.category_combo["values"] = category_names
-            else:
-                self.category_combo["values"] = ["Все"]
-                print("⚠ Категории не найдены")
+        # Сбрасываем фильтры
+        self.category_var.set("Все")
+        self.search_var.set("")
 
-            # Сбрасываем фильтры
-            self.category_var.set("Все")
-            self.search_var.set("")
+        self.hide_loading()
+        self.update_status(f"Меню загружено: {len(self.all_menu_items)} блюд")
+        self.mark_startup("interactive")
 
-            self.update_status(f"Меню загружено: {len(self.all_menu_items)} блюд")
+    def on_menu_load_error(self, error):
+        self.hide_loading()
+        self.update_status(f"Ошибка загрузки меню: {str(error)}", error=True)
+        logger.error("Ошибка загрузки меню: %s", error, exc_info=error)
 
-        except Exception as e:
-            self.update_status(f"Ошибка загрузки меню: {str(e)}", error=True)
-            print(f"Подробности ошибки: {e}")
+    def watch_menu_changes(self):
+        """Раз в секунду сверяет версию меню и подхватывает чужие изменения
+
+        Если хранилище версию не сообщает (кэш меню выключен или слушатель
+        уведомлений отключен), меню перечитывается раз в MENU_RELOAD_INTERVAL секунд.
+        """
+        # Пока меню загружается, сверять версию не с чем
+        if not self.tasks.is_pending("menu"):
+            self.tasks.submit(self.db.get_menu_version, key="menu_version",
+                              on_success=self.on_menu_version)
+        self.root.after(1000, self.watch_menu_changes)
+
+    def on_menu_version(self, version):
+        if self.tasks.is_pending("menu"):
+            return
+        if version is None:
+            stale = time.monotonic() - self.menu_loaded_at >= MENU_RELOAD_INTERVAL
+        else:
+            stale = version != self.menu_version
+        if stale:
+            self.refresh_menu_data()
+
+    def refresh_menu_data(self):
+        """Перечитывает меню в фоне, сохраняя выбранную категорию и поиск"""
+        self.tasks.submit(self.fetch_menu, key="menu", on_success=self.show_refreshed_menu)
+
+    def show_refreshed_menu(self, result):
+        menu = self.set_menu(result)
+        self.category_combo["values"] = ["Все"] + [category.name for category, _ in menu]
+        self.filter_menu_by_category()
 
     def reset_filters(self):
         """Сбрасывает все фильтры"""
@@ -467,73 +610,46 @@ class RestaurantGUI:
         self.filter_menu_by_category()
 
     def filter_menu_by_category(self, event=None):
-        """Фильтрует меню по категории"""
-        category = self.category_var.get()
-        search_term = self.search_var.get().lower()
+        """Фильтрует меню по категории и поисковому запросу"""
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+            self.search_job = None
 
-        # Фильтруем кэш
-        if category == "Все":
-            filtered_items = self.all_menu_items
-        else:
-            filtered_items = [item for item in self.all_menu_items
-                            if item.category_name == category]
-
-        # Применяем поиск если есть
-        if search_term:
-            filtered_items = [item for item in filtered_items
-                            if search_term in item.name.lower() or
-                            search_term in item.description.lower()]
-
-        self.menu_items_cache = filtered_items
+        category = self.category_var.get()
+        self.menu_items_cache = self.menu_search.search(
+            self.search_var.get(), None if category == "Все" else category
+        )
 
         # Обновляем таблицу
         self.update_menu_table()
 
     def search_menu(self, event=None):
-        """Поиск в меню"""
-        search_term = self.search_var.get().lower()
-        category = self.category_var.get()
-
-        # Фильтруем по категории
-        if category == "Все":
-            base_items = self.all_menu_items
-        else:
-            base_items = [item for item in self.all_menu_items
-                         if item.category_name == category]
-
-        # Фильтруем по поисковому запросу
-        if search_term:
-            filtered_items = [item for item in base_items
-                            if search_term in item.name.lower() or
-                            search_term in item.description.lower()]
-        else:
-            filtered_items = base_items
-
-        self.menu_items_cache = filtered_items
-        self.update_menu_table()
+        """Поиск в меню: выполняется после паузы в наборе"""
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DELAY_MS, self.filter_menu_by_category)
+
+    @staticmethod
+    def menu_row(item):
+        """Строка таблицы меню: (ключ строки, значения колонок)"""
+        reason = f" ({item.unavailability_reason})" if not item.is_available and item.unavailability_reason else ""
+
+        # Форматируем название для отображения
+        display_name = f"{item.name}{reason}"
+
+        return str(item.id), (
+            item.id,
+            display_name,  # ТОЛЬКО имя и причина
+            f"{item.price:.2f} ₽",
+            item.category_name,
+            "Да" if item.is_available else "Нет",
+            item.calories or "-"
+        )
 
     def update_menu_table(self):
         """Обновляет таблицу меню из кэша"""
-        # Очищаем таблицу
-        for item in self.menu_tree.get_children():
-            self.menu_tree.delete(item)
-
-        # Заполняем таблицу из кэша
-        for item in self.menu_items_cache:
-            available_icon = "✓" if item.is_available else "✗"
-            reason = f" ({item.unavailability_reason})" if not item.is_available and item.unavailability_reason else ""
-
-            # Форматируем название для отображения
-            display_name = f"{item.name}{reason}"
-
-            self.menu_tree.insert("", tk.END, values=(
-                item.id,
-                display_name,  # ТОЛЬКО имя и причина
-                f"{item.price:.2f} ₽",
-                item.category_name,
-                "Да" if item.is_available else "Нет",
-                item.calories or "-"
-            ))
+        # Приводим таблицу к кэшу: меняются только изменившиеся видимые строки
+        self.menu_view.set_rows(self.menu_row(item) for item in self.menu_items_cache)
 
         # Обновляем статус
         if self.menu_items_cache:
@@ -544,11 +660,11 @@ class RestaurantGUI:
 
     def on_menu_item_select(self, event):
         """Обработка выбора блюда в меню"""
-        selection = self.menu_tree.selection()
+        selection = self.menu_view.selection()
 
         if selection:
             # Получаем значения выбранной строки
-            values = self.menu_tree.item(selection[0], "values")
+            values = self.menu_view.values(selection[0])
             if not values:
                 self.add_to_cart_btn.config(state=tk.DISABLED)
                 return
@@ -557,12 +673,8 @@ class RestaurantGUI:
                 # Первое значение - ID
                 item_id = int(values[0])
 
-                # Ищем в кэше
-                menu_item = None
-                for item in self.menu_items_cache:
-                    if item.id == item_id:
-                        menu_item = item
-                        break
+                # Ищем в индексе меню
+                menu_item = self.menu_index.by_id.get(item_id)
 
                 if menu_item:
                     # Активируем кнопку добавления только если блюдо доступно
@@ -600,7 +712,7 @@ class RestaurantGUI:
                     self.add_to_cart_btn.config(state=tk.DISABLED)
 
             except (ValueError, IndexError) as e:
-                print(f"Ошибка при обработке выбора: {e}")
+                logger.warning("Ошибка при обработке выбора: %s", e)
                 self.add_to_cart_btn.config(state=tk.DISABLED)
                 self.details_text.config(state=tk.NORMAL)
                 self.details_text.delete(1.0, tk.END)
@@ -612,13 +724,13 @@ class RestaurantGUI:
     def add_to_cart(self):
         """Добавляет выбранное блюдо в корзину - С ПРОВЕРКОЙ ДОСТУПНОСТИ"""
         try:
-            selection = self.menu_tree.selection()
+            selection = self.menu_view.selection()
             if not selection:
                 messagebox.showwarning("Внимание", "Выберите блюдо из меню")
                 return
 
             # Получаем значения выбранной строки
-            values = self.menu_tree.item(selection[0], "values")
+            values = self.menu_view.values(selection[0])
             if not values:
                 messagebox.showerror("Ошибка", "Не удалось получить данные блюда")
                 return
@@ -626,12 +738,8 @@ class RestaurantGUI:
             # Первое значение - ID
             item_id = int(values[0])
 
-            # Находим блюдо в кэше для проверки доступности
-            menu_item = None
-            for item in self.menu_items_cache:
-                if item.id == item_id:
-                    menu_item = item
-                    break
+            # Находим блюдо в индексе меню для проверки доступности
+            menu_item = self.menu_index.by_id.get(item_id)
 
             if not menu_item:
                 messagebox.showerror("Ошибка", "Блюдо не найдено")
@@ -688,7 +796,7 @@ class RestaurantGUI:
 
         except Exception as e:
             messagebox.showerror("Ошибка", f"Произошла ошибка: {str(e)}")
-            print(f"Подробности ошибки в add_to_cart: {e}")
+            logger.exception("Ошибка в add_to_cart: %s", e)
 
     def remove_from_cart(self):
         """Удаляет выбранный элемент из корзины"""
@@ -744,7 +852,7 @@ class RestaurantGUI:
 
     def validate_checkout_button(self, event=None):
         """Проверяет, можно ли активировать кнопку оформления"""
-        has_items = len(self.current_order_items) > 0
+        has_items = len(self.current_order_items) > 0 and self.outbox is not None
         has_name = self.customer_entries["name"].get().strip() != ""
         has_phone = self.customer_entries["phone"].get().strip() != ""
 
@@ -755,6 +863,9 @@ class RestaurantGUI:
 
     def process_order(self):
         """Оформляет заказ"""
+        if not self.database_ready():
+            return
+
         try:
             # Проверяем обязательные поля
             name = self.customer_entries["name"].get().strip()
@@ -772,36 +883,31 @@ class RestaurantGUI:
                 messagebox.showerror("Ошибка", "Имя и телефон обязательны для заполнения")
                 return
 
-            # Создаем заказ в отдельном потоке
-            def create_order_thread():
-                try:
-                    # Находим или создаем клиента
-                    customer = self.db.find_or_create_customer(
-                        name, phone, email, address
-                    )
-
-                    # Создаем заказ
-                    order_id, order_number = self.db.create_order(
-                        customer_id=customer.id,
-                        items=self.current_order_items,
-                        delivery_address=address,
-                        notes=notes,
-                        payment_method="cash"
-                    )
-
-                    # Обновляем интерфейс в основном потоке
-                    self.root.after(0, self.order_success, order_number, customer, address)
-
-                except Exception as e:
-                    self.root.after(0, lambda: messagebox.showerror(
-                        "Ошибка оформления", f"Произошла ошибка: {str(e)}"
-                    ))
-                    self.root.after(0, lambda: self.update_status(
-                        f"Ошибка оформления: {str(e)}", error=True
-                    ))
-
-            # Запускаем поток
-            threading.Thread(target=create_order_thread, daemon=True).start()
+            items = list(self.current_order_items)
+
+            def on_placed(result):
+                order_id, order_number, total_amount = result
+                self.order_success(order_number, name, phone, address, total_amount,
+                                   order_id is None)
+
+            def on_failed(error):
+                messagebox.showerror("Ошибка оформления", f"Произошла ошибка: {error}")
+                self.update_status(f"Ошибка оформления: {error}", error=True)
+
+            # Клиент, заказ и позиции сохраняются на сервере одним вызовом в
+            # фоновом потоке; без связи с базой заказ уходит в локальный журнал
+            self.tasks.submit(
+                self.outbox.place_order,
+                name=name,
+                phone=phone,
+                items=items,
+                email=email,
+                address=address,
+                notes=notes,
+                payment_method="cash",
+                on_success=on_placed,
+                on_error=on_failed
+            )
 
             # Показываем индикатор загрузки
             self.update_status("Оформление заказа...")
@@ -809,21 +915,26 @@ class RestaurantGUI:
         except Exception as e:
             messagebox.showerror("Ошибка", f"Произошла ошибка: {str(e)}")
 
-    def order_success(self, order_number, customer, address):
+    def order_success(self, order_number, name, phone, address, total_amount,
+                      provisional=False):
         """Обработка успешного оформления заказа"""
         # Показываем сообщение об успехе
         success_msg = f"""
 ✅ Заказ успешно оформлен!
 
 Номер заказа: {order_number}
-Имя: {customer.name}
-Телефон: {customer.phone}
-Сумма: {self.cart_total:.2f} ₽
+Имя: {name}
+Телефон: {phone}
+Сумма: {total_amount:.2f} ₽
         """
 
         if address:
             success_msg += f"\nАдрес доставки: {address}"
 
+        if provisional:
+            success_msg += ("\n\nНет связи с базой данных: заказ сохранен на кассе "
+                            "и будет передан автоматически, сумма предварительная.")
+
         success_msg += "\n\nСпасибо за заказ!"
 
         messagebox.showinfo("Заказ оформлен", success_msg)
@@ -858,75 +969,89 @@ class RestaurantGUI:
                 widget.delete(1.0, tk.END)
 
     def show_statistics(self):
-        """Показывает статистику в отдельном окне"""
-        try:
-            stats = self.db.get_order_statistics()
-
-            # Создаем окно статистики
-            stats_window = tk.Toplevel(self.root)
-            stats_window.title("📊 Статистика заказов")
-            stats_window.geometry("600x500")
-            stats_window.transient(self.root)
-            stats_window.grab_set()
-
-            # Центрируем окно
-            stats_window.update_idletasks()
-            x = self.root.winfo_x() + (self.root.winfo_width() // 2) - (600 // 2)
-            y = self.root.winfo_y() + (self.root.winfo_height() // 2) - (500 // 2)
-            stats_window.geometry(f"600x500+{x}+{y}")
-
-            # Создаем содержимое
-            content_frame = ttk.Frame(stats_window, padding="25")
-            content_frame.pack(fill=tk.BOTH, expand=True)
-
-            # Основная статистика
-            ttk.Label(
-                content_frame,
-                text="Общая статистика",
-                font=Font(family="Helvetica", size=14, weight="bold")
-            ).pack(anchor=tk.W, pady=(0, 15))
+        """Загружает статистику в фоне и показывает ее в отдельном окне"""
+        if not self.database_ready():
+            return
 
-            stats_text = f"""
+        self.update_status("Загрузка статистики...")
+        self.tasks.submit(
+            self.db.get_order_statistics,
+            key="statistics",
+            on_success=self.show_statistics_window,
+            on_error=lambda e: messagebox.showerror(
+                "Ошибка", f"Не удалось загрузить статистику: {str(e)}"
+            )
+        )
+
+    def show_statistics_window(self, stats):
+        """Показывает загруженную статистику в отдельном окне"""
+        self.update_status("Статистика загружена")
+
+        # Создаем окно статистики
+        stats_window = tk.Toplevel(self.root)
+        stats_window.title("📊 Статистика заказов")
+        stats_window.geometry("600x500")
+        stats_window.transient(self.root)
+        stats_window.grab_set()
+
+        # Центрируем окно
+        stats_window.update_idletasks()
+        x = self.root.winfo_x() + (self.root.winfo_width() // 2) - (600 // 2)
+        y = self.root.winfo_y() + (self.root.winfo_height() // 2) - (500 // 2)
+        stats_window.geometry(f"600x500+{x}+{y}")
+
+        # Создаем содержимое
+        content_frame = ttk.Frame(stats_window, padding="25")
+        content_frame.pack(fill=tk.BOTH, expand=True)
+
+        # Основная статистика
+        ttk.Label(
+            content_frame,
+            text="Общая статистика",
+            font=Font(family="Helvetica", size=14, weight="bold")
+        ).pack(anchor=tk.W, pady=(0, 15))
+
+        stats_text = f"""
 Всего заказов: {stats['total_orders']}
 Общая выручка: {stats['total_revenue']:.2f} ₽
 Средний чек: {stats['avg_order_value']:.2f} ₽
 Уникальных клиентов: {stats['unique_customers']}
-            """
+        """
+
+        ttk.Label(
+            content_frame,
+            text=stats_text.strip(),
+            font=self.normal_font
+        ).pack(anchor=tk.W, pady=(0, 25))
 
+        # Популярные блюда
+        if stats['popular_items']:
             ttk.Label(
                 content_frame,
-                text=stats_text.strip(),
-                font=self.normal_font
-            ).pack(anchor=tk.W, pady=(0, 25))
+                text="Самые популярные блюда:",
+                font=Font(family="Helvetica", size=12, weight="bold")
+            ).pack(anchor=tk.W, pady=(0, 10))
 
-            # Популярные блюда
-            if stats['popular_items']:
+            for item_name, quantity in stats['popular_items'][:8]:
                 ttk.Label(
                     content_frame,
-                    text="Самые популярные блюда:",
-                    font=Font(family="Helvetica", size=12, weight="bold")
-                ).pack(anchor=tk.W, pady=(0, 10))
-
-                for item_name, quantity in stats['popular_items'][:8]:
-                    ttk.Label(
-                        content_frame,
-                        text=f"  • {item_name}: {quantity} шт.",
-                        font=self.normal_font
-                    ).pack(anchor=tk.W)
-
-            # Кнопка закрытия
-            ttk.Button(
-                content_frame,
-                text="Закрыть",
-                command=stats_window.destroy,
-                width=15
-            ).pack(side=tk.BOTTOM, pady=(20, 0))
+                    text=f"  • {item_name}: {quantity} шт.",
+                    font=self.normal_font
+                ).pack(anchor=tk.W)
 
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить статистику: {str(e)}")
+        # Кнопка закрытия
+        ttk.Button(
+            content_frame,
+            text="Закрыть",
+            command=stats_window.destroy,
+            width=15
+        ).pack(side=tk.BOTTOM, pady=(20, 0))
 
     def show_admin_panel(self):
         """Показывает административную панель"""
+        if not self.database_ready():
+            return
+
         # Создаем окно админ-панели
         admin_window = tk.Toplevel(self.root)
         admin_window.title("🔐 Административная панель")
@@ -1039,8 +1164,7 @@ class RestaurantGUI:
         self.admin_orders_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
         # Скроллбар
-        scrollbar = ttk.Scrollbar(orders_container, orient=tk.VERTICAL, command=self.admin_orders_tree.yview)
-        self.admin_orders_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar = ttk.Scrollbar(orders_container, orient=tk.VERTICAL)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
         # Панель деталей заказа
@@ -1057,35 +1181,58 @@ class RestaurantGUI:
         )
         self.admin_order_details_text.pack(fill=tk.BOTH, expand=True)
 
+        # Курсор следующей страницы заказов
+        self.admin_orders_cursor = None
+
+        def order_rows(orders):
+            """Строки таблицы заказов: (номер заказа, значения колонок)"""
+            for order in orders:
+                # Конвертируем статус на русский
+                status_russian = self.status_dict.get(order['status'], order['status'])
+                yield order['order_number'], (
+                    order['order_number'],
+                    order['created_at'].strftime("%Y-%m-%d %H:%M"),
+                    order['customer_name'],
+                    f"{order['total_amount']:.2f} ₽",
+                    status_russian
+                )
+
         # Функция для загрузки заказов
         def load_orders():
-            """Загружает заказы в таблицу"""
-            try:
-                # Очищаем таблицу
-                for item in self.admin_orders_tree.get_children():
-                    self.admin_orders_tree.delete(item)
-
-                # Загружаем заказы
-                orders = self.db.get_all_orders(limit=100)
-                if orders:
-                    for order in orders:
-                        # Конвертируем статус на русский
-                        status_russian = self.status_dict.get(order['status'], order['status'])
-                        self.admin_orders_tree.insert("", tk.END, values=(
-                            order['order_number'],
-                            order['created_at'].strftime("%Y-%m-%d %H:%M"),
-                            order['customer_name'],
-                            f"{order['total_amount']:.2f} ₽",
-                            status_russian
-                        ))
-                else:
-                    # Если нет заказов, показываем сообщение
-                    self.admin_orders_tree.insert("", tk.END, values=(
-                        "Нет данных", "", "", "", ""
-                    ))
+            """Загружает первую страницу заказов в таблицу в фоне"""
+            self.tasks.submit(self.db.get_orders_page, limit=100, key="admin_orders",
+                              widget=window, on_success=show_orders,
+                              on_error=lambda e: messagebox.showerror(
+                                  "Ошибка", f"Не удалось загрузить заказы: {str(e)}"))
+
+        def show_orders(page):
+            orders, self.admin_orders_cursor = page
+            if orders:
+                self.admin_orders_view.set_rows(order_rows(orders),
+                                                has_more=bool(self.admin_orders_cursor),
+                                                keep_position=False)
+            else:
+                # Если нет заказов, показываем сообщение
+                self.admin_orders_view.set_rows([("empty", ("Нет данных", "", "", "", ""))])
+
+        def load_more_orders():
+            """Догружает следующую страницу более старых заказов при прокрутке к концу"""
+            self.tasks.submit(self.db.get_orders_page, limit=100, cursor=self.admin_orders_cursor,
+                              key="admin_orders", widget=window,
+                              on_success=show_more_orders, on_error=on_more_orders_error)
+
+        def show_more_orders(page):
+            orders, self.admin_orders_cursor = page
+            self.admin_orders_view.append_rows(order_rows(orders), has_more=bool(self.admin_orders_cursor))
+
+        def on_more_orders_error(error):
+            self.admin_orders_view.loading_failed()
+            messagebox.showerror("Ошибка", f"Не удалось загрузить заказы: {str(error)}")
 
-            except Exception as e:
-                messagebox.showerror("Ошибка", f"Не удалось загрузить заказы: {str(e)}")
+        # В таблице - только видимые заказы; следующая страница загружается
+        # по курсору, когда прокрутка подходит к концу загруженных
+        self.admin_orders_view = VirtualTreeview(self.admin_orders_tree, scrollbar,
+                                                 fetch_more=load_more_orders)
 
         # Функция для отображения деталей заказа
         def show_order_details(order_data):
@@ -1144,30 +1291,48 @@ Email: {order_data['customer_email'] or 'не указан'}
                 messagebox.showerror("Ошибка", "Неверный статус")
                 return
 
-            if self.db.update_order_status(self.selected_order_id, new_status_english):
-                messagebox.showinfo("Успех", f"Статус заказа {self.selected_order_number} обновлен на '{new_status_russian}'")
-                load_orders()
-            else:
-                messagebox.showerror("Ошибка", "Не удалось обновить статус заказа")
+            order_number = self.selected_order_number
+
+            def on_updated(success):
+                if success:
+                    messagebox.showinfo("Успех", f"Статус заказа {order_number} обновлен на '{new_status_russian}'")
+                    load_orders()
+                else:
+                    messagebox.showerror("Ошибка", "Не удалось обновить статус заказа")
+
+            self.tasks.submit(self.db.update_order_status, self.selected_order_id, new_status_english,
+                              widget=window, on_success=on_updated,
+                              on_error=lambda e: messagebox.showerror(
+                                  "Ошибка", f"Не удалось обновить статус заказа: {str(e)}"))
 
         # Обработка выбора заказа
         def on_order_select(event):
-            selection = self.admin_orders_tree.selection()
+            selection = self.admin_orders_view.selection()
             if selection:
-                values = self.admin_orders_tree.item(selection[0], "values")
+                values = self.admin_orders_view.values(selection[0])
+                # Строка вернулась в окно прокрутки: заказ уже загружен
+                if values[0] == self.selected_order_number and self.selected_order_id:
+                    return
                 self.selected_order_number = values[0]
+                # До загрузки деталей статус менять нельзя: заказ еще не известен
+                self.selected_order_id = None
+
+                # Полную информацию о заказе загружаем в фоне; детали прежнего
+                # выбора, не успевшие загрузиться, отбрасываются
+                self.tasks.submit(self.db.get_order_by_number, self.selected_order_number,
+                                  key="admin_order_details", widget=window,
+                                  on_success=on_order_loaded)
 
-                # Получаем полную информацию о заказе
-                order_data = self.db.get_order_by_number(self.selected_order_number)
-                if order_data:
-                    self.selected_order_id = order_data['order_id']
+        def on_order_loaded(order_data):
+            if order_data:
+                self.selected_order_id = order_data['order_id']
 
-                    # Устанавливаем текущий статус
-                    status_russian = self.status_dict.get(order_data['status'], order_data['status'])
-                    self.status_var.set(status_russian)
+                # Устанавливаем текущий статус
+                status_russian = self.status_dict.get(order_data['status'], order_data['status'])
+                self.status_var.set(status_russian)
 
-                    # Показываем детали заказа
-                    show_order_details(order_data)
+                # Показываем детали заказа
+                show_order_details(order_data)
 
         self.admin_orders_tree.bind("<<TreeviewSelect>>", on_order_select)
 
@@ -1246,10 +1411,35 @@ Email: {order_data['customer_email'] or 'не указан'}
         stats_frame = ttk.Frame(notebook)
         notebook.add(stats_frame, text="📊 Детальная статистика")
 
-        # Показываем статистику
-        stats = self.db.get_order_statistics()
+        stats_label = ttk.Label(
+            stats_frame,
+            text="Загрузка статистики...",
+            font=Font(family="Helvetica", size=11),
+            justify=tk.LEFT
+        )
+        stats_label.pack(padx=30, pady=30, anchor=tk.W)
 
-        stats_text = f"""
+        # Заказы, не перенесенные из журнала: у клиентов уже есть их номера
+        outbox_label = ttk.Label(
+            stats_frame,
+            text="",
+            font=Font(family="Helvetica", size=11, weight="bold"),
+            foreground=self.accent_color,
+            justify=tk.LEFT
+        )
+        outbox_label.pack(padx=30, anchor=tk.W)
+
+        def show_outbox_entries(entries):
+            if entries['rejected'] or entries['failed']:
+                outbox_label.config(text=(
+                    "⚠ Заказы из журнала не перенесены в базу:\n"
+                    f"отклонены базой: {entries['rejected']}, не приняты из-за ошибки: "
+                    f"{entries['failed']}\n"
+                    f"Свяжитесь с клиентами. Журнал: {self.outbox.path}"
+                ))
+
+        def show_admin_statistics(stats):
+            stats_text = f"""
 Общая статистика:
 ------------------
 Всего заказов: {stats['total_orders']}
@@ -1260,16 +1450,18 @@ Email: {order_data['customer_email'] or 'не указан'}
 Самые популярные блюда (топ-10):
 -------------------------------"""
 
-        for i, (item_name, quantity) in enumerate(stats['popular_items'][:10], 1):
-            stats_text += f"\n{i}. {item_name}: {quantity} шт."
+            for i, (item_name, quantity) in enumerate(stats['popular_items'][:10], 1):
+                stats_text += f"\n{i}. {item_name}: {quantity} шт."
 
-        stats_label = ttk.Label(
-            stats_frame,
-            text=stats_text,
-            font=Font(family="Helvetica", size=11),
-            justify=tk.LEFT
-        )
-        stats_label.pack(padx=30, pady=30, anchor=tk.W)
+            stats_label.config(text=stats_text)
+
+        # Показываем статистику
+        self.tasks.submit(self.db.get_order_statistics, key="admin_statistics", widget=window,
+                          on_success=show_admin_statistics,
+                          on_error=lambda e: stats_label.config(
+                              text=f"Не удалось загрузить статистику: {str(e)}"))
+        self.tasks.submit(self.outbox.entry_counts, key="admin_outbox", widget=window,
+                          on_success=show_outbox_entries)
 
     def show_add_dish_dialog(self):
         """Показывает диалог добавления блюда"""
@@ -1289,10 +1481,8 @@ Email: {order_data['customer_email'] or 'не указан'}
         form_frame = ttk.Frame(dialog, padding="25")
         form_frame.pack(fill=tk.BOTH, expand=True)
 
-        # Получаем список категорий для выбора
-        categories = self.db.get_all_categories()
-        category_names = [cat.name for cat in categories]
-        category_ids = {cat.name: cat.id for cat in categories}
+        # Список категорий для выбора загружается в фоне
+        category_ids = {}
 
         fields = [
             ("Название блюда *:", "name", "entry"),
@@ -1319,12 +1509,22 @@ Email: {order_data['customer_email'] or 'не указан'}
                 entry.grid(row=i, column=1, sticky=(tk.W, tk.E), pady=8, padx=(15, 0))
                 entries[field] = entry
             elif field_type == "combo":
-                entry = ttk.Combobox(form_frame, values=category_names, state="readonly", width=33, font=self.normal_font)
+                entry = ttk.Combobox(form_frame, values=[], state="readonly", width=33, font=self.normal_font)
                 entry.grid(row=i, column=1, sticky=(tk.W, tk.E), pady=8, padx=(15, 0))
-                if category_names:
-                    entry.set(category_names[0])
                 entries[field] = entry
 
+        def show_categories(categories):
+            category_ids.update({cat.name: cat.id for cat in categories})
+            category_names = [cat.name for cat in categories]
+            entries["category"]["values"] = category_names
+            if category_names:
+                entries["category"].set(category_names[0])
+
+        self.tasks.submit(self.db.get_all_categories, key="dish_categories", widget=dialog,
+                          on_success=show_categories,
+                          on_error=lambda e: messagebox.showerror(
+                              "Ошибка", f"Не удалось загрузить категории: {str(e)}"))
+
         # Подсказка
         ttk.Label(
             form_frame,
@@ -1379,34 +1579,45 @@ Email: {order_data['customer_email'] or 'не указан'}
                 calories = int(calories_str) if calories_str else None
                 cooking_time = int(cooking_time_str) if cooking_time_str else None
 
-                # Сохраняем в базу
-                success = self.db.add_menu_item(
-                    name=name,
-                    description=description,
-                    price=price,
-                    category_id=category_id,
-                    calories=calories,
-                    cooking_time=cooking_time
-                )
+            except ValueError as e:
+                messagebox.showerror("Ошибка", f"Некорректные данные: {str(e)}")
+                return
 
+            def on_saved(success):
                 if success:
                     messagebox.showinfo("Успех", f"Блюдо '{name}' успешно добавлено в меню!")
                     dialog.destroy()
                     self.load_menu_data()
                 else:
+                    save_btn.config(state=tk.NORMAL)
                     messagebox.showerror("Ошибка", "Не удалось добавить блюдо. Проверьте данные.")
 
-            except ValueError as e:
-                messagebox.showerror("Ошибка", f"Некорректные данные: {str(e)}")
-            except Exception as e:
-                messagebox.showerror("Ошибка", f"Произошла ошибка: {str(e)}")
+            def on_failed(error):
+                save_btn.config(state=tk.NORMAL)
+                messagebox.showerror("Ошибка", f"Произошла ошибка: {str(error)}")
+
+            # Сохраняем в базу в фоне; повторное нажатие до ответа не создаст дубль
+            save_btn.config(state=tk.DISABLED)
+            self.tasks.submit(
+                self.db.add_menu_item,
+                name=name,
+                description=description,
+                price=price,
+                category_id=category_id,
+                calories=calories,
+                cooking_time=cooking_time,
+                widget=dialog,
+                on_success=on_saved,
+                on_error=on_failed
+            )
 
-        ttk.Button(
+        save_btn = ttk.Button(
             button_frame,
             text="💾 Сохранить",
             command=save_dish,
             width=15
-        ).pack(side=tk.LEFT, padx=8)
+        )
+        save_btn.pack(side=tk.LEFT, padx=8)
 
         ttk.Button(
             button_frame,
@@ -1440,17 +1651,9 @@ Email: {order_data['customer_email'] or 'не указан'}
             font=Font(family="Helvetica", size=11, weight="bold")
         ).grid(row=0, column=0, columnspan=2, sticky=tk.W, pady=(0, 15))
 
-        # Получаем список всех блюд
-        all_items = self.db.get_menu_items(available_only=False)
-        item_names = []
+        # Список всех блюд загружается в фоне
         item_ids = {}
 
-        for item in all_items:
-            status = "✓" if item.is_available else "✗"
-            reason = f" ({item.unavailability_reason})" if not item.is_available and item.unavailability_reason else ""
-            item_names.append(f"{item.id}. {status} {item.name}{reason}")
-            item_ids[item.id] = item
-
         ttk.Label(form_frame, text="Блюдо:", font=self.normal_font).grid(
             row=1, column=0, sticky=tk.W, pady=8
         )
@@ -1459,13 +1662,28 @@ Email: {order_data['customer_email'] or 'не указан'}
         item_combo = ttk.Combobox(
             form_frame,
             textvariable=selected_item_var,
-            values=item_names,
+            values=[],
             state="readonly",
             width=45,
             font=self.normal_font
         )
         item_combo.grid(row=1, column=1, sticky=(tk.W, tk.E), pady=8, padx=(15, 0))
 
+        def show_items(menu):
+            item_names = []
+            for _, items in menu:
+                for item in items:
+                    status = "✓" if item.is_available else "✗"
+                    reason = f" ({item.unavailability_reason})" if not item.is_available and item.unavailability_reason else ""
+                    item_names.append(f"{item.id}. {status} {item.name}{reason}")
+                    item_ids[item.id] = item
+            item_combo["values"] = item_names
+
+        self.tasks.submit(self.db.get_menu_grouped, key="availability_items", widget=dialog,
+                          on_success=show_items,
+                          on_error=lambda e: messagebox.showerror(
+                              "Ошибка", f"Не удалось загрузить меню: {str(e)}"))
+
         ttk.Label(form_frame, text="Новая доступность:", font=self.normal_font).grid(
             row=2, column=0, sticky=tk.W, pady=8
         )
@@ -1613,23 +1831,36 @@ Email: {order_data['customer_email'] or 'не указан'}
                     else:
                         unavailability_reason = reason
 
-                # Обновляем в базе данных
-                if self.db.update_menu_item_availability(item_id, is_available, unavailability_reason):
+            except ValueError:
+                messagebox.showerror("Ошибка", "Ошибка при обработке данных")
+                return
+
+            def on_updated(success):
+                if success:
                     messagebox.showinfo("Успех", "Доступность блюда обновлена!")
                     dialog.destroy()
                     self.load_menu_data()
                 else:
+                    update_btn.config(state=tk.NORMAL)
                     messagebox.showerror("Ошибка", "Не удалось обновить доступность")
 
-            except ValueError:
-                messagebox.showerror("Ошибка", "Ошибка при обработке данных")
+            def on_failed(error):
+                update_btn.config(state=tk.NORMAL)
+                messagebox.showerror("Ошибка", f"Не удалось обновить доступность: {str(error)}")
 
-        ttk.Button(
+            # Обновляем в базе данных в фоне
+            update_btn.config(state=tk.DISABLED)
+            self.tasks.submit(self.db.update_menu_item_availability,
+                              item_id, is_available, unavailability_reason,
+                              widget=dialog, on_success=on_updated, on_error=on_failed)
+
+        update_btn = ttk.Button(
             button_frame,
             text="🔄 Обновить",
             command=update_availability,
             width=15
-        ).pack(side=tk.LEFT, padx=8)
+        )
+        update_btn.pack(side=tk.LEFT, padx=8)
 
         ttk.Button(
             button_frame,
@@ -1648,12 +1879,23 @@ Email: {order_data['customer_email'] or 'не указан'}
     def on_closing(self):
         """Обработка закрытия окна"""
         if messagebox.askokcancel("Выход", "Вы уверены, что хотите выйти?"):
+            self.close()
+
+    def close(self):
+        """Останавливает фоновые задачи, закрывает хранилище и окно"""
+        self.tasks.shutdown()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.outbox is not None:
+            self.outbox.close()
+        if self.db is not None:
             self.db.close()
-            self.root.destroy()
+        self.root.destroy()
 
 
 def main():
     """Основная функция запуска GUI"""
+    setup_logging()
     root = tk.Tk()
 
     # Устанавливаем тему
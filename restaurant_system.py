@@ -3,7 +3,10 @@ restaurant_system.py
 Главный файл системы заказа еды с PostgreSQL
 """
 
-from database import PostgreSQLDatabase
+from storage import create_database
+from outbox import OrderOutbox
+from metrics import start_metrics_server
+from app_logging import setup_logging
 from models import OrderItem
 
 
@@ -11,20 +14,23 @@ class RestaurantSystem:
     """Основной класс системы ресторана"""
 
     def __init__(self):
-        self.db = PostgreSQLDatabase()
+        self.db = create_database()
+        # Заказы при недоступной базе сохраняются в локальный журнал
+        self.outbox = OrderOutbox(self.db)
+        self.outbox.start()
+        # HTTP-сервер метрик при заданном METRICS_PORT
+        self.metrics_server = start_metrics_server(self.db, self.outbox)
         self.current_order_items = []
 
     def display_menu_by_categories(self):
         """Показывает меню сгруппированное по категориям"""
-        categories = self.db.get_all_categories()
+        menu = self.db.get_menu_grouped(available_only=True)
 
         print(f"\n{'=' * 60}")
         print("МЕНЮ РЕСТОРАНА".center(60))
         print('=' * 60)
 
-        for category in categories:
-            items = self.db.get_menu_items(category_id=category.id, available_only=True)
-
+        for category, items in menu:
             if items:
                 print(f"\n{category.name.upper()} ({category.description}):")
                 print("-" * 40)
@@ -109,14 +115,15 @@ class RestaurantSystem:
             return
 
         try:
-            # Находим или создаем клиента
-            customer = self.db.find_or_create_customer(name, phone, email, address)
-
-            # Создаем заказ в базе данных
-            order_id, order_number = self.db.create_order(
-                customer_id=customer.id,
+            # Клиент, заказ и позиции сохраняются на сервере одним вызовом,
+            # цены пересчитываются по текущему меню; без связи с базой
+            # заказ уходит в локальный журнал
+            order_id, order_number, total_amount = self.outbox.place_order(
+                name=name,
+                phone=phone,
                 items=self.current_order_items,
-                delivery_address=address,
+                email=email,
+                address=address,
                 notes=notes,
                 payment_method="cash"
             )
@@ -125,11 +132,14 @@ class RestaurantSystem:
             print("ЗАКАЗ УСПЕШНО ОФОРМЛЕН!".center(60))
             print("=" * 60)
             print(f"Номер заказа: {order_number}")
-            print(f"Имя: {customer.name}")
-            print(f"Телефон: {customer.phone}")
+            print(f"Имя: {name}")
+            print(f"Телефон: {phone}")
             if address:
                 print(f"Адрес доставки: {address}")
-            print(f"Сумма: {sum(item.subtotal for item in self.current_order_items)}₽")
+            print(f"Сумма: {total_amount}₽")
+            if order_id is None:
+                print("Нет связи с базой: заказ сохранен локально и будет передан")
+                print("автоматически, сумма предварительная")
             print("=" * 60)
 
             # Очищаем текущий заказ
@@ -155,6 +165,11 @@ class RestaurantSystem:
             for item_name, quantity in stats['popular_items']:
                 print(f"  {item_name}: {quantity} шт.")
 
+        entries = self.outbox.entry_counts()
+        if entries['rejected'] or entries['failed']:
+            print(f"\n✗ Заказы из журнала не перенесены в базу: отклонены - {entries['rejected']}, "
+                  f"ошибка - {entries['failed']}. Свяжитесь с клиентами (журнал: {self.outbox.path})")
+
     def find_order(self):
         """Поиск заказа по номеру"""
         order_number = input("Введите номер заказа: ").strip()
@@ -222,21 +237,31 @@ class RestaurantSystem:
                 print("✗ Неверный выбор")
 
     def _show_all_orders(self):
-        """Показывает все заказы"""
-        orders = self.db.get_all_orders(limit=50)
-
-        print("\n" + "=" * 80)
-        print("ВСЕ ЗАКАЗЫ".center(80))
-        print("=" * 80)
-        print(f"{'Номер':<15} {'Дата':<20} {'Клиент':<20} {'Сумма':<10} {'Статус':<15}")
-        print("-" * 80)
-
-        for order in orders:
-            print(f"{order['order_number']:<15} "
-                  f"{order['created_at'].strftime('%Y-%m-%d %H:%M'):<20} "
-                  f"{order['customer_name'][:18]:<20} "
-                  f"{order['total_amount']:<10.2f} "
-                  f"{order['status']:<15}")
+        """Показывает все заказы постранично"""
+        next_cursor = None
+
+        while True:
+            orders, next_cursor = self.db.get_orders_page(limit=50, cursor=next_cursor)
+
+            print("\n" + "=" * 80)
+            print("ВСЕ ЗАКАЗЫ".center(80))
+            print("=" * 80)
+            print(f"{'Номер':<15} {'Дата':<20} {'Клиент':<20} {'Сумма':<10} {'Статус':<15}")
+            print("-" * 80)
+
+            for order in orders:
+                print(f"{order['order_number']:<15} "
+                      f"{order['created_at'].strftime('%Y-%m-%d %H:%M'):<20} "
+                      f"{order['customer_name'][:18]:<20} "
+                      f"{order['total_amount']:<10.2f} "
+                      f"{order['status']:<15}")
+
+            if not next_cursor:
+                break
+
+            more = input("\nПоказать более старые заказы? (да/нет): ").strip().lower()
+            if more not in ['да', 'д', 'yes', 'y']:
+                break
 
     def _update_order_status(self):
         """Обновляет статус заказа"""
@@ -326,6 +351,9 @@ class RestaurantSystem:
 
             if choice == "0":
                 print("\nСпасибо за использование системы!")
+                if self.metrics_server:
+                    self.metrics_server.stop()
+                self.outbox.close()
                 self.db.close()
                 break
             elif choice == "1":
@@ -347,5 +375,7 @@ class RestaurantSystem:
 
 
 if __name__ == "__main__":
+    # Консоль сама сообщает об успехах; в журнал - предупреждения и ошибки
+    setup_logging(default_level="WARNING")
     system = RestaurantSystem()
     system.run()
@@ -20,4 +20,9 @@ WHERE
     table_schema = 'public'
 ORDER BY
     table_name,
-    ordinal_position;
\ No newline at end of file
+    ordinal_position;
+
+-- Примененные миграции схемы (см. migrations.py):
+SELECT version, description, applied_at
+FROM schema_version
+ORDER BY version;
@@ -0,0 +1,592 @@
+"""
+sqlite_database.py
+Хранилище данных ресторана на SQLite: файл или база в памяти
+
+Не требует сервера и psycopg2, стартует за миллисекунды. Используется
+для тестов, замеров накладных расходов Python без сети и автономных
+киосков. Схема и начальное меню создаются при первом открытии.
+"""
+
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple, Iterator, Union
+
+from app_logging import get_logger
+from storage import (
+    RestaurantDatabase,
+    ORDER_STATUSES,
+    _decode_page_cursor,
+    _encode_page_cursor,
+    _menu_item_from_row,
+    _new_order_number,
+    _order_details_from_row,
+)
+
+logger = get_logger("sqlite_database")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS menu_items (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT,
+    price REAL NOT NULL,
+    category_id INTEGER REFERENCES categories(id),
+    is_available INTEGER DEFAULT 1,
+    unavailability_reason TEXT,
+    calories INTEGER,
+    cooking_time_minutes INTEGER,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS customers (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    phone TEXT UNIQUE,
+    email TEXT,
+    address TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    order_number TEXT UNIQUE NOT NULL,
+    customer_id INTEGER REFERENCES customers(id),
+    total_amount REAL NOT NULL,
+    status TEXT DEFAULT 'pending',
+    payment_method TEXT,
+    delivery_address TEXT,
+    notes TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS order_items (
+    id INTEGER PRIMARY KEY,
+    order_id INTEGER REFERENCES orders(id) ON DELETE CASCADE,
+    menu_item_id INTEGER REFERENCES menu_items(id),
+    quantity INTEGER NOT NULL CHECK (quantity > 0),
+    price_at_order REAL NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_orders_created_at_id ON orders (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id);
+"""
+
+SEED_CATEGORIES = [
+    ('Пицца', 'Итальянская пицца на тонком тесте'),
+    ('Суши и роллы', 'Японская кухня'),
+    ('Напитки', 'Холодные и горячие напитки'),
+    ('Десерты', 'Сладкие угощения'),
+]
+
+SEED_MENU_ITEMS = [
+    ('Маргарита', 'Томатный соус, моцарелла, базилик', 450, 'Пицца', 800, 15),
+    ('Пепперони', 'Томатный соус, пепперони, моцарелла', 550, 'Пицца', 950, 20),
+    ('Филадельфия', 'Лосось, сливочный сыр, огурец', 320, 'Суши и роллы', 420, 10),
+    ('Калифорния', 'Краб-микс, авокадо, огурец, икра', 280, 'Суши и роллы', 380, 10),
+    ('Кола', 'Coca-Cola 0.5л', 120, 'Напитки', 210, 2),
+    ('Апельсиновый сок', 'Свежевыжатый сок 0.3л', 150, 'Напитки', 120, 3),
+    ('Чизкейк', 'Классический Нью-Йорк чизкейк', 200, 'Десерты', 350, 5),
+    ('Тирамису', 'Итальянский десерт', 250, 'Десерты', 280, 5),
+]
+
+MENU_ITEM_COLUMNS = """
+    m.id, m.name, m.description, m.price, m.category_id,
+    m.is_available, m.unavailability_reason, m.calories, m.cooking_time_minutes,
+    c.name as category_name
+"""
+
+
+def _timestamp(value: Any) -> Any:
+    """Даты хранятся строками ISO; вызывающим отдаем datetime, как PostgreSQL"""
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+class SQLiteDatabase(RestaurantDatabase):
+    """Класс для работы с SQLite"""
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        # Одно соединение на процесс: GUI вызывает методы из рабочих потоков,
+        # поэтому доступ к нему сериализуется блокировкой
+        self._lock = threading.RLock()
+        self._menu_version = 0
+        # Идет ли блок transaction(): он держит блокировку, так что флаг
+        # видит только поток-владелец
+        self._in_transaction = False
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode = WAL")
+        self._create_schema()
+        logger.info("Хранилище SQLite открыто (%s)", path)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Объединяет несколько вызовов в одну транзакцию
+
+        Все методы, вызванные в этом потоке внутри блока, не фиксируют
+        изменения сами; соединение на время блока занято этим потоком.
+        Фиксация - при выходе из блока, откат - при исключении.
+        """
+        with self._lock:
+            if self._in_transaction:
+                # Вложенный блок присоединяется к внешней транзакции
+                yield self.conn
+                return
+
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._in_transaction = True
+            try:
+                yield self.conn
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._in_transaction = False
+
+    @contextmanager
+    def _transaction(self, commit: bool = True) -> Iterator[sqlite3.Cursor]:
+        """Выполняет блок в одной транзакции под блокировкой соединения
+
+        Внутри transaction() блок входит в ее транзакцию. Иначе при
+        commit=False изменения откатываются, как незафиксированная
+        транзакция соединения PostgreSQL, возвращенного в пул.
+        """
+        with self._lock:
+            cursor = self.conn.cursor()
+            if self._in_transaction:
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+                return
+
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+                cursor.execute("COMMIT" if commit else "ROLLBACK")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+    def _query(self, query: str, params: Tuple = ()) -> List[Tuple]:
+        with self._lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def _create_schema(self) -> None:
+        """Создает таблицы и начальное меню в пустой базе"""
+        with self._lock:
+            self.conn.executescript(SCHEMA)
+        with self._transaction() as cursor:
+            if cursor.execute("SELECT 1 FROM categories LIMIT 1").fetchone():
+                return
+            cursor.executemany("INSERT INTO categories (name, description) VALUES (?, ?)",
+                               SEED_CATEGORIES)
+            cursor.executemany("""
+                INSERT INTO menu_items
+                (name, description, price, category_id, calories, cooking_time_minutes)
+                SELECT ?, ?, ?, id, ?, ? FROM categories WHERE name = ?
+            """, [(name, description, price, calories, cooking_time, category)
+                  for name, description, price, category, calories, cooking_time
+                  in SEED_MENU_ITEMS])
+
+    def get_menu_version(self) -> Optional[int]:
+        """Версия меню базы в памяти; файл могут менять другие процессы - None"""
+        return self._menu_version if self.path == ":memory:" else None
+
+    def get_all_categories(self) -> List[Any]:
+        """Получает все категории"""
+        from models import Category
+
+        rows = self._query("SELECT id, name, description FROM categories ORDER BY name")
+        return [Category(id=row[0], name=row[1], description=row[2]) for row in rows]
+
+    def get_menu_items(self, category_id: Optional[int] = None,
+                       available_only: bool = False) -> List[Any]:
+        """Получает блюда из меню (по умолчанию ВСЕ блюда)"""
+        conditions = []
+        params: List[Any] = []
+
+        if available_only:
+            conditions.append("m.is_available = 1")
+
+        if category_id:
+            conditions.append("m.category_id = ?")
+            params.append(category_id)
+
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        rows = self._query(f"""
+            SELECT {MENU_ITEM_COLUMNS}
+            FROM menu_items m
+            JOIN categories c ON m.category_id = c.id
+            {where}
+            ORDER BY c.name, m.name
+        """, tuple(params))
+        return [_menu_item_from_row(row) for row in rows]
+
+    def get_menu_grouped(self, available_only: bool = False) -> List[Tuple[Any, List[Any]]]:
+        """Получает меню, сгруппированное по категориям, одним запросом"""
+        from models import Category
+
+        rows = self._query(f"""
+            SELECT c.id, c.name, c.description,
+                   m.id, m.name, m.description, m.price, m.category_id,
+                   m.is_available, m.unavailability_reason, m.calories, m.cooking_time_minutes
+            FROM categories c
+            LEFT JOIN menu_items m ON m.category_id = c.id
+                {"AND m.is_available = 1" if available_only else ""}
+            ORDER BY c.name, m.name
+        """)
+
+        grouped = []
+        for row in rows:
+            if not grouped or grouped[-1][0].id != row[0]:
+                grouped.append((Category(id=row[0], name=row[1], description=row[2]), []))
+            if row[3] is not None:
+                grouped[-1][1].append(_menu_item_from_row(row[3:] + (row[1],)))
+        return grouped
+
+    def get_menu_item_by_id(self, item_id: int) -> Optional[Any]:
+        """Получает блюдо по ID"""
+        rows = self._query(f"""
+            SELECT {MENU_ITEM_COLUMNS}
+            FROM menu_items m
+            JOIN categories c ON m.category_id = c.id
+            WHERE m.id = ?
+        """, (item_id,))
+        return _menu_item_from_row(rows[0]) if rows else None
+
+    def find_or_create_customer(self, name: str, phone: str,
+                                email: str = "", address: str = "",
+                                commit: bool = True) -> Any:
+        """Находит клиента по телефону или создает нового
+
+        При commit=False транзакция не фиксируется - так вызов внутри
+        transaction() сохраняет клиента вместе с заказом.
+        """
+        from models import Customer
+
+        with self._transaction(commit=commit) as cursor:
+            row = self._upsert_customer(cursor, name, phone, email, address)
+        return Customer(id=row[0], name=row[1], phone=row[2], email=row[3], address=row[4])
+
+    def _upsert_customer(self, cursor: sqlite3.Cursor, name: str, phone: str,
+                         email: str, address: str) -> Tuple:
+        cursor.execute("""
+            INSERT INTO customers (name, phone, email, address)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (phone) DO NOTHING
+        """, (name, phone, email, address))
+        return cursor.execute(
+            "SELECT id, name, phone, email, address FROM customers WHERE phone = ?", (phone,)
+        ).fetchone()
+
+    def _insert_order(self, cursor: sqlite3.Cursor, customer_id: int,
+                      lines: List[Tuple[int, int, float]], delivery_address: str,
+                      notes: str, payment_method: str,
+                      order_number: Optional[str] = None) -> Tuple[int, str, float]:
+        """Записывает заказ и позиции (menu_item_id, quantity, price)"""
+        order_number = order_number or _new_order_number()
+        total_amount = sum(quantity * price for _, quantity, price in lines)
+
+        cursor.execute("""
+            INSERT INTO orders
+            (order_number, customer_id, total_amount, delivery_address, notes,
+             payment_method, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (order_number, customer_id, total_amount, delivery_address, notes,
+              payment_method, datetime.now().isoformat(sep=" ")))
+        order_id = cursor.lastrowid
+
+        cursor.executemany("""
+            INSERT INTO order_items (order_id, menu_item_id, quantity, price_at_order)
+            VALUES (?, ?, ?, ?)
+        """, [(order_id, menu_item_id, quantity, price) for menu_item_id, quantity, price in lines])
+        return order_id, order_number, total_amount
+
+    def create_order(self, customer_id: int, items: List[Any],
+                     delivery_address: str = "", notes: str = "",
+                     payment_method: str = "cash") -> Tuple[int, str]:
+        """Создает новый заказ в базе данных"""
+        lines = [(item.menu_item_id, item.quantity, item.price_at_order) for item in items]
+        with self._transaction() as cursor:
+            order_id, order_number, _ = self._insert_order(
+                cursor, customer_id, lines, delivery_address, notes, payment_method)
+
+        logger.info("Заказ создан: %s", order_number, extra={'order_number': order_number})
+        return order_id, order_number
+
+    def place_order(self, name: str, phone: str, items: List[Any],
+                    email: str = "", address: str = "", notes: str = "",
+                    payment_method: str = "cash",
+                    order_number: Optional[str] = None) -> Tuple[int, str, float]:
+        """Оформляет заказ по текущим ценам меню в одной транзакции"""
+        with self._transaction() as cursor:
+            # Повторная отправка того же номера возвращает уже созданный заказ
+            existing = cursor.execute(
+                "SELECT id, order_number, total_amount FROM orders WHERE order_number = ?",
+                (order_number,)
+            ).fetchone()
+            if existing:
+                return existing[0], existing[1], float(existing[2])
+
+            if not items:
+                raise ValueError("Заказ не содержит позиций")
+
+            ids = sorted({item.menu_item_id for item in items})
+            menu = {row[0]: row for row in cursor.execute(
+                f"SELECT id, name, price, is_available FROM menu_items "
+                f"WHERE id IN ({', '.join('?' * len(ids))})", ids
+            ).fetchall()}
+
+            # Все блюда должны существовать и быть доступны
+            unavailable = [menu[item.menu_item_id][1] if item.menu_item_id in menu
+                           else f"#{item.menu_item_id}"
+                           for item in items
+                           if item.menu_item_id not in menu or not menu[item.menu_item_id][3]]
+            if unavailable:
+                message = f"Блюда недоступны для заказа: {', '.join(unavailable)}"
+                logger.warning("Заказ отклонен: %s", message, extra={'order_number': order_number})
+                raise ValueError(message)
+
+            customer = self._upsert_customer(cursor, name, phone, email, address)
+            # Итог считается по текущим ценам меню, а не по ценам клиента
+            lines = [(item.menu_item_id, item.quantity, menu[item.menu_item_id][2])
+                     for item in items]
+            order_id, order_number, total_amount = self._insert_order(
+                cursor, customer[0], lines, address, notes, payment_method, order_number)
+
+        logger.info("Заказ создан: %s", order_number, extra={'order_number': order_number})
+        return order_id, order_number, float(total_amount)
+
+    def place_orders(self, orders: List[Dict[str, Any]]
+                     ) -> List[Union[Tuple[int, str, float], Exception]]:
+        """Оформляет пачку заказов в одной транзакции: одна фиксация на пачку
+
+        Каждый заказ выполняется в своей точке сохранения: отказ по одному
+        заказу не отменяет остальные.
+        """
+        results: List[Union[Tuple[int, str, float], Exception]] = []
+        with self.transaction() as conn:
+            for order in orders:
+                conn.execute("SAVEPOINT batch_order")
+                try:
+                    results.append(self.place_order(**order))
+                except (ValueError, sqlite3.Error) as e:
+                    conn.execute("ROLLBACK TO batch_order")
+                    results.append(e)
+                conn.execute("RELEASE batch_order")
+        return results
+
+    def get_order_by_number(self, order_number: str) -> Optional[Dict[str, Any]]:
+        """Получает детали заказа по номеру одним запросом"""
+        try:
+            orders = self._fetch_order_details("o.order_number = ?", (order_number,))
+            return orders[0] if orders else None
+        except sqlite3.Error as e:
+            logger.error("Ошибка при получении заказа: %s", e)
+            return None
+
+    def get_orders_by_numbers(self, order_numbers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Получает детали нескольких заказов одним запросом"""
+        if not order_numbers:
+            return {}
+
+        try:
+            orders = self._fetch_order_details(
+                f"o.order_number IN ({', '.join('?' * len(order_numbers))})", tuple(order_numbers))
+            return {order['order_number']: order for order in orders}
+        except sqlite3.Error as e:
+            logger.error("Ошибка при получении заказов: %s", e)
+            return {}
+
+    def _fetch_order_details(self, condition: str, params: Tuple) -> List[Dict[str, Any]]:
+        """Читает заказы вместе с позициями, собранными в JSON"""
+        rows = self._query(f"""
+            SELECT o.id, o.order_number, o.total_amount, o.status, o.created_at,
+                   c.name as customer_name, c.phone, c.email,
+                   o.delivery_address, o.notes, o.payment_method,
+                   (SELECT json_group_array(json_object(
+                               'item_id', oi.menu_item_id,
+                               'item_name', m.name,
+                               'quantity', oi.quantity,
+                               'price', oi.price_at_order,
+                               'subtotal', oi.quantity * oi.price_at_order
+                           ))
+                    FROM (SELECT * FROM order_items WHERE order_id = o.id ORDER BY id) oi
+                    JOIN menu_items m ON oi.menu_item_id = m.id) as items
+            FROM orders o
+            JOIN customers c ON o.customer_id = c.id
+            WHERE {condition}
+        """, params)
+
+        return [_order_details_from_row(row[:4] + (_timestamp(row[4]),) + row[5:11]
+                                        + (json.loads(row[11]),))
+                for row in rows]
+
+    def get_orders_page(self, limit: int = 50, cursor: Optional[str] = None,
+                        status: Optional[str] = None,
+                        start_date: Optional[str] = None,
+                        end_date: Optional[str] = None,
+                        customer_id: Optional[int] = None
+                        ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Получает страницу заказов от новых к старым (пагинация по ключу)"""
+        try:
+            conditions = []
+            params: List[Any] = []
+
+            if cursor:
+                created_at, order_id = _decode_page_cursor(cursor)
+                conditions.append("(o.created_at, o.id) < (?, ?)")
+                params.extend([created_at.isoformat(sep=" "), order_id])
+
+            if status:
+                conditions.append("o.status = ?")
+                params.append(status)
+
+            if start_date:
+                conditions.append("o.created_at >= ?")
+                params.append(start_date)
+
+            if end_date:
+                conditions.append("o.created_at <= ?")
+                params.append(end_date)
+
+            if customer_id:
+                conditions.append("o.customer_id = ?")
+                params.append(customer_id)
+
+            where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+            # Одна лишняя строка показывает, есть ли следующая страница
+            params.append(limit + 1)
+
+            rows = self._query(f"""
+                SELECT o.id, o.order_number, o.created_at, o.total_amount, o.status,
+                       c.name as customer_name
+                FROM orders o
+                JOIN customers c ON o.customer_id = c.id
+                {where}
+                ORDER BY o.created_at DESC, o.id DESC
+                LIMIT ?
+            """, tuple(params))
+
+            orders = [{
+                'order_id': row[0],
+                'order_number': row[1],
+                'created_at': _timestamp(row[2]),
+                'total_amount': float(row[3]),
+                'status': row[4],
+                'customer_name': row[5]
+            } for row in rows[:limit]]
+
+            next_cursor = None
+            if len(rows) > limit:
+                last = orders[-1]
+                next_cursor = _encode_page_cursor(last['created_at'], last['order_id'])
+
+            return orders, next_cursor
+        except ValueError as e:
+            logger.error("Ошибка при получении заказов: %s", e)
+            return [], None
+
+    def update_order_status(self, order_id: int, status: str) -> bool:
+        """Обновляет статус заказа"""
+        if status not in ORDER_STATUSES:
+            logger.warning("Неверный статус. Допустимые: %s", ', '.join(ORDER_STATUSES))
+            return False
+
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("UPDATE orders SET status = ? WHERE id = ?", (status, order_id))
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error("Ошибка при обновлении статуса: %s", e)
+            return False
+
+    def add_menu_item(self, name: str, description: str, price: float,
+                      category_id: int, calories: Optional[int] = None,
+                      cooking_time: Optional[int] = None) -> bool:
+        """Добавляет новое блюдо в меню"""
+        try:
+            with self._transaction() as cursor:
+                cursor.execute("""
+                    INSERT INTO menu_items
+                    (name, description, price, category_id, calories, cooking_time_minutes)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (name, description, price, category_id, calories, cooking_time))
+            self._menu_version += 1
+            return True
+        except sqlite3.Error as e:
+            logger.error("Ошибка при добавлении блюда: %s", e)
+            return False
+
+    def update_menu_item_availability(self, item_id: int, is_available: bool,
+                                      unavailability_reason: Optional[str] = None) -> bool:
+        """Обновляет доступность блюда с указанием причины"""
+        with self._transaction() as cursor:
+            # У доступного блюда причина очищается
+            cursor.execute("""
+                UPDATE menu_items SET is_available = ?, unavailability_reason = ?
+                WHERE id = ?
+            """, (int(is_available), None if is_available else unavailability_reason, item_id))
+            updated = cursor.rowcount > 0
+        self._menu_version += 1
+        return updated
+
+    def get_order_statistics(self, start_date: Optional[str] = None,
+                             end_date: Optional[str] = None) -> Dict[str, Any]:
+        """Получает статистику по заказам"""
+        period = ""
+        params: List[Any] = []
+
+        if start_date:
+            period += " AND o.created_at >= ?"
+            params.append(start_date)
+
+        if end_date:
+            period += " AND o.created_at <= ?"
+            params.append(end_date)
+
+        row = self._query("""
+            SELECT COUNT(*), SUM(o.total_amount), AVG(o.total_amount),
+                   COUNT(DISTINCT o.customer_id)
+            FROM orders o
+            WHERE o.status != 'cancelled'
+        """ + period, tuple(params))[0]
+
+        popular_items = self._query("""
+            SELECT m.name, SUM(oi.quantity) as total_quantity
+            FROM order_items oi
+            JOIN menu_items m ON oi.menu_item_id = m.id
+            JOIN orders o ON oi.order_id = o.id
+            WHERE o.status != 'cancelled'
+        """ + period + """
+            GROUP BY m.name
+            ORDER BY total_quantity DESC
+            LIMIT 10
+        """, tuple(params))
+
+        return {
+            'total_orders': row[0] or 0,
+            'total_revenue': float(row[1] or 0),
+            'avg_order_value': float(row[2] or 0),
+            'unique_customers': row[3] or 0,
+            'popular_items': [(item[0], item[1]) for item in popular_items]
+        }
+
+    def close(self) -> None:
+        """Закрывает соединение с базой данных"""
+        with self._lock:
+            self.conn.close()
+        logger.info("Хранилище SQLite закрыто")
@@ -0,0 +1,275 @@
+"""
+storage.py
+Общий интерфейс хранилища данных ресторана и выбор реализации
+
+Реализации:
+    postgres - PostgreSQLDatabase (database.py), по умолчанию
+    sqlite   - SQLiteDatabase (sqlite_database.py): файл или память,
+               без сервера; для тестов, замеров и автономных киосков
+
+Реализация выбирается переменной окружения DB_BACKEND, путь к файлу
+SQLite - переменной SQLITE_PATH (по умолчанию база в памяти).
+"""
+
+import base64
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple, Callable, Union
+
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+ORDER_STATUSES = ['pending', 'confirmed', 'preparing', 'delivering', 'delivered', 'cancelled']
+
+
+class DatabaseUnavailableError(Exception):
+    """Хранилище недоступно: нет соединения с сервером или свободного соединения"""
+
+
+def _encode_page_cursor(created_at: datetime, order_id: int) -> str:
+    """Кодирует позицию (created_at, id) в непрозрачный курсор страницы"""
+    raw = f"{created_at.isoformat()}|{order_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_page_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Раскодирует курсор страницы обратно в (created_at, id)"""
+    try:
+        created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Некорректный курсор страницы: {cursor}") from e
+
+
+def _new_order_number() -> str:
+    """Генерирует номер заказа вида ORD-ГГГГММДД-XXXXXX"""
+    return f"ORD-{datetime.now().strftime('%Y%m%d')}-{uuid.uuid4().hex[:6].upper()}"
+
+
+class OrderNumberGenerator:
+    """Номера заказов вида ORD-ГГГГММДД-NNNNNNNN из блоков последовательности
+
+    Процесс резервирует у сервера блок номеров одним запросом и выдает
+    номера из него локально. Номера уникальны между процессами (блоки не
+    пересекаются) и растут внутри процесса; восемь цифр не совпадают со
+    случайными шестисимвольными номерами прежнего формата.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Резервирование блоков по одному: параллельные резервирования
+        # затирали бы блоки друг друга, и номера могли бы пойти назад
+        self._reserve_lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    @staticmethod
+    def format(number: int) -> str:
+        return f"ORD-{datetime.now().strftime('%Y%m%d')}-{number:08d}"
+
+    def add_block(self, start: int, size: int) -> None:
+        """Принимает зарезервированный блок [start, start + size)"""
+        with self._lock:
+            self._next, self._end = start, start + size
+
+    def take(self) -> Optional[str]:
+        """Выдает номер из текущего блока или None, если блок исчерпан"""
+        with self._lock:
+            if self._next >= self._end:
+                return None
+            number = self._next
+            self._next += 1
+        return self.format(number)
+
+    def next(self, reserve: Callable[[], Tuple[int, int]]) -> str:
+        """Выдает номер, при необходимости резервируя блок через reserve() -> (start, size)"""
+        number = self.take()
+        while number is None:
+            with self._reserve_lock:
+                # Пока ждали блокировку, блок мог зарезервировать другой поток
+                number = self.take()
+                if number is None:
+                    self.add_block(*reserve())
+                    number = self.take()
+        return number
+
+
+def _menu_item_from_row(row: Tuple) -> Any:
+    """Собирает MenuItem из строки (поля menu_items, затем название категории)"""
+    from models import MenuItem
+
+    return MenuItem(
+        id=row[0], name=row[1], description=row[2], price=float(row[3]),
+        category_id=row[4], category_name=row[9], is_available=bool(row[5]),
+        unavailability_reason=row[6], calories=row[7], cooking_time=row[8]
+    )
+
+
+def _order_details_from_row(row: Tuple) -> Dict[str, Any]:
+    """Собирает словарь деталей заказа из строки запроса с позициями в JSON"""
+    items = [{
+        'item_id': item['item_id'],
+        'item_name': item['item_name'],
+        'quantity': item['quantity'],
+        'price': float(item['price']),
+        'subtotal': float(item['subtotal'])
+    } for item in row[11]]
+
+    return {
+        'order_id': row[0],
+        'order_number': row[1],
+        'total_amount': float(row[2]),
+        'status': row[3],
+        'created_at': row[4],
+        'customer_name': row[5],
+        'customer_phone': row[6],
+        'customer_email': row[7],
+        'delivery_address': row[8],
+        'notes': row[9],
+        'payment_method': row[10],
+        'items': items
+    }
+
+
+class RestaurantDatabase(ABC):
+    """Интерфейс хранилища, с которым работают консоль и GUI"""
+
+    @abstractmethod
+    def get_all_categories(self) -> List[Any]:
+        """Получает все категории"""
+
+    @abstractmethod
+    def get_menu_items(self, category_id: Optional[int] = None,
+                       available_only: bool = False) -> List[Any]:
+        """Получает блюда из меню (по умолчанию ВСЕ блюда)"""
+
+    @abstractmethod
+    def get_menu_grouped(self, available_only: bool = False) -> List[Tuple[Any, List[Any]]]:
+        """Получает меню, сгруппированное по категориям"""
+
+    @abstractmethod
+    def get_menu_item_by_id(self, item_id: int) -> Optional[Any]:
+        """Получает блюдо по ID"""
+
+    def get_menu_version(self) -> Optional[int]:
+        """Возвращает версию меню; она меняется при каждом изменении меню
+
+        None - хранилище не отслеживает изменения меню, его нужно
+        перечитывать периодически.
+        """
+        return None
+
+    @abstractmethod
+    def find_or_create_customer(self, name: str, phone: str,
+                                email: str = "", address: str = "",
+                                commit: bool = True) -> Any:
+        """Находит клиента по телефону или создает нового"""
+
+    @abstractmethod
+    def create_order(self, customer_id: int, items: List[Any],
+                     delivery_address: str = "", notes: str = "",
+                     payment_method: str = "cash") -> Tuple[int, str]:
+        """Создает заказ и возвращает (order_id, order_number)"""
+
+    def next_order_number(self) -> str:
+        """Выдает новый номер заказа"""
+        return _new_order_number()
+
+    @abstractmethod
+    def place_order(self, name: str, phone: str, items: List[Any],
+                    email: str = "", address: str = "", notes: str = "",
+                    payment_method: str = "cash",
+                    order_number: Optional[str] = None) -> Tuple[int, str, float]:
+        """Оформляет заказ по текущим ценам меню
+
+        Возвращает (order_id, order_number, total_amount); пустой заказ или
+        недоступные блюда - ValueError, недоступность хранилища -
+        DatabaseUnavailableError. Повторный вызов с тем же order_number
+        возвращает уже созданный заказ, не создавая второй.
+        """
+
+    def place_orders(self, orders: List[Dict[str, Any]]
+                     ) -> List[Union[Tuple[int, str, float], Exception]]:
+        """Оформляет пачку заказов; orders - именованные аргументы place_order
+
+        Возвращает по элементу на заказ: (order_id, order_number, total_amount)
+        или исключение этого заказа (отказ - ValueError). Недоступность
+        хранилища - DatabaseUnavailableError для всей пачки; повтор пачки
+        безопасен, если у заказов заданы order_number. Реализация по
+        умолчанию оформляет заказы по одному.
+        """
+        results: List[Union[Tuple[int, str, float], Exception]] = []
+        for order in orders:
+            try:
+                results.append(self.place_order(**order))
+            except DatabaseUnavailableError:
+                raise
+            except Exception as e:
+                results.append(e)
+        return results
+
+    @abstractmethod
+    def get_order_by_number(self, order_number: str) -> Optional[Dict[str, Any]]:
+        """Получает детали заказа по номеру"""
+
+    @abstractmethod
+    def get_orders_by_numbers(self, order_numbers: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Получает детали нескольких заказов: номер заказа -> детали"""
+
+    def get_all_orders(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Получает последние заказы"""
+        orders, _ = self.get_orders_page(limit=limit)
+        return orders
+
+    @abstractmethod
+    def get_orders_page(self, limit: int = 50, cursor: Optional[str] = None,
+                        status: Optional[str] = None,
+                        start_date: Optional[str] = None,
+                        end_date: Optional[str] = None,
+                        customer_id: Optional[int] = None
+                        ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Получает страницу заказов от новых к старым: (заказы, следующий курсор)"""
+
+    @abstractmethod
+    def update_order_status(self, order_id: int, status: str) -> bool:
+        """Обновляет статус заказа"""
+
+    @abstractmethod
+    def add_menu_item(self, name: str, description: str, price: float,
+                      category_id: int, calories: Optional[int] = None,
+                      cooking_time: Optional[int] = None) -> bool:
+        """Добавляет новое блюдо в меню"""
+
+    @abstractmethod
+    def update_menu_item_availability(self, item_id: int, is_available: bool,
+                                      unavailability_reason: Optional[str] = None) -> bool:
+        """Обновляет доступность блюда с указанием причины"""
+
+    @abstractmethod
+    def get_order_statistics(self, start_date: Optional[str] = None,
+                             end_date: Optional[str] = None) -> Dict[str, Any]:
+        """Получает статистику по заказам"""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Закрывает соединения с хранилищем"""
+
+
+def create_database() -> RestaurantDatabase:
+    """Создает хранилище, выбранное переменной окружения DB_BACKEND"""
+    backend = os.getenv("DB_BACKEND", "postgres").lower()
+
+    # Модули реализаций импортируются лениво: SQLite не требует psycopg2
+    if backend == "postgres":
+        from database import PostgreSQLDatabase
+        return PostgreSQLDatabase()
+    if backend == "sqlite":
+        from sqlite_database import SQLiteDatabase
+        return SQLiteDatabase(os.getenv("SQLITE_PATH", ":memory:"))
+
+    raise ValueError(f"Неизвестное хранилище DB_BACKEND={backend}: ожидается postgres или sqlite")
@@ -0,0 +1,168 @@
+"""
+write_behind.py
+Групповая фиксация заказов: одна транзакция на пачку заказов
+
+Вызывающие ставят заказ в очередь и получают Future. Один поток-писатель
+забирает накопившиеся заказы (не больше max_batch, ожидая не дольше
+max_delay_ms после первого) и передает их серверной функции place_orders
+одним запросом в одной транзакции: сброс WAL при фиксации и обмен с
+сервером оплачиваются один раз на пачку. Каждый заказ выполняется в
+своем блоке исключений: отказ по одному заказу (недоступные блюда) не
+отменяет остальные.
+
+Ожидание результата ограничено result_timeout секундами: если писатель
+остановился или завис, вызывающий получает DatabaseUnavailableError, а не
+ждет вечно. Повтор заказа с тем же номером идемпотентен.
+"""
+
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import List, Optional, Any, Tuple
+
+import psycopg2
+
+from storage import DatabaseUnavailableError
+
+# SQLSTATE исключения, поднятого RAISE EXCEPTION в place_order
+RAISE_EXCEPTION_SQLSTATE = "P0001"
+
+
+class WriteBehindQueue:
+    """Очередь заказов с групповой фиксацией для PostgreSQLDatabase"""
+
+    def __init__(self, db: Any, max_batch: int = 64, max_delay_ms: float = 1.0,
+                 result_timeout: float = 30.0):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.result_timeout = result_timeout
+        self._queue: "queue.Queue[Tuple[Future, dict]]" = queue.Queue()
+        self._stop = threading.Event()
+        # Постановка в очередь и остановка не пересекаются: заказ, принятый
+        # submit(), писатель либо запишет, либо close() завершит его ошибкой
+        self._submit_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="order-writer", daemon=True)
+
+        # Метрики
+        self.batches = 0
+        self.orders = 0
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def submit(self, name: str, phone: str, items: List[Any],
+               email: str = "", address: str = "", notes: str = "",
+               payment_method: str = "cash",
+               order_number: Optional[str] = None) -> Future:
+        """Ставит заказ в очередь; Future вернет (order_id, order_number, total_amount)"""
+        order = {
+            'name': name,
+            'phone': phone,
+            'email': email,
+            'address': address,
+            'notes': notes,
+            'payment_method': payment_method,
+            'order_number': order_number or self.db.next_order_number(),
+            'items': [{'menu_item_id': item.menu_item_id, 'quantity': item.quantity}
+                      for item in items]
+        }
+
+        future: Future = Future()
+        with self._submit_lock:
+            if self._stop.is_set():
+                raise RuntimeError("Очередь заказов остановлена")
+            self._queue.put((future, order))
+        return future
+
+    def place_order(self, *args, **kwargs) -> Tuple[int, str, float]:
+        """Оформляет заказ через очередь и ждет фиксации его пачки не дольше result_timeout"""
+        future = self.submit(*args, **kwargs)
+        try:
+            return future.result(timeout=self.result_timeout)
+        except FutureTimeoutError as e:
+            raise DatabaseUnavailableError(
+                f"Заказ не зафиксирован за {self.result_timeout:g} с"
+            ) from e
+
+    def _next_batch(self) -> List[Tuple[Future, dict]]:
+        """Ждет первый заказ, затем добирает пачку до max_batch или max_delay"""
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = [entry for entry in self._next_batch()
+                     if entry[0].set_running_or_notify_cancel()]
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    # Ошибка раздачи результатов не должна останавливать писателя
+                    self._fail([entry for entry in batch if not entry[0].done()], e)
+
+    def _write(self, batch: List[Tuple[Future, dict]]) -> None:
+        """Записывает пачку одним запросом; результаты раздаются после фиксации"""
+        try:
+            with self.db._connection() as conn, conn.cursor() as cursor:
+                self.db.statements.execute(cursor, "place_orders",
+                                           "SELECT * FROM place_orders(%s::jsonb)",
+                                           (json.dumps([order for _, order in batch]),))
+                rows = cursor.fetchall()
+                conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            self._fail(batch, DatabaseUnavailableError(str(e)))
+            return
+        except Exception as e:
+            # Транзакция не зафиксирована: ни один заказ пачки не сохранен
+            self._fail(batch, e)
+            return
+
+        self.batches += 1
+        self.orders += len(batch)
+        for index, order_id, order_number, total_amount, error_code, error in rows:
+            future = batch[index][0]
+            if error_code == RAISE_EXCEPTION_SQLSTATE:
+                future.set_exception(ValueError(error))
+            elif error_code is not None:
+                future.set_exception(psycopg2.DatabaseError(f"{error_code}: {error}"))
+            else:
+                future.set_result((order_id, order_number, float(total_amount)))
+
+    @staticmethod
+    def _fail(batch: List[Tuple[Future, dict]], error: Exception) -> None:
+        for future, _ in batch:
+            future.set_exception(error)
+
+    def close(self) -> None:
+        """Дописывает поставленные заказы и останавливает писателя"""
+        with self._submit_lock:
+            self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+        # Заказы, которые писатель уже не запишет (он не был запущен или упал)
+        leftover = []
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry[0].set_running_or_notify_cancel():
+                leftover.append(entry)
+        self._fail(leftover, DatabaseUnavailableError("Очередь заказов остановлена"))